@@ -0,0 +1,168 @@
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Formats that are compressed already, stored as they are
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.pdf', '.zip', '.gz', '.bz2', '.xz', '.nc4'}
+
+# Formats that may or may not be compressed internally (NetCDF4 with deflate filters), decided by compressing a
+# sample of the file
+SAMPLED_EXTENSIONS = {'.nc'}
+SAMPLE_SIZE = 1024**2
+MIN_SAMPLE_RATIO = 0.9
+
+# Compressed entries are kept in memory up to this size, larger ones are spooled to a temporary file
+SPOOL_SIZE = 16 * 1024**2
+
+CHUNK_SIZE = 1024**2
+
+
+def collect_files(directory, exclude_preproc=True):
+    """List the files in a directory as (path, name in archive) tuples, without the preprocessed data."""
+    files = []
+    for root, dirs, filenames in os.walk(directory):
+        if not exclude_preproc or 'preproc' not in root:
+            for file in filenames:
+                path = os.path.join(root, file)
+                files.append((path, os.path.relpath(path, directory)))
+    return files
+
+
+def _should_store(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return True
+    if extension in SAMPLED_EXTENSIONS:
+        with open(path, 'rb') as fp:
+            sample = fp.read(SAMPLE_SIZE)
+        return len(sample) > 0 and len(zlib.compress(sample, 1)) > MIN_SAMPLE_RATIO * len(sample)
+    return False
+
+
+def _deflate(path):
+    # raw deflate stream, as stored in zip files
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    crc = 0
+    size = 0
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    spool.seek(0)
+    return crc, size, spool
+
+
+def _prepare(path):
+    """Compress a file in a worker thread, returns None if it is to be stored."""
+    if _should_store(path):
+        return None
+    return _deflate(path)
+
+
+class ArchiveWriter():
+    """Writes files into a zip archive, compressing them in parallel.
+
+    Files are compressed by a pool of threads (zlib releases the GIL) while the calling thread writes the
+    finished entries to the archive in order. Formats that are compressed already are streamed into the
+    archive without compression. `progress` is called with the number of bytes of the files written so far,
+    the total number of bytes and the elapsed time in seconds.
+    """
+
+    def __init__(self, archive_file, threads=None, progress=None):
+        self.archive_file = archive_file
+        self.threads = threads or min(os.cpu_count() or 1, 4)
+        self.progress = progress
+
+    def write(self, files):
+        """Write the files, a list of (path, name in archive) tuples."""
+        total = sum(os.path.getsize(path) for path, arcname in files)
+        done = 0
+        start = time.time()
+
+        with zipfile.ZipFile(self.archive_file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                # at most a few compressed entries are waiting to be written at any time
+                window = self.threads * 2
+                futures = [pool.submit(_prepare, path) for path, arcname in files[:window]]
+                for number, (path, arcname) in enumerate(files):
+                    if number + window < len(files):
+                        futures.append(pool.submit(_prepare, files[number + window][0]))
+                    prepared = futures[number].result()
+                    futures[number] = None
+
+                    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                    if prepared is None:
+                        self._store(archive, zinfo, path)
+                    else:
+                        self._write_deflated(archive, zinfo, *prepared)
+
+                    done += zinfo.file_size
+                    if self.progress:
+                        self.progress(done, total, time.time() - start)
+
+        LOGGER.info("archived %d files, %d bytes in %.1f s", len(files), total, time.time() - start)
+        return self.archive_file
+
+    # The entries are written the same way as ZipFile.writestr does, but with data that is compressed
+    # (or checksummed) already, which the zipfile module does not support.
+    @staticmethod
+    def _begin_entry(archive, zinfo):
+        zinfo.header_offset = archive.fp.tell()
+        archive.fp.write(zinfo.FileHeader())
+
+    @staticmethod
+    def _end_entry(archive, zinfo):
+        archive.filelist.append(zinfo)
+        archive.NameToInfo[zinfo.filename] = zinfo
+        archive.start_dir = archive.fp.tell()
+        archive._didModify = True
+
+    def _write_deflated(self, archive, zinfo, crc, size, spool):
+        with spool:
+            spool.seek(0, os.SEEK_END)
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.CRC = crc
+            zinfo.file_size = size
+            zinfo.compress_size = spool.tell()
+            spool.seek(0)
+
+            self._begin_entry(archive, zinfo)
+            shutil.copyfileobj(spool, archive.fp, CHUNK_SIZE)
+            self._end_entry(archive, zinfo)
+
+    def _store(self, archive, zinfo, path):
+        # streamed, the checksum is written into the header afterwards
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zinfo.CRC = 0
+        zinfo.compress_size = zinfo.file_size
+
+        self._begin_entry(archive, zinfo)
+        crc = 0
+        size = 0
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                archive.fp.write(chunk)
+        if size != zinfo.file_size:
+            raise IOError("{} changed while it was archived".format(path))
+
+        zinfo.CRC = crc
+        end = archive.fp.tell()
+        # the CRC-32 field of the local file header
+        archive.fp.seek(zinfo.header_offset + 14)
+        archive.fp.write(struct.pack('<L', crc))
+        archive.fp.seek(end)
+        self._end_entry(archive, zinfo)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+
+import logging
+
+LOGGER = logging.getLogger("PYWPS")
+
+
+def link_or_copy(src, dst):
+    # cached files are never modified, so they can be shared with hard links
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _tree_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size
+
+
+class DirectoryCache():
+    """Size bounded cache of directories on disk, shared between processes.
+
+    Every entry is a directory named after its key. Entries are written to a temporary
+    directory first and renamed into place, so concurrent writers of the same key never
+    expose partial entries. Using an entry touches it, when the cache grows beyond
+    `max_size` bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=10 * 1024**3):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def entry(self, key):
+        """Path of the entry of `key`, which may not exist."""
+        return os.path.join(self.directory, key)
+
+    def touch(self, key):
+        try:
+            os.utime(self.entry(key))
+        except OSError:
+            pass
+
+    def populate(self, key, fill):
+        """Create the entry of `key` by calling `fill` with a temporary directory, unless it exists."""
+        entry = self.entry(key)
+        if os.path.isdir(entry):
+            return
+
+        temp_entry = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            fill(temp_entry)
+            os.rename(temp_entry, entry)
+            LOGGER.info("stored %s in cache %s", key, self.directory)
+        except OSError:
+            # most likely stored by a concurrent run in the meantime
+            LOGGER.debug("could not store %s", key, exc_info=True)
+            shutil.rmtree(temp_entry, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-'):
+                continue
+            try:
+                size = _tree_size(path)
+                entries.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+            total_size += size
+
+        for last_used, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            LOGGER.info("evicting %s from cache %s", os.path.basename(path), self.directory)
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
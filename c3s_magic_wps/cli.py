@@ -6,6 +6,7 @@
 ###########################################################
 
 import os
+import signal
 import psutil
 import click
 from jinja2 import Environment, PackageLoader
@@ -61,6 +62,9 @@ def run_process_action(action=None):
             if action == 'stop':
                 p.terminate()
                 msg = "pid={}, status=terminated".format(p.pid)
+            elif action == 'reload':
+                p.send_signal(signal.SIGHUP)
+                msg = "pid={}, status=reloading".format(p.pid)
             else:
                 from psutil import _pprint_secs
                 msg = "pid={}, status={}, created={}".format(p.pid, p.status(), _pprint_secs(p.create_time()))
@@ -73,26 +77,72 @@ def run_process_action(action=None):
     click.echo(msg)
 
 
-def _run(application, bind_host=None, daemon=False):
-    from werkzeug.serving import run_simple
-    # call this *after* app is initialized ... needs pywps config.
-    host, port = get_host()
-    bind_host = bind_host or host
+def _add_middleware(application):
+    from c3s_magic_wps.file_server import FileServer
+    from c3s_magic_wps.job_status import JobStatusMiddleware
+    from c3s_magic_wps.lazy_archive import LazyArchiveMiddleware
     # need to serve the wps outputs
     static_files = {
         '/static': os.path.join(os.path.dirname(__file__), 'static'),
         '/outputs': configuration.get_config_value('server', 'outputpath')
     }
+    # archives that were not downloaded yet are not found by the file server
+    application = LazyArchiveMiddleware(application, static_files['/outputs'])
+    application = JobStatusMiddleware(application)
+    return FileServer(application, static_files)
+
+
+def _bind_worker_pool():
+    from c3s_magic_wps import worker_pool
+    # the pool of ESMValTool workers, if it is started, stops with the service
+    worker_pool.bind_to_service()
+
+
+def _load_data_finder():
+    from c3s_magic_wps.processes.utils import DataFinder
+    # in the main thread, signal handlers for the background refresh can only be installed from there
+    try:
+        DataFinder.get_instance()
+    except Exception as err:
+        # the processes using the model data report the error on their first request
+        click.echo("could not load the model data: {}".format(err), err=True)
+
+
+def _run(application, bind_host=None, daemon=False):
+    from werkzeug.serving import run_simple
+    from c3s_magic_wps.job_status import get_job_table
+    # call this *after* app is initialized ... needs pywps config.
+    host, port = get_host()
+    bind_host = bind_host or host
+    # receive the status of jobs from the start, the prefork server starts a job table in every worker
+    get_job_table()
+    _load_data_finder()
+    _bind_worker_pool()
     run_simple(
         hostname=bind_host,
         port=port,
-        application=application,
+        application=_add_middleware(application),
         use_debugger=False,
         use_reloader=False,
         threaded=True,
         # processes=2,
-        use_evalex=not daemon,
-        static_files=static_files)
+        use_evalex=not daemon)
+
+
+def _run_prefork(application, create_app, bind_host=None, workers=None, threads=4):
+    try:
+        from c3s_magic_wps.server import PreforkServer, preload
+    except ImportError:
+        raise click.ClickException("the prefork server needs gunicorn, install it with: pip install gunicorn")
+    host, port = get_host()
+    bind_host = bind_host or host
+    _load_data_finder()
+    _bind_worker_pool()
+    PreforkServer(lambda: _add_middleware(preload(create_app())),
+                  bind='{}:{}'.format(bind_host, port),
+                  workers=workers,
+                  threads=threads,
+                  application=_add_middleware(preload(application))).run()
 
 
 @click.group(context_settings=CONTEXT_SETTINGS)
@@ -100,8 +150,8 @@ def _run(application, bind_host=None, daemon=False):
 def cli():
     """Command line to start/stop a PyWPS service.
 
-    Do not use this service in a production environment.
-    It's intended to be running in a test environment only!
+    Do not use the default (simple) server in a production environment.
+    It's intended to be running in a test environment only, use --server=prefork instead.
     For more documentation, visit http://pywps.org/doc
     """
     pass
@@ -119,6 +169,27 @@ def stop():
     run_process_action(action='stop')
 
 
+@cli.command()
+def reload():
+    """Reload the configuration of a PyWPS service started with --server=prefork"""
+    run_process_action(action='reload')
+
+
+@cli.command()
+@click.argument('database', type=click.Path(exists=True, dir_okay=False))
+@click.option('--process', '-p', metavar='IDENTIFIER', help='only show the stages of this process.')
+def timings(database, process):
+    """Show the mean time, I/O and memory of the stages of the processes in a timing DATABASE"""
+    from c3s_magic_wps.timing import TimingStore
+    click.echo('{:<24} {:<28} {:>5} {:>10} {:>10} {:>10} {:>10}'.format(
+        'process', 'stage', 'jobs', 'seconds', 'read MB', 'written MB', 'peak MB'))
+    for row in TimingStore(database).summary(process):
+        megabytes = ['{:.1f}'.format(row[name] / 1024**2) if row[name] is not None else '-'
+                     for name in ('bytes_read', 'bytes_written', 'peak_rss')]
+        click.echo('{:<24} {:<28} {:>5} {:>10.1f} {:>10} {:>10} {:>10}'.format(
+            row['identifier'], row['stage'], row['jobs'], row['duration'], *megabytes))
+
+
 @cli.command()
 @click.option('--config', '-c', metavar='PATH', help='path to pywps configuration file.')
 @click.option('--bind-host', '-b', metavar='IP-ADDRESS', default='127.0.0.1', help='IP address used to bind service.')
@@ -132,10 +203,17 @@ def stop():
 @click.option('--log-file', metavar='PATH', default='pywps.log', help='log file in PyWPS configuration.')
 @click.option('--database', default='sqlite:///pywps-processes.sqlite', help='database in PyWPS configuration')
 @click.option('--rootpath', default='/tmp', help='Root path for computation')
+@click.option('--server', type=click.Choice(['simple', 'prefork']), default='simple',
+              help='simple: werkzeug development server, prefork: multi-process production server (needs gunicorn).')
+@click.option('--workers', metavar='INT', type=int, help='worker processes of the prefork server, by default the CPUs.')
+@click.option('--threads', metavar='INT', type=int, default=4, help='threads per worker of the prefork server.')
 def start(config, bind_host, daemon, hostname, port, maxsingleinputsize, maxprocesses, parallelprocesses, log_level,
-          log_file, database, rootpath):
+          log_file, database, rootpath, server, workers, threads):
     """Start PyWPS service.
     This service is by default available at http://localhost:5000/wps
+
+    With --server=prefork the processes are loaded before the worker processes are forked. Send a HUP signal
+    to the main process (c3s_magic_wps reload) to reload the configuration and replace the workers gracefully.
     """
     cfgfiles = []
 
@@ -159,6 +237,14 @@ def start(config, bind_host, daemon, hostname, port, maxsingleinputsize, maxproc
     if config:
         cfgfiles.append(config)
     app = wsgi.create_app(cfgfiles)
+
+    def run_server(daemon=False):
+        if server == 'prefork':
+            _run_prefork(app, lambda: wsgi.create_app(cfgfiles), bind_host=bind_host, workers=workers,
+                         threads=threads)
+        else:
+            _run(app, bind_host=bind_host, daemon=daemon)
+
     # let's start the service ...
     # See:
     # * https://github.com/geopython/pywps-flask/blob/master/demo.py
@@ -177,12 +263,12 @@ def start(config, bind_host, daemon, hostname, port, maxsingleinputsize, maxproc
 
         if pid == 0:
             os.setsid()
-            _run(app, bind_host=bind_host, daemon=True)
+            run_server(daemon=True)
         else:
             os._exit(0)
     else:
         # no daemon
-        _run(app, bind_host=bind_host)
+        run_server()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import calendar
+import mimetypes
+import os
+
+from werkzeug.http import http_date, parse_date, parse_etags, parse_range_header, quote_etag
+from werkzeug.security import safe_join
+
+CHUNK_SIZE = 1024**2
+
+# Formats of the outputs that are not known to the mimetypes module
+CONTENT_TYPES = {
+    '.nc': 'application/x-netcdf',
+    '.nc4': 'application/x-netcdf',
+    '.yml': 'text/plain',
+    '.log': 'text/plain',
+}
+
+
+def _content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def _file_iterator(fp, length):
+    with fp:
+        while length > 0:
+            chunk = fp.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class _FileRange():
+    """A range of an open file, handed to the server with wsgi.file_wrapper if it has one.
+
+    Servers with a file wrapper supporting sendfile (gunicorn) send the file up to the Content-Length of the
+    response without copying it through Python.
+    """
+
+    def __init__(self, fp, length):
+        self.fp = fp
+        self.length = length
+
+    def read(self, size=-1):
+        size = self.length if size < 0 else min(size, self.length)
+        data = self.fp.read(size)
+        self.length -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fp.fileno()
+
+    def tell(self):
+        return self.fp.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.fp.seek(offset, whence)
+
+    def close(self):
+        self.fp.close()
+
+
+class FileServer():
+    """WSGI middleware serving the files in `exports`, a dict of URL prefixes and directories.
+
+    Supports conditional requests (ETag, Last-Modified) and single byte ranges, so interrupted downloads of
+    large outputs can be resumed and parts of files can be fetched. Requests for other paths, and for files that
+    do not exist, are passed to `application`.
+    """
+
+    def __init__(self, application, exports):
+        self.application = application
+        self.exports = sorted(((prefix.rstrip('/') + '/', directory) for prefix, directory in exports.items()),
+                              key=lambda export: len(export[0]), reverse=True)
+
+    def _find(self, path):
+        for prefix, directory in self.exports:
+            if path.startswith(prefix):
+                filename = safe_join(directory, path[len(prefix):])
+                if filename and os.path.isfile(filename):
+                    return filename
+        return None
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        filename = self._find(environ.get('PATH_INFO', '')) if method in ('GET', 'HEAD') else None
+        if filename is None:
+            return self.application(environ, start_response)
+        return self.serve(filename, environ, start_response)
+
+    def serve(self, filename, environ, start_response):
+        """Respond with the contents of a file."""
+        stat = os.stat(filename)
+        etag = quote_etag('{:x}-{:x}'.format(stat.st_mtime_ns, stat.st_size))
+        last_modified = http_date(stat.st_mtime)
+        headers = [
+            ('Content-Type', _content_type(filename)),
+            ('Accept-Ranges', 'bytes'),
+            ('ETag', etag),
+            ('Last-Modified', last_modified),
+        ]
+
+        if not self._modified(environ, etag, int(stat.st_mtime)):
+            start_response('304 Not Modified', headers)
+            return []
+
+        start, end = 0, stat.st_size
+        status = '200 OK'
+        requested = parse_range_header(environ.get('HTTP_RANGE'))
+        # multiple ranges are answered with the whole file
+        if requested is not None and len(requested.ranges) == 1 and self._if_range(environ, etag, last_modified):
+            byte_range = requested.range_for_length(stat.st_size)
+            if byte_range is None:
+                headers.append(('Content-Range', 'bytes */{}'.format(stat.st_size)))
+                start_response('416 Range Not Satisfiable', headers)
+                return []
+            start, end = byte_range
+            status = '206 Partial Content'
+            headers.append(('Content-Range', 'bytes {}-{}/{}'.format(start, end - 1, stat.st_size)))
+
+        headers.append(('Content-Length', str(end - start)))
+        start_response(status, headers)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return []
+
+        fp = open(filename, 'rb')
+        fp.seek(start)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        # gunicorn before version 21 sends files from the start whatever their position
+        if file_wrapper is not None and start == 0:
+            return file_wrapper(_FileRange(fp, end - start), CHUNK_SIZE)
+        return _file_iterator(fp, end - start)
+
+    @staticmethod
+    def _modified(environ, etag, mtime):
+        if 'HTTP_IF_NONE_MATCH' in environ:
+            etags = parse_etags(environ['HTTP_IF_NONE_MATCH'])
+            return not (etags.star_tag or etags.contains_weak(etag.strip('"')))
+        since = parse_date(environ.get('HTTP_IF_MODIFIED_SINCE'))
+        return since is None or mtime > calendar.timegm(since.utctimetuple())
+
+    @staticmethod
+    def _if_range(environ, etag, last_modified):
+        # a range of a file that changed since the client got its first part is answered with the whole file
+        if_range = environ.get('HTTP_IF_RANGE')
+        return if_range is None or if_range in (etag, last_modified)
@@ -0,0 +1,113 @@
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+
+import logging
+
+from pywps import configuration
+
+LOGGER = logging.getLogger("PYWPS")
+
+
+def execution_mode():
+    """How ESMValTool is run, `inprocess` (default), `subprocess` or `pool`, from the [esmvaltool] section."""
+    mode = configuration.get_config_value('esmvaltool', 'execution') or 'inprocess'
+    if mode not in ('inprocess', 'subprocess', 'pool'):
+        raise ValueError("unknown esmvaltool execution mode `{}`".format(mode))
+    return mode
+
+
+def limits_from_config():
+    """Resource limits of a subprocess run from the [esmvaltool] section, unset limits are None."""
+    cpu_time = configuration.get_config_value('esmvaltool', 'cpu_time_limit')
+    memory = configuration.get_config_value('esmvaltool', 'memory_limit')
+    wall_time = configuration.get_config_value('esmvaltool', 'wall_time_limit')
+    return {
+        'cpu_time': int(cpu_time) if cpu_time else None,
+        'memory': int(configuration.get_size_mb(memory) * 1024**2) if memory else None,
+        'wall_time': float(wall_time) if wall_time else None,
+    }
+
+
+def run_in_subprocess(recipe_file, cfg, preproc=None, cpu_time=None, memory=None, wall_time=None):
+    """Run a recipe with runner.execute_recipe in a new Python process, returns (success, exception).
+
+    The CPU time (seconds) and memory (bytes of address space) limits apply to every process of the run,
+    including the diagnostic scripts started by ESMValTool. When the run takes longer than `wall_time`
+    seconds all its processes are killed.
+    """
+    job_dir = tempfile.mkdtemp(prefix='esmvaltool-job-')
+    job_file = os.path.join(job_dir, 'job.json')
+    result_file = os.path.join(job_dir, 'result.json')
+    with open(job_file, 'w') as fp:
+        json.dump({
+            'recipe_file': recipe_file,
+            'cfg': cfg,
+            'preproc': [preproc.directory, preproc.max_size] if preproc else None,
+            'cpu_time': cpu_time,
+            'memory': memory,
+            'result_file': result_file,
+        }, fp)
+
+    try:
+        LOGGER.info("run esmvaltool in a subprocess ...")
+        # a session of its own, so the diagnostic scripts can be killed together with it
+        process = subprocess.Popen([sys.executable, '-m', 'c3s_magic_wps.isolation', job_file],
+                                   start_new_session=True)
+        try:
+            process.wait(timeout=wall_time)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            return False, "esmvaltool exceeded the wall time limit of {} seconds".format(wall_time)
+
+        if process.returncode == -signal.SIGXCPU or (process.returncode == -signal.SIGKILL and cpu_time):
+            return False, "esmvaltool exceeded the CPU time limit of {} seconds".format(cpu_time)
+
+        try:
+            with open(result_file) as fp:
+                result = json.load(fp)
+        except (OSError, ValueError):
+            return False, "esmvaltool subprocess exited with code {}".format(process.returncode)
+        return result['success'], result['exception']
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.wait()
+
+
+def _set_limits(cpu_time=None, memory=None):
+    if cpu_time:
+        # SIGXCPU at the soft limit, SIGKILL shortly after if it is ignored
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 5))
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def main(job_file):
+    from .runner import execute_recipe
+    from .preproc_cache import PreprocCache
+
+    with open(job_file) as fp:
+        job = json.load(fp)
+
+    _set_limits(job['cpu_time'], job['memory'])
+    preproc = PreprocCache(*job['preproc']) if job['preproc'] else None
+    success, exception = execute_recipe(job['recipe_file'], job['cfg'], preproc)
+
+    with open(job['result_file'], 'w') as fp:
+        json.dump({'success': success, 'exception': exception}, fp)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -0,0 +1,302 @@
+import atexit
+import hashlib
+import itertools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import parse_qs
+
+import logging
+
+from pywps import configuration
+from pywps.response.status import WPS_STATUS
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Status of the running jobs as JSON, without the database and status documents of PyWPS.
+#
+# Every process serving requests keeps the status of the jobs in memory and listens for updates on a unix
+# datagram socket in a shared directory. The processes running jobs (the serving processes themselves, or the
+# processes PyWPS starts for asynchronous requests) send every status update of a job to all sockets in the
+# directory. Updates are dropped rather than delaying a job when a socket is full, the status document of
+# PyWPS stays the authoritative status.
+
+STATUS_NAMES = {
+    WPS_STATUS.ACCEPTED: 'accepted',
+    WPS_STATUS.STARTED: 'started',
+    WPS_STATUS.PAUSED: 'paused',
+    WPS_STATUS.SUCCEEDED: 'succeeded',
+    WPS_STATUS.FAILED: 'failed',
+}
+FINISHED = ('succeeded', 'failed')
+
+# Longest wait of a long-poll request and interval of the keep-alive comments of event streams (seconds)
+MAX_WAIT = 60
+KEEP_ALIVE = 15
+
+# Seconds after which a client should retry a waiting request that was refused
+RETRY_AFTER = 5
+
+MAX_DATAGRAM = 65536
+
+
+def socket_dir():
+    """Directory of the sockets of the service, by default named after the output path of this instance."""
+    directory = configuration.get_config_value('status', 'socket_dir')
+    if directory:
+        return directory
+    # services of the same user do not share their jobs
+    output_path = os.path.abspath(configuration.get_config_value('server', 'outputpath'))
+    instance = hashlib.sha1(output_path.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), 'c3s_magic_wps-status-{}-{}'.format(os.getuid(), instance))
+
+
+def _max_jobs():
+    value = configuration.get_config_value('status', 'max_jobs')
+    return int(value) if value else 1000
+
+
+def _max_waiters():
+    value = configuration.get_config_value('status', 'max_waiters')
+    return int(value) if value else 2
+
+
+class JobTable():
+    """Status of the jobs of the service, updated by the datagrams sent to the socket of this process.
+
+    The `max_jobs` most recently updated jobs are kept.
+    """
+
+    def __init__(self, directory, max_jobs=1000):
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.pid = os.getpid()
+        self._jobs = OrderedDict()
+        self._condition = threading.Condition()
+        self._socket = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '{}.sock'.format(self.pid))
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(path)
+        atexit.register(self._remove_socket, path)
+        threading.Thread(target=self._receive, name='JobStatusReceiver', daemon=True).start()
+        return self
+
+    def _remove_socket(self, path):
+        if os.getpid() == self.pid and os.path.exists(path):
+            os.unlink(path)
+
+    def _receive(self):
+        while True:
+            data = self._socket.recv(MAX_DATAGRAM)
+            try:
+                self.update(json.loads(data.decode('utf-8')))
+            except (ValueError, KeyError):
+                LOGGER.warning("invalid job status update %r", data[:100])
+
+    def update(self, job):
+        with self._condition:
+            previous = self._jobs.pop(job['id'], None)
+            if previous is not None and previous['version'] > job['version']:
+                job = previous
+            self._jobs[job['id']] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+            self._condition.notify_all()
+
+    def get(self, job_id, since=0, timeout=0):
+        """Return the status of a job, or None if it is unknown.
+
+        Waits up to `timeout` seconds for a status with a version newer than `since`, unless the job finished.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is not None and (job['version'] > since or job['status'] in FINISHED):
+                    return dict(job)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return dict(job) if job is not None else None
+                self._condition.wait(remaining)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_job_table():
+    """The job table of this process, started on first use."""
+    global _table
+    with _table_lock:
+        # not inherited by forked processes, the receiving thread does not survive a fork
+        if _table is None or _table.pid != os.getpid():
+            _table = JobTable(socket_dir(), _max_jobs()).start()
+        return _table
+
+
+def publish(job, directory=None):
+    """Send the status of a job to the job tables of all processes."""
+    directory = directory or socket_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    data = json.dumps(job).encode('utf-8')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+        sender.setblocking(False)
+        for name in names:
+            if not name.endswith('.sock'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # the process exited without removing its socket
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                LOGGER.debug("dropped job status update for %s", path)
+
+
+def track(response):
+    """Publish all status updates of an execute response, including the final status set by PyWPS."""
+    directory = socket_dir()
+    versions = itertools.count(1)
+    update_status = response._update_status
+
+    def publish_status():
+        publish({
+            'id': str(response.uuid),
+            'process': response.process.identifier,
+            'status': STATUS_NAMES.get(response.status, 'unknown'),
+            'message': response.message,
+            'percent': response.status_percentage,
+            'updated': time.time(),
+            'version': next(versions),
+        }, directory)
+
+    def _update_status(status, message, status_percentage, clean=True):
+        update_status(status, message, status_percentage, clean)
+        publish_status()
+
+    response._update_status = _update_status
+    publish_status()
+
+
+def reporting(handler):
+    """Wrap the handler of a process to publish the status of its jobs."""
+
+    @wraps(handler)
+    def handler_reporting_status(request, response):
+        try:
+            track(response)
+        except Exception:
+            LOGGER.exception("could not publish the status of job %s", response.uuid)
+        return handler(request, response)
+
+    return handler_reporting_status
+
+
+def _json_response(start_response, status, body):
+    data = json.dumps(body).encode('utf-8')
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(data))),
+                            ('Cache-Control', 'no-cache')])
+    return [data]
+
+
+class JobStatusMiddleware():
+    """WSGI middleware answering status requests of jobs under `prefix` from the job table of the process.
+
+    GET <prefix>/<job id> returns the status as JSON. With `wait=<seconds>` and `since=<version>` the request
+    waits until there is a newer status than `since` (long polling). GET <prefix>/<job id>/events, or a
+    request accepting text/event-stream, streams all updates as server-sent events until the job finished.
+
+    Waiting requests hold a thread of the server, at most `max_waiters` of them wait at the same time so the
+    other threads stay free for WPS requests. Further waiting requests are refused with 503 Service Unavailable.
+    """
+
+    def __init__(self, application, prefix='/jobs', max_waiters=None):
+        self.application = application
+        self.prefix = prefix.rstrip('/') + '/'
+        self.max_waiters = max_waiters if max_waiters is not None else _max_waiters()
+        self._waiters = threading.BoundedSemaphore(self.max_waiters)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) or environ.get('REQUEST_METHOD', 'GET') != 'GET':
+            return self.application(environ, start_response)
+
+        job_id = path[len(self.prefix):]
+        events = 'text/event-stream' in environ.get('HTTP_ACCEPT', '')
+        if job_id.endswith('/events'):
+            job_id = job_id[:-len('/events')]
+            events = True
+
+        table = get_job_table()
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            since = int(query.get('since', [environ.get('HTTP_LAST_EVENT_ID') or 0])[0])
+            wait = min(float(query.get('wait', [0])[0]), MAX_WAIT)
+        except ValueError:
+            return _json_response(start_response, '400 Bad Request', {'error': 'invalid since or wait'})
+
+        job = table.get(job_id, since)
+        if job is None:
+            return _json_response(start_response, '404 Not Found', {'error': 'unknown job {}'.format(job_id)})
+        if job['status'] in FINISHED or (not events and (wait <= 0 or job['version'] > since)):
+            if events:
+                start_response('200 OK', [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')])
+                return self._events(table, job_id, since)
+            return _json_response(start_response, '200 OK', job)
+
+        if not self._acquire():
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json'),
+                                                       ('Retry-After', str(RETRY_AFTER))])
+            return [json.dumps({'error': 'too many waiting status requests'}).encode('utf-8')]
+        if not events:
+            try:
+                return _json_response(start_response, '200 OK', table.get(job_id, since, wait))
+            finally:
+                self._release()
+
+        start_response('200 OK', [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')])
+        return self._events(table, job_id, since, self._release)
+
+    def _acquire(self):
+        return self._waiters.acquire(blocking=False)
+
+    def _release(self):
+        self._waiters.release()
+
+    @staticmethod
+    def _events(table, job_id, since, release=None):
+        try:
+            while True:
+                job = table.get(job_id, since, KEEP_ALIVE)
+                if job is None:
+                    return
+                if job['version'] <= since:
+                    if job['status'] in FINISHED:
+                        return
+                    yield b': keep-alive\n\n'
+                    continue
+                since = job['version']
+                yield 'id: {}\ndata: {}\n\n'.format(since, json.dumps(job)).encode('utf-8')
+                if job['status'] in FINISHED:
+                    return
+        finally:
+            # also when the client went away and the server closed the stream
+            if release is not None:
+                release()
@@ -0,0 +1,96 @@
+import fcntl
+import os
+import shutil
+
+import logging
+
+from pywps import configuration
+from werkzeug.security import safe_join
+
+from . import timing
+from .archive import ArchiveWriter, collect_files
+from .cache import link_or_copy
+from .file_server import FileServer
+
+LOGGER = logging.getLogger("PYWPS")
+
+# The archive output of a run is only created when it is downloaded for the first time, selected with
+# `archive = lazy` in the [esmvaltool] section. The outputs have to be served by the `c3s_magic_wps start`
+# service or another application wrapped in LazyArchiveMiddleware, so archives are created at the end of
+# every run by default (`archive = eager`).
+#
+# At the end of a run the files of the archive are hard linked into a hidden directory next to the place
+# where PyWPS stores the outputs of the request, and the archive output refers to the URL the zip file will
+# have. The first request for that URL creates the zip file and removes the directory, later requests are
+# served from the file.
+
+
+def enabled():
+    mode = configuration.get_config_value('esmvaltool', 'archive') or 'eager'
+    if mode not in ('lazy', 'eager'):
+        raise ValueError("unknown archive mode {}, use lazy or eager".format(mode))
+    return mode == 'lazy'
+
+
+def _source_dir(archive_file):
+    return os.path.join(os.path.dirname(archive_file), '.{}.src'.format(os.path.basename(archive_file)))
+
+
+def prepare(output_dir, archive_name, request_uuid, exclude_preproc=True):
+    """Keep the files of an archive for later, returns the URL of the archive in the outputs of the request."""
+    target = os.path.join(configuration.get_config_value('server', 'outputpath'), str(request_uuid))
+    source = _source_dir(os.path.join(target, archive_name))
+    for path, arcname in collect_files(output_dir, exclude_preproc):
+        destination = os.path.join(source, arcname)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        link_or_copy(path, destination)
+
+    output_url = configuration.get_config_value('server', 'outputurl').rstrip('/')
+    return '{}/{}/{}'.format(output_url, request_uuid, archive_name)
+
+
+def materialize(archive_file):
+    """Create an archive kept with `prepare`, returns False if there is no such archive."""
+    if os.path.isfile(archive_file):
+        return True
+    source = _source_dir(archive_file)
+    if not os.path.isdir(source):
+        return False
+
+    # a single request creates the archive, concurrent requests for it wait for the file
+    lock_file = archive_file + '.lock'
+    with open(lock_file, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.isfile(archive_file):
+                return True
+            LOGGER.info("creating archive %s", archive_file)
+            partial_file = _source_dir(archive_file) + '.{}.tmp'.format(os.getpid())
+            # the directory of the archive is named after the request
+            job = os.path.basename(os.path.dirname(archive_file))
+            with timing.deferred_stage(job, 'archive.materialize'):
+                ArchiveWriter(partial_file).write(collect_files(source, exclude_preproc=False))
+            os.rename(partial_file, archive_file)
+            shutil.rmtree(source)
+            os.unlink(lock_file)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return True
+
+
+class LazyArchiveMiddleware():
+    """WSGI middleware creating archives kept with `prepare` when they are requested under `prefix`."""
+
+    def __init__(self, application, output_path, prefix='/outputs'):
+        self.application = application
+        self.output_path = output_path
+        self.prefix = prefix.rstrip('/') + '/'
+        self.files = FileServer(application, {self.prefix: output_path})
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.prefix) and path.endswith('.zip'):
+            archive_file = safe_join(self.output_path, path[len(self.prefix):])
+            if archive_file and materialize(archive_file):
+                return self.files(environ, start_response)
+        return self.application(environ, start_response)
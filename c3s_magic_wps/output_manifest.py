@@ -0,0 +1,185 @@
+import fnmatch
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+import logging
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Number of output directories of recent runs kept indexed in memory
+MAX_MANIFESTS = 16
+
+# Written by ESMValTool diagnostic scripts in their run directory, maps every output file to its attributes
+PROVENANCE_FILE = 'diagnostic_provenance.yml'
+
+
+def _has_magic(pattern):
+    return any(char in pattern for char in '*?[')
+
+
+def _match(name, pattern):
+    # like glob, wildcards do not match hidden files
+    if name.startswith('.') and not pattern.startswith('.'):
+        return False
+    return fnmatch.fnmatchcase(name, pattern)
+
+
+def _match_attributes(record, attributes):
+    for name, value in attributes.items():
+        recorded = record.get(name)
+        if recorded != value and not (isinstance(recorded, list) and value in recorded):
+            return False
+    return True
+
+
+def read_provenance(run_dir):
+    """Read the output records of the diagnostic scripts of a run.
+
+    Returns a dict with the path of every script relative to `run_dir` (diagnostic/script) and the attributes of
+    its output files by path. The paths are those of the outputs next to `run_dir`, also when the run was
+    restored from the result cache into another directory.
+    """
+    import yaml
+
+    output_dir = os.path.dirname(os.path.abspath(run_dir))
+    records = dict()
+    for provenance_file in sorted(glob.glob(os.path.join(run_dir, '*', '*', PROVENANCE_FILE))):
+        script_run_dir = os.path.dirname(provenance_file)
+        try:
+            with open(provenance_file) as fp:
+                table = yaml.safe_load(fp) or dict()
+            with open(os.path.join(script_run_dir, 'settings.yml')) as fp:
+                settings = yaml.safe_load(fp)
+        except (OSError, yaml.YAMLError):
+            LOGGER.warning("could not read the provenance in %s", script_run_dir, exc_info=True)
+            continue
+
+        # <output_dir>/run/<diagnostic>/<script> when the run was executed
+        recorded_output_dir = os.path.dirname(os.path.dirname(os.path.dirname(settings['run_dir'])))
+        script_records = dict()
+        for filename, attributes in table.items():
+            path = os.path.join(output_dir, os.path.relpath(filename, recorded_output_dir))
+            script_records[os.path.normpath(path)] = attributes or dict()
+        records[os.path.relpath(script_run_dir, run_dir)] = script_records
+    return records
+
+
+class OutputManifest():
+    """Index of the files below an output directory.
+
+    Files are indexed by their directory relative to `root` (the diagnostic/script path) and their extension,
+    queries match the stem of the candidates with the same wildcards as glob. The outputs of scripts with
+    `provenance` records (see read_provenance) are taken from their records with their attributes, the
+    directories of the other scripts are walked once.
+    """
+
+    def __init__(self, root, provenance=None):
+        self.root = root
+        self.records = dict()
+        self._files = dict()
+
+        provenance = provenance or dict()
+        self._recorded = set(provenance)
+        for records in provenance.values():
+            for path, attributes in records.items():
+                if path.startswith(os.path.join(root, '')) and os.path.isfile(path):
+                    self.records[path] = attributes
+                    self._add(path)
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            if os.path.relpath(dirpath, root) in provenance:
+                dirnames[:] = []
+                continue
+            for filename in filenames:
+                self._add(os.path.join(dirpath, filename))
+
+        for candidates in self._files.values():
+            candidates.sort()
+
+    def _add(self, path):
+        stem, extension = os.path.splitext(os.path.basename(path))
+        key = (os.path.relpath(os.path.dirname(path), self.root), extension[1:])
+        self._files.setdefault(key, []).append((stem, path))
+
+    def find(self, path_filter='.', name_filter='*', output_format='pdf', **attributes):
+        """Return the paths of the files in `path_filter` named `name_filter`.`output_format`, in sorted order.
+
+        With `attributes`, only outputs with provenance records with these attribute values (or lists of
+        values containing them) are returned. Outputs of scripts without provenance records, like those of
+        ESMValTool versions that do not write them, are matched by name only.
+        """
+        path_filter = os.path.normpath(path_filter)
+        if _has_magic(path_filter):
+            keys = sorted(key for key in self._files
+                          if key[1] == output_format and fnmatch.fnmatchcase(key[0], path_filter))
+        else:
+            keys = [(path_filter, output_format)]
+
+        matches = []
+        for key in keys:
+            recorded = key[0] in self._recorded
+            for stem, path in self._files.get(key, ()):
+                if not _match(stem, name_filter):
+                    continue
+                if attributes and recorded and not _match_attributes(self.records.get(path, dict()), attributes):
+                    continue
+                matches.append(path)
+        return matches
+
+
+class _Recent():
+    """The values of the most recently used keys, shared by the threads of the service."""
+
+    def __init__(self, size):
+        self.size = size
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pop(self, key):
+        with self._lock:
+            return self._values.pop(key, None)
+
+    def put(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+
+_manifests = _Recent(MAX_MANIFESTS)
+_provenance = _Recent(MAX_MANIFESTS)
+
+
+def _run_provenance(output_dir):
+    # the plot and work dir of a run share the run dir with the records
+    run_dir = os.path.join(os.path.dirname(output_dir), 'run')
+    provenance = _provenance.pop(run_dir)
+    if provenance is None:
+        provenance = read_provenance(run_dir) if os.path.isdir(run_dir) else dict()
+    _provenance.put(run_dir, provenance)
+    return provenance
+
+
+def find_outputs(output_dir, path_filter, name_filter='*', output_format='pdf', **attributes):
+    """Find outputs with the manifest of `output_dir`, indexing the directory on first use.
+
+    The directory is indexed again when nothing matches or a match was removed, so files written after the
+    index was built are found as well. Files of scripts with provenance records that are not in their records
+    are only found when nothing else matches.
+    """
+    output_dir = os.path.abspath(output_dir)
+    manifest = _manifests.pop(output_dir)
+    if manifest is not None:
+        matches = manifest.find(path_filter, name_filter, output_format, **attributes)
+        if not matches or not all(os.path.exists(path) for path in matches):
+            manifest = None
+    if manifest is None:
+        manifest = OutputManifest(output_dir, _run_provenance(output_dir))
+        matches = manifest.find(path_filter, name_filter, output_format, **attributes)
+    _manifests.put(output_dir, manifest)
+
+    if not matches and not attributes and manifest.records:
+        matches = OutputManifest(output_dir).find(path_filter, name_filter, output_format)
+    return matches
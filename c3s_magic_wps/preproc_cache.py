@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import logging
+
+from pywps import configuration
+
+from .cache import DirectoryCache
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Version of the layout of the cache entries, part of every key
+CACHE_VERSION = 2
+
+# Steps combining the products of several datasets, tasks using them are not cached
+MULTI_MODEL_STEPS = ('mask_fillvalues', 'multi_model_statistics')
+
+# Caches of the runs in this process by their preprocessor output directory, see install(). Runs in threads of
+# the same process share the patched task class, a task finds the cache of its run from the paths of its products.
+_active = dict()
+_active_lock = threading.Lock()
+
+
+def get_preproc_cache():
+    """Return the preprocessor cache configured in the [cache] section, or None if it is disabled."""
+    directory = configuration.get_config_value('cache', 'preproc_dir')
+    if not directory:
+        return None
+    max_size = configuration.get_config_value('cache', 'preproc_max_size') or '50gb'
+    return PreprocCache(directory, max_size=configuration.get_size_mb(max_size) * 1024**2)
+
+
+def _describe(value, product_dir, preproc_dir):
+    # JSON compatible description of preprocessor settings, independent of the run and diagnostic they are used in
+    if isinstance(value, dict):
+        return {str(key): _describe(item, product_dir, preproc_dir) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_describe(item, product_dir, preproc_dir) for item in value]
+    if isinstance(value, str):
+        return value.replace(product_dir, '<product_dir>').replace(preproc_dir, '<preproc_dir>')
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    if callable(value):
+        return '{}.{}'.format(getattr(value, '__module__', ''), getattr(value, '__qualname__', repr(value)))
+    return repr(value)
+
+
+def _ordered(products):
+    # tasks keep their products in a set
+    return sorted(products, key=lambda product: product.filename)
+
+
+# Attributes of a product identifying the data it holds, its filename holds the diagnostic it is used by
+KEY_ATTRIBUTES = ('project', 'dataset', 'exp', 'ensemble', 'short_name', 'mip', 'start_year', 'end_year')
+
+
+class PreprocCache(DirectoryCache):
+    """Cache of the NetCDF files written by the ESMValTool preprocessor, shared by all runs.
+
+    An entry holds the output file of a single product, the preprocessed data of one dataset and
+    variable. Its key covers the dataset, variable, mip and years of the product, the settings of
+    every step (the preprocessor definition) without the paths of the run, and the paths, sizes and
+    modification times of the input files. Products are therefore shared between diagnostics and
+    between tasks preprocessing other datasets as well.
+    """
+
+    def key(self, product, preproc_dir):
+        """Key of a product, or None if it can not be cached."""
+        if any(step in product.settings for step in MULTI_MODEL_STEPS):
+            return None
+
+        # the cleanup step only lists directories of the current run, the output file is the product
+        settings = {step: args for step, args in product.settings.items() if step != 'cleanup'}
+        if 'save' in settings:
+            settings['save'] = {name: value for name, value in settings['save'].items() if name != 'filename'}
+        inputs = []
+        for input_file in sorted(product.files):
+            try:
+                stat = os.stat(input_file)
+            except OSError:
+                return None
+            inputs.append([input_file, stat.st_size, stat.st_mtime_ns])
+
+        description = {
+            'version': CACHE_VERSION,
+            'attributes': {name: product.attributes.get(name) for name in KEY_ATTRIBUTES},
+            'settings': _describe(settings, os.path.dirname(product.filename), preproc_dir),
+            'inputs': inputs,
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def task_keys(self, products, preproc_dir):
+        """Keys of the products of a preprocessing task in filename order, or None if one of them can not be cached."""
+        keys = [self.key(product, preproc_dir) for product in _ordered(products)]
+        return None if None in keys else keys
+
+    def restore(self, keys, products):
+        """Copy the cached files to the output files of the products, returns whether all of them were cached."""
+        entries = [self.entry(key) for key in keys]
+        if not all(os.path.isdir(entry) for entry in entries):
+            return False
+
+        try:
+            for entry, product in zip(entries, _ordered(products)):
+                os.makedirs(os.path.dirname(product.filename), exist_ok=True)
+                # ESMValTool adds provenance to the files it writes, so they are not shared with hard links
+                shutil.copy2(os.path.join(entry, 'product.nc'), product.filename)
+        except OSError:
+            # evicted while restoring
+            LOGGER.debug("could not restore preprocessed data %s", keys, exc_info=True)
+            return False
+
+        for key in keys:
+            self.touch(key)
+        LOGGER.info("using cached preprocessed data %s", ', '.join(keys))
+        return True
+
+    def store(self, keys, products):
+        for key, product in zip(keys, _ordered(products)):
+            self.populate(key, lambda entry, product=product: shutil.copy2(product.filename,
+                                                                           os.path.join(entry, 'product.nc')))
+
+
+def install(cache, preproc_dir, task_class=None, write_metadata=None):
+    """Use `cache` for the preprocessing tasks of the ESMValTool run writing to `preproc_dir` in this process.
+
+    Wraps `PreprocessingTask._run` once: if all products of a task are cached they are copied
+    to the preprocessor output directory and only the metadata is written, otherwise the task
+    runs as usual and its products that are not cached yet are stored. Passing None as cache
+    disables the cache for the run.
+    """
+    with _active_lock:
+        _active[os.path.abspath(preproc_dir)] = cache
+    if cache is None:
+        return
+
+    if task_class is None:
+        from esmvaltool import preprocessor
+        task_class = preprocessor.PreprocessingTask
+        write_metadata = preprocessor.write_metadata
+
+    if getattr(task_class._run, 'preproc_cached', False):
+        return
+
+    original_run = task_class._run
+
+    def _run(self, input_files):
+        cache, preproc_dir = _find_run(self.products)
+        keys = cache.task_keys(self.products, preproc_dir) if cache else None
+
+        if keys and cache.restore(keys, self.products):
+            if hasattr(self, '_initialize_product_provenance'):
+                self._initialize_product_provenance()
+            return write_metadata(self.products, self.write_ncl_interface)
+
+        output_files = original_run(self, input_files)
+        if keys:
+            cache.store(keys, self.products)
+        return output_files
+
+    _run.preproc_cached = True
+    task_class._run = _run
+
+
+def uninstall(preproc_dir):
+    """Forget the cache of the run writing to `preproc_dir`, once it finished."""
+    with _active_lock:
+        _active.pop(os.path.abspath(preproc_dir), None)
+
+
+def _find_run(products):
+    """Cache and preprocessor output directory of the run the products belong to."""
+    for product in products:
+        directory = os.path.dirname(os.path.abspath(product.filename))
+        with _active_lock:
+            while directory not in _active:
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    return None, None
+                directory = parent
+            return _active[directory], directory
+    return None, None
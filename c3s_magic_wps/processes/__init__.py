@@ -24,6 +24,7 @@ from .wps_hyint import HyInt
 from .wps_perfmetrics import Perfmetrics
 from .wps_smpi import SMPI
 from .wps_extreme_events import ExtremeEvents
+from .registry import LazyProcess
 
 __all__ = sorted(
     [
@@ -52,34 +53,35 @@ __all__ = sorted(
     ]
 )
 
+# processes are registered lazily, see LazyProcess
 processes = sorted(
     [
-        Meta(),
-        CVDP(),
-        EnsClus(),
-        # Sleep(),
-        Blocking(),
-        PreprocessExample(),
-        ZMNAM(),
-        Teleconnections(),
-        WeatherRegimes(),
-        ModesVariability(),
-        CombinedIndices(),
-        MultimodelProducts(),
-        HeatwavesColdwaves(),
-        DiurnalTemperatureIndex(),
-        CapacityFactor(),
-        ExtremeIndex(),
-        DroughtIndicator(),
-        ConsecDryDays(),
-        ShapeSelect(),
-        QuantileBias(),
-        RainFARM(),
-        Toymodel(),
-        HyInt(),
-        Perfmetrics(),
-        SMPI(),
-        ExtremeEvents(),
+        LazyProcess(Meta),
+        LazyProcess(CVDP),
+        LazyProcess(EnsClus),
+        # LazyProcess(Sleep),
+        LazyProcess(Blocking),
+        LazyProcess(PreprocessExample),
+        LazyProcess(ZMNAM),
+        LazyProcess(Teleconnections),
+        LazyProcess(WeatherRegimes),
+        LazyProcess(ModesVariability),
+        LazyProcess(CombinedIndices),
+        LazyProcess(MultimodelProducts),
+        LazyProcess(HeatwavesColdwaves),
+        LazyProcess(DiurnalTemperatureIndex),
+        LazyProcess(CapacityFactor),
+        LazyProcess(ExtremeIndex),
+        LazyProcess(DroughtIndicator),
+        LazyProcess(ConsecDryDays),
+        LazyProcess(ShapeSelect),
+        LazyProcess(QuantileBias),
+        LazyProcess(RainFARM),
+        LazyProcess(Toymodel),
+        LazyProcess(HyInt),
+        LazyProcess(Perfmetrics),
+        LazyProcess(SMPI),
+        LazyProcess(ExtremeEvents),
     ],
     key=lambda process: process.title,
 )
@@ -0,0 +1,64 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from pywps import Service, response
+
+from .. import job_status, timing
+from .utils import describe_only
+
+
+class LazyProcess():
+    """Stand-in for a Process that constructs it on first use.
+
+    On registration only a descriptor of the process is constructed, without looking up the
+    available model data. It holds everything needed for GetCapabilities. The full process,
+    with the allowed values of all inputs, is constructed on the first DescribeProcess or
+    Execute request, or when any other attribute of the process is used.
+    """
+
+    def __init__(self, process_class):
+        self.process_class = process_class
+        with describe_only():
+            self.descriptor = process_class()
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def identifier(self):
+        return self.descriptor.identifier
+
+    @property
+    def title(self):
+        return self.descriptor.title
+
+    def materialize(self):
+        with self._lock:
+            if self._process is None:
+                self._process = self.process_class()
+        return self._process
+
+    def is_materialized(self):
+        return self._process is not None
+
+    def __getattr__(self, name):
+        if name in ('process_class', 'descriptor', '_process', '_lock'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __deepcopy__(self, memo):
+        # PyWPS copies the process for every execution
+        process = copy.deepcopy(self.materialize(), memo)
+        process.handler = timing.timed(job_status.reporting(process.handler))
+        return process
+
+
+class LazyService(Service):
+    """PyWPS Service answering GetCapabilities from the descriptors of lazy processes."""
+
+    def get_capabilities(self, wps_request, uuid):
+        processes = OrderedDict((identifier, getattr(process, 'descriptor', process))
+                                for identifier, process in self.processes.items())
+
+        response_cls = response.get_response("capabilities")
+        return response_cls(wps_request, uuid, version=wps_request.version, processes=processes)
@@ -3,11 +3,13 @@ from .esmvaltool_utils import (
     reference_year_ranges,
     historic_projection_year_ranges,
     region,
+    default_inputs,
     default_outputs,
     model_experiment_ensemble,
     outputs_from_plot_names,
     outputs_from_data_names,
     check_constraints,
+    describe_only,
 )
 
 from .data_finder import DataFinder
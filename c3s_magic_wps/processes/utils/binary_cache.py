@@ -0,0 +1,167 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import logging
+
+from .facet_index import FACETS, GROUP_FACETS, FacetIndex
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Binary layout of the DataFinder cache, selected with CMIP_META_CACHE_FORMAT=binary.
+#
+# The file starts with MAGIC, the length of a JSON header (uint32) and the header itself. The
+# header holds the version and archive of the cache and the offset, length and type of every
+# section. Sections are 8-byte aligned arrays in native byte order:
+#
+#  - the directory tree in preorder: parent (int32, -1 for the root), name (int32 code into the
+#    sorted `names` string table) and mtime (int64, -1 if unknown) of every directory
+#  - the facet index: a string table with the values of every facet, a code column (int32) per
+#    group facet and the variable_group/variable_code rows
+#
+# A string table is stored as int32 offsets (one more than the number of strings) into a UTF-8 blob.
+#
+# Loading maps the file read-only and wraps the sections in memoryviews, so the index columns are
+# used straight from the page cache and shared between all processes that load the same file. The
+# nested tree and the mtimes are only built when they are needed, for a rescan or the full tree.
+
+MAGIC = b'C3SMETA\x00'
+
+_ALIGNMENT = 8
+
+
+def dump(write_file, header, data, mtimes, index):
+    sections = dict()
+
+    parents, names, node_mtimes = array('i'), [], array('q')
+
+    def add_node(node, parent, relpath):
+        position = len(parents)
+        parents.append(parent)
+        names.append(node['name'])
+        node_mtimes.append(mtimes.get(relpath, -1))
+        for child in node.get('contents', []):
+            add_node(child, position, os.path.join(relpath, child['name']))
+
+    add_node(data, -1, '')
+
+    name_table = sorted(set(names))
+    name_codes = {name: code for code, name in enumerate(name_table)}
+    sections['node_parent'] = parents
+    sections['node_name'] = array('i', [name_codes[name] for name in names])
+    sections['node_mtime'] = node_mtimes
+    _add_string_table(sections, 'names', name_table)
+
+    for facet in FACETS:
+        _add_string_table(sections, 'values_' + facet, index.values[facet])
+    for facet in GROUP_FACETS:
+        sections['column_' + facet] = array('i', index.columns[facet])
+    sections['variable_group'] = array('i', index.variable_group)
+    sections['variable_code'] = array('i', index.variable_code)
+
+    # offsets are relative to the end of the header, which size is only known once it is written
+    header = dict(header, byteorder=sys.byteorder, sections=dict())
+    offset = 0
+    for name, section in sections.items():
+        offset = _align(offset)
+        length = len(section) * section.itemsize if isinstance(section, array) else len(section)
+        header['sections'][name] = [offset, length, section.typecode if isinstance(section, array) else 'B']
+        offset += length
+
+    encoded_header = json.dumps(header).encode('utf-8')
+    write_file.write(MAGIC)
+    write_file.write(struct.pack('<I', len(encoded_header)))
+    write_file.write(encoded_header)
+    start = _align(write_file.tell())
+    write_file.write(b'\0' * (start - write_file.tell()))
+
+    for name, section in sections.items():
+        offset = header['sections'][name][0]
+        write_file.write(b'\0' * (start + offset - write_file.tell()))
+        write_file.write(section.tobytes() if isinstance(section, array) else section)
+
+
+def load(cache_file):
+    """Map a binary cache file, returns its header and a MappedCache or None if it is not a binary cache."""
+    with open(cache_file, 'rb') as read_file:
+        if os.fstat(read_file.fileno()).st_size < len(MAGIC) + 4:
+            return None
+        mapped = mmap.mmap(read_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(MAGIC)] != MAGIC:
+        return None
+
+    header_length = struct.unpack_from('<I', mapped, len(MAGIC))[0]
+    header_end = len(MAGIC) + 4 + header_length
+    header = json.loads(mapped[len(MAGIC) + 4:header_end].decode('utf-8'))
+
+    if header.get('byteorder') != sys.byteorder:
+        return None
+
+    return header, MappedCache(mapped, _align(header_end), header['sections'])
+
+
+class MappedCache():
+    def __init__(self, mapped, start, sections):
+        self._view = memoryview(mapped)
+        self._start = start
+        self._sections = sections
+
+        self.index = FacetIndex(
+            {facet: self._string_table('values_' + facet) for facet in FACETS},
+            {facet: self._section('column_' + facet) for facet in GROUP_FACETS},
+            self._section('variable_group'),
+            self._section('variable_code'),
+        )
+
+    def _section(self, name):
+        offset, length, typecode = self._sections[name]
+        section = self._view[self._start + offset:self._start + offset + length]
+        return section if typecode == 'B' else section.cast(typecode)
+
+    def _string_table(self, name):
+        offsets = self._section(name + '_offsets')
+        blob = self._section(name + '_blob')
+        return [bytes(blob[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(len(offsets) - 1)]
+
+    def tree(self):
+        """Build the nested tree and the directory mtimes of the cache."""
+        names = self._string_table('names')
+        parents = self._section('node_parent')
+        node_names = self._section('node_name')
+        node_mtimes = self._section('node_mtime')
+
+        nodes = []
+        relpaths = []
+        mtimes = dict()
+        for position in range(len(parents)):
+            name = names[node_names[position]]
+            node = {'name': name}
+            parent = parents[position]
+            if parent < 0:
+                relpath = ''
+            else:
+                nodes[parent].setdefault('contents', []).append(node)
+                relpath = os.path.join(relpaths[parent], name)
+            nodes.append(node)
+            relpaths.append(relpath)
+            if node_mtimes[position] >= 0:
+                mtimes[relpath] = node_mtimes[position]
+
+        return nodes[0], mtimes
+
+
+def _add_string_table(sections, name, strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = array('i', [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    sections[name + '_offsets'] = offsets
+    sections[name + '_blob'] = b''.join(encoded)
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
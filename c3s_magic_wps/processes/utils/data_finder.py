@@ -1,14 +1,23 @@
 import os
+import hashlib
 import tempfile
 import glob
 import json
+import fcntl
+import signal
 import sys
-import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import logging
 
 from pywps import configuration
 
+from . import binary_cache
+from .facet_index import GROUP_FACETS, FacetIndex
+
 LOGGER = logging.getLogger("PYWPS")
 
 # Builds up a tree of folders with their contentaining folders
@@ -31,6 +40,114 @@ def _dir_entry(path, name):
     return result
 
 
+# Incremental variant of _dir_entry. The mtime (in ns) of every directory is recorded in
+# `mtimes`, keyed by its path relative to the archive root. If the mtime of a directory did not
+# change since the `previous` scan its list of subdirectories is reused, so an unchanged tree
+# costs a single stat per directory instead of a full listing. Directories that do need to be
+# listed are read with os.scandir, which returns the entry types together with the listing.
+# The `old_mtimes` passed to a rescan should only hold settled mtimes (see _settled_mtimes).
+def _scan_entry(path, name, relpath='', previous=None, old_mtimes=None, mtimes=None, relisted=None):
+    mtimes = mtimes if mtimes is not None else {}
+    names, previous_children = _list_subdirs(path, relpath, previous, old_mtimes, mtimes, relisted)
+
+    contents = []
+    for dir in names:
+        try:
+            contents.append(
+                _scan_entry(os.path.join(path, dir), dir, os.path.join(relpath, dir), previous_children.get(dir),
+                            old_mtimes, mtimes, relisted))
+        except FileNotFoundError:
+            _log_disappeared(relpath, dir)
+
+    return _make_entry(name, contents)
+
+
+def _list_subdirs(path, relpath, previous, old_mtimes, mtimes, relisted):
+    old_mtimes = old_mtimes if old_mtimes is not None else {}
+
+    mtime = os.stat(path).st_mtime_ns
+    mtimes[relpath] = mtime
+
+    previous_children = dict()
+    if previous is not None:
+        previous_children = {child['name']: child for child in _get_children_of(previous)}
+
+    if previous is not None and old_mtimes.get(relpath) == mtime:
+        names = [child['name'] for child in _get_children_of(previous)]
+    else:
+        if relisted is not None:
+            relisted.append(relpath)
+        with os.scandir(path) as entries:
+            names = [entry.name for entry in entries if entry.is_dir()]
+
+    return names, previous_children
+
+
+def _make_entry(name, contents):
+    result = dict()
+    result['name'] = name
+
+    if len(contents) > 0:
+        result['contents'] = contents
+
+    return result
+
+
+def _log_disappeared(relpath, dir):
+    # removed while scanning, will be picked up by the mtime change of its parent next time
+    LOGGER.debug("directory `%s` disappeared during scan", os.path.join(relpath, dir))
+
+
+# Parallel variant of _scan_entry. The directories down to `shard_depth` are listed in the calling
+# thread, every subtree below that depth is scanned by a worker of a thread pool. Listing a
+# directory on a network filesystem is latency bound, so several listings in flight at once
+# speed up the crawl even though the GIL is held while building the tree. The subtrees are
+# merged into the same structure (and order) as produced by _scan_entry.
+def _crawl(path, name, threads=1, shard_depth=2, previous=None, old_mtimes=None, mtimes=None, relisted=None):
+    mtimes = mtimes if mtimes is not None else {}
+
+    if threads <= 1 or shard_depth < 1:
+        return _scan_entry(path, name, '', previous, old_mtimes, mtimes, relisted)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return _shard_entry(pool, path, name, '', 0, shard_depth, previous, old_mtimes, mtimes, relisted).result()
+
+
+def _shard_entry(pool, path, name, relpath, depth, shard_depth, previous, old_mtimes, mtimes, relisted):
+    if depth == shard_depth:
+        return pool.submit(_scan_entry, path, name, relpath, previous, old_mtimes, mtimes, relisted)
+
+    names, previous_children = _list_subdirs(path, relpath, previous, old_mtimes, mtimes, relisted)
+
+    shards = []
+    for dir in names:
+        try:
+            shards.append((dir, _shard_entry(pool, os.path.join(path, dir), dir, os.path.join(relpath, dir),
+                                             depth + 1, shard_depth, previous_children.get(dir), old_mtimes, mtimes,
+                                             relisted)))
+        except FileNotFoundError:
+            _log_disappeared(relpath, dir)
+
+    contents = []
+    for dir, shard in shards:
+        try:
+            contents.append(shard.result())
+        except FileNotFoundError:
+            _log_disappeared(relpath, dir)
+
+    return _Done(_make_entry(name, contents))
+
+
+class _Done():
+    """Already finished stand-in for a Future of a subtree above the shard depth."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
 def _get_children_of(a_dict):
     if 'contents' in a_dict:
         return a_dict['contents'].copy()
@@ -38,20 +155,157 @@ def _get_children_of(a_dict):
         return []
 
 
-def _has_chilren(a_dict):
-    if 'contents' in a_dict:
-        # make sure we return a boolean
-        return len(a_dict['contents']) != 0
-    return False
+# Version of the layout of the cache file, caches with another version are rebuilt
+CACHE_VERSION = 3
+
+# Seconds within which the mtime of a directory may not change on another modification. Filesystems store
+# mtimes with a coarse resolution (a second or worse on network filesystems, whose clocks may also differ a
+# little from ours), so a directory changed again shortly after it was listed can keep the same mtime.
+MTIME_GRANULARITY = 2
+
+
+# The mtimes of the directories that cannot have changed unnoticed since a scan started at `scanned` (seconds
+# since the epoch). Directories with a later mtime are listed again by the next rescan, even if their mtime
+# is the same.
+def _settled_mtimes(mtimes, scanned):
+    if scanned is None:
+        return dict()
+    settled_before = int((scanned - MTIME_GRANULARITY) * 1e9)
+    return {relpath: mtime for relpath, mtime in mtimes.items() if mtime < settled_before}
+
+
+# Seconds between two checks of the cache file by processes following the refresh of another process
+FOLLOW_INTERVAL = 5
+
+
+def _file_version(path):
+    # the cache is replaced by a rename, so a new inode tells a rewrite apart even within the same mtime tick
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# Exclusive lock shared by all processes using the same cache file, so that a single process
+# crawls the archive while the others wait and load its result
+@contextmanager
+def _cache_lock(cache_file):
+    with open(cache_file + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Returns the keyword arguments for a _Snapshot of the cache, or None if there is no usable cache
+def _read_cache(cache_file, archive_base, cache_format='json'):
+    if not os.path.isfile(cache_file):
+        return None
+
+    try:
+        if cache_format == 'binary':
+            loaded = binary_cache.load(cache_file)
+            header, cached = loaded if loaded else (dict(), None)
+        else:
+            with open(cache_file, "r") as read_file:
+                header = cached = json.load(read_file)
+    except ValueError:
+        LOGGER.warning("ignoring unreadable meta data cache '%s'", cache_file)
+        return None
+
+    if not isinstance(header, dict) or header.get('version') != CACHE_VERSION:
+        LOGGER.warning("ignoring meta data cache '%s' written by another version", cache_file)
+        return None
+
+    if header.get('archive_base') != os.path.abspath(archive_base):
+        LOGGER.warning("ignoring meta data cache '%s' of archive `%s`", cache_file, header.get('archive_base'))
+        return None
+
+    LOGGER.debug("loaded meta data from '%s'", cache_file)
+    if cache_format == 'binary':
+        return dict(index=cached.index, load_tree=cached.tree, scanned=header.get('scanned'))
+    return dict(data=cached['data'], mtimes=cached['mtimes'], scanned=cached.get('scanned'))
+
+
+# Write the cache to a temporary file next to it and rename it into place once it is
+# completely on disk, so readers (and a crash) never leave a truncated cache behind
+def _write_cache(cache_file, archive_base, snapshot, cache_format='json'):
+    header = {
+        'version': CACHE_VERSION,
+        'archive_base': os.path.abspath(archive_base),
+        'scanned': snapshot.scanned,
+    }
+
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_file)),
+                                     prefix=os.path.basename(cache_file) + '.')
+    try:
+        with os.fdopen(fd, "wb") as write_file:
+            if cache_format == 'binary':
+                binary_cache.dump(write_file, header, snapshot.data, snapshot.mtimes, snapshot.index)
+            else:
+                write_file.write(json.dumps(dict(header, data=snapshot.data, mtimes=snapshot.mtimes)).encode('utf-8'))
+            write_file.flush()
+            os.fsync(write_file.fileno())
+        os.replace(temp_file, cache_file)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+    LOGGER.debug("written meta data to '%s'", cache_file)
+
+
+class _Snapshot():
+    """Everything derived from a single scan of the archive, replaced as a whole on a refresh.
+
+    A snapshot loaded from a binary cache only has an index, the tree and mtimes are built
+    from the cache by `load_tree` when they are first used.
+    """
+
+    def __init__(self, generation, data=None, mtimes=None, index=None, load_tree=None, scanned=None):
+        self._tree = (data, mtimes) if data is not None else None
+        self._load_tree = load_tree
+        self.index = index if index is not None else FacetIndex.from_tree(data)
+        # incremented every time new data is loaded, to invalidate results derived from older data
+        self.generation = generation
+        # time the scan of the tree started
+        self.scanned = scanned
+        self.query_cache = dict()
+
+    @property
+    def data(self):
+        return self._get_tree()[0]
+
+    # modification times of all directories in the tree, used for incremental rescans
+    @property
+    def mtimes(self):
+        return self._get_tree()[1]
+
+    def _get_tree(self):
+        if self._tree is None:
+            self._tree = self._load_tree()
+        return self._tree
 
 
 class DataFinder():
     __instance = None
+    __instance_lock = threading.Lock()
 
+    # The service builds the instance in the main thread at startup (see cli), so the handler of the refresh
+    # signal can be installed.
     @staticmethod
     def get_instance():
-        if DataFinder.__instance is None:
-            DataFinder.__instance = DataFinder()
+        with DataFinder.__instance_lock:
+            if DataFinder.__instance is None:
+                instance = DataFinder()
+
+                refresh_interval = float(os.environ.get('CMIP_META_REFRESH_INTERVAL', 0))
+                refresh_signal = os.environ.get('CMIP_META_REFRESH_SIGNAL')
+                if refresh_interval > 0 or refresh_signal:
+                    instance.start_refresher(interval=refresh_interval, signal_name=refresh_signal)
+
+                DataFinder.__instance = instance
 
         return DataFinder.__instance
 
@@ -67,100 +321,247 @@ class DataFinder():
             raise Exception('cmip5 folder not found at %s' % self.archive_base)
 
         self.cache_file = os.environ.get('CMIP_META_CACHE_FILE')
+        self.cache_format = os.environ.get('CMIP_META_CACHE_FORMAT', 'json')
+        if self.cache_format not in ('json', 'binary'):
+            raise Exception('CMIP_META_CACHE_FORMAT should be json or binary, not %s' % self.cache_format)
+        self.rescan = os.environ.get('CMIP_META_CACHE_RESCAN', '').lower() in ('1', 'true', 'yes')
+        self.crawl_threads = int(os.environ.get('CMIP_META_CRAWL_THREADS', 1))
+        self.crawl_depth = int(os.environ.get('CMIP_META_CRAWL_DEPTH', 2))
+
+        self._snapshot = _Snapshot(0, data=dict(name='root'), mtimes=dict())
+        self._refresh_lock = threading.Lock()
+        self._refresh_requested = threading.Event()
+        self._refresher = None
 
         if self.cache_file:
             LOGGER.info("using `%s` as file for storing cmip meta cache", self.cache_file)
 
-            if os.path.isfile(self.cache_file):
-                with open(self.cache_file, "r") as read_file:
-                    self.data = json.load(read_file)
-                    LOGGER.debug("loaded meta data from '%s'", self.cache_file)
-            else:
-                self.data = _dir_entry(self.archive_base, 'root')
+            with _cache_lock(self.cache_file):
+                cached = _read_cache(self.cache_file, self.archive_base, self.cache_format)
+                if cached is not None:
+                    self._load(**cached)
+
+                if (cached is None or self.rescan) and self._rescan():
+                    _write_cache(self.cache_file, self.archive_base, self._snapshot, self.cache_format)
+        else:
+            self._rescan()
+
+    @property
+    def data(self):
+        return self._snapshot.data
+
+    @property
+    def mtimes(self):
+        return self._snapshot.mtimes
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    @property
+    def generation(self):
+        return self._snapshot.generation
+
+    # Rescan the archive, only listing directories that changed since the previous scan
+    def refresh(self):
+        # concurrent refreshes are serialized, readers keep using the current snapshot meanwhile
+        with self._refresh_lock:
+            if self._rescan() and self.cache_file:
+                with _cache_lock(self.cache_file):
+                    _write_cache(self.cache_file, self.archive_base, self._snapshot, self.cache_format)
+
+    # Returns whether the scan found any changes and a new snapshot was loaded. Directories that were
+    # modified around the previous scan are listed again, which loads a new snapshot once more.
+    def _rescan(self):
+        previous = self._snapshot
+        scanned = time.time()
+        old_mtimes = _settled_mtimes(previous.mtimes, previous.scanned)
+        mtimes = dict()
+        relisted = []
+        # use root instead of the actual filename to
+        # not needlessly reveal the location of the files on disk
+        data = _crawl(self.archive_base, 'root', threads=self.crawl_threads, shard_depth=self.crawl_depth,
+                      previous=previous.data, old_mtimes=old_mtimes, mtimes=mtimes, relisted=relisted)
+
+        LOGGER.info("scanned %d directories in `%s`, %d of them changed", len(mtimes), self.archive_base,
+                    len(relisted))
+
+        if not relisted and previous.generation > 0:
+            return False
+
+        self._load(data=data, mtimes=mtimes, scanned=scanned)
+        return True
+
+    def _load(self, **kwargs):
+        # swap in the new tree in one go, so readers never see a partially updated tree
+        self._snapshot = _Snapshot(self._snapshot.generation + 1, **kwargs)
+
+    # Rescan the archive in a background thread, every `interval` seconds and/or when `signal_name`
+    # (for example SIGUSR2) is received. Signal handlers can only be installed from the main thread.
+    def start_refresher(self, interval=0, signal_name=None):
+        if self._refresher is not None:
+            return
+
+        self._refresher_args = (interval, signal_name)
+        if signal_name and threading.current_thread() is threading.main_thread():
+            signal.signal(getattr(signal, signal_name), lambda signum, frame: self.request_refresh())
+        elif signal_name:
+            LOGGER.warning("cannot refresh the cmip meta data on %s, the data finder was not created in the main "
+                           "thread", signal_name)
+
+        self._refresher = threading.Thread(target=self._refresh_loop, args=(interval, ), name='DataFinderRefresher',
+                                           daemon=True)
+        self._refresher.start()
+        LOGGER.info("started background refresh of the cmip meta data (interval=%ss, signal=%s)", interval,
+                    signal_name)
 
-                with open(self.cache_file, "w") as write_file:
-                    json.dump(self.data, write_file)
-                    LOGGER.debug("written meta data to '%s'", self.cache_file)
+    @staticmethod
+    def after_fork():
+        """Continue the background refresh of the instance in a forked process, threads do not survive a fork.
+
+        The parent keeps scanning the archive. With a cache file the forked process only reloads the cache when
+        the parent wrote a refreshed tree to it, without one it has to scan the archive itself.
+        """
+        instance = DataFinder.__instance
+        if instance is None or instance._refresher is None:
+            return
+        # the locks may have been held by the refresher of the parent
+        instance._refresh_lock = threading.Lock()
+        instance._refresh_requested = threading.Event()
+        instance._refresher = None
+        if instance.cache_file:
+            instance.follow_cache()
         else:
-            # use root instead of the actual filename to
-            # not needlessly reveal the location of the files on disk
-            self.data = _dir_entry(self.archive_base, 'root')
+            LOGGER.warning("every process rescans the archive for the background refresh, set "
+                           "CMIP_META_CACHE_FILE to scan it once")
+            instance.start_refresher(*instance._refresher_args)
+
+    # Reload the cache file in a background thread whenever another process replaced it, for processes forked
+    # from the process running the refresher
+    def follow_cache(self, interval=None):
+        if self._refresher is not None:
+            return
+
+        args = (_file_version(self.cache_file), interval or FOLLOW_INTERVAL)
+        self._refresher = threading.Thread(target=self._follow_loop, args=args, name='DataFinderFollower',
+                                           daemon=True)
+        self._refresher.start()
+        LOGGER.info("following the cmip meta cache `%s`", self.cache_file)
+
+    def _follow_loop(self, version, interval):
+        while True:
+            self._refresh_requested.wait(interval)
+            self._refresh_requested.clear()
+            current = _file_version(self.cache_file)
+            if current is None or current == version:
+                continue
+            try:
+                cached = _read_cache(self.cache_file, self.archive_base, self.cache_format)
+            except Exception:
+                LOGGER.exception("could not reload the cmip meta cache")
+                cached = None
+            if cached is not None:
+                self._load(**cached)
+            version = current
+
+    def request_refresh(self):
+        self._refresh_requested.set()
+
+    def _refresh_loop(self, interval):
+        while True:
+            self._refresh_requested.wait(interval if interval > 0 else None)
+            self._refresh_requested.clear()
+            try:
+                self.refresh()
+            except Exception:
+                LOGGER.exception("background refresh of the cmip meta data failed")
 
     # Obtain a pruned tree with models/experiments/ensembles containing the required variables and frequency only
     # Note, it cannot handle variables in multiple realms as of yet
+    # The tree is built bottom-up from the matching groups of the index, which are in tree order, so only the
+    # surviving branches are created and the full tree is never copied.
     def get_pruned_tree(self, required_variables=[], required_frequency='mon'):
-        result = copy.deepcopy(self.data)
-
-        for organization in _get_children_of(result):
-            for model in _get_children_of(organization):
-                for experiment in _get_children_of(model):
-                    for frequency in _get_children_of(experiment):
-                        if frequency['name'] == required_frequency:
-                            for mip in _get_children_of(frequency):
-                                for realm in _get_children_of(mip):
-                                    for ensemble in _get_children_of(realm):
-
-                                        available_variables = []
-                                        for variable in _get_children_of(ensemble):
-                                            available_variables.append(variable['name'])
-
-                                        LOGGER.debug('required_variables ' + str(required_variables))
-                                        LOGGER.debug('available variables ' + str(available_variables))
-
-                                        if not all(required_variable in available_variables
-                                                   for required_variable in required_variables):
-                                            # LOGGER.debug('removing %s from %s' %(ensemble, model))
-                                            realm['contents'].remove(ensemble)
-                                        else:
-                                            # remove unneeded information for the tree to reduce size
-                                            del ensemble['contents']
-
-                                    if not _has_chilren(realm):
-                                        mip['contents'].remove(realm)
-                                if not _has_chilren(mip):
-                                    frequency['contents'].remove(mip)
-                            if not _has_chilren(frequency):
-                                experiment['contents'].remove(frequency)
-                        else:
-                            experiment['contents'].remove(frequency)
-                    if not _has_chilren(experiment):
-                        model['contents'].remove(experiment)
-                if not _has_chilren(model):
-                    organization['contents'].remove(model)
-            if not _has_chilren(organization):
-                result['contents'].remove(organization)
+        snapshot = self._snapshot
+        data = snapshot.data
+        index = snapshot.index
+
+        result = dict()
+        result['name'] = data['name']
+        if 'contents' in data:
+            result['contents'] = []
+
+        columns = [index.columns[facet] for facet in GROUP_FACETS]
+        values = [index.values[facet] for facet in GROUP_FACETS]
+        nodes = dict()
+
+        for group in sorted(index.find_groups(required_variables=required_variables,
+                                              required_frequency=required_frequency)):
+            path = tuple(column[group] for column in columns)
+            parent = result
+            for depth in range(len(path)):
+                node = nodes.get(path[:depth + 1])
+                if node is None:
+                    node = nodes[path[:depth + 1]] = {'name': values[depth][path[depth]]}
+                    # the ensembles are leaves, their variables are not needed in the tree
+                    if depth + 1 < len(path):
+                        node['contents'] = []
+                    parent['contents'].append(node)
+                parent = node
+
         return result
 
     # Obtain a list of all valid models, experiments, and esemble members for the wps.
+    # Many processes ask the same question, so the answers are cached until new data is loaded.
     def get_model_experiment_ensemble(self, required_variables=[], required_frequency='mon', exclude_historical=False):
-        models = set()
-        experiments = set()
-        ensembles = set()
-
-        for organization in _get_children_of(self.data):
-            for model in _get_children_of(organization):
-                for experiment in _get_children_of(model):
-                    if not (experiment['name'] == 'historical' and exclude_historical):
-                        for frequency in _get_children_of(experiment):
-                            if frequency['name'] == required_frequency:
-                                for mip in _get_children_of(frequency):
-                                    for realm in _get_children_of(mip):
-                                        for ensemble in _get_children_of(realm):
-                                            available_variables = []
-                                            for variable in _get_children_of(ensemble):
-                                                available_variables.append(variable['name'])
-
-                                            LOGGER.debug('required_variables ' + str(required_variables))
-                                            LOGGER.debug('available variables ' + str(available_variables))
-
-                                            if all(required_variable in available_variables
-                                                   for required_variable in required_variables):
-                                                models.add(model['name'])
-                                                experiments.add(experiment['name'])
-                                                ensembles.add(ensemble['name'])
+        snapshot = self._snapshot
+        key = (frozenset(required_variables), required_frequency, bool(exclude_historical))
+
+        result = snapshot.query_cache.get(key)
+        if result is None:
+            result = self._find_model_experiment_ensemble(snapshot.index,
+                                                          required_variables=required_variables,
+                                                          required_frequency=required_frequency,
+                                                          exclude_historical=exclude_historical)
+            snapshot.query_cache[key] = result
+
+        # return copies, callers are free to modify their lists
+        return tuple(list(values) for values in result)
+
+    @staticmethod
+    def _find_model_experiment_ensemble(index, required_variables=[], required_frequency='mon',
+                                        exclude_historical=False):
+        groups = index.find_groups(required_variables=required_variables,
+                                   required_frequency=required_frequency,
+                                   exclude_historical=exclude_historical)
+
+        models = index.facet_values('model', groups)
+        experiments = index.facet_values('experiment', groups)
+        ensembles = index.facet_values('ensemble', groups)
 
         return (list(models), list(experiments), list(ensembles))
 
+    # Fingerprint of the directories of the (model, experiment, ensemble) `datasets`. The directories are taken
+    # from the snapshot, but their mtimes are read from disk, so data added or replaced since the last scan
+    # changes the fingerprint also when the snapshot is not refreshed: new files, versions and variables change
+    # the mtime of the directory they are added to.
+    def dataset_fingerprint(self, datasets):
+        wanted = set(tuple(dataset) for dataset in datasets)
+
+        found = []
+        for relpath in self._snapshot.mtimes:
+            parts = relpath.split(os.sep)
+            if len(parts) > 6 and (parts[1], parts[2], parts[6]) in wanted:
+                try:
+                    mtime = os.stat(os.path.join(self.archive_base, relpath)).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                found.append((relpath, mtime))
+
+        digest = hashlib.sha1()
+        for relpath, mtime in sorted(found):
+            digest.update('{}={}\n'.format(relpath, mtime).encode('utf-8'))
+        return digest.hexdigest()
+
 
 if __name__ == "__main__":
     logging.basicConfig(level="DEBUG")
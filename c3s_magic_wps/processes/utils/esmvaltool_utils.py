@@ -2,6 +2,8 @@ import json
 import logging
 import os
 import re
+import threading
+from contextlib import contextmanager
 
 from pywps import (FORMATS, ComplexInput, ComplexOutput, Format, LiteralInput, LiteralOutput, Process)
 from pywps.app.Common import Metadata
@@ -15,6 +17,19 @@ from .data_finder import DataFinder
 
 LOGGER = logging.getLogger("PYWPS")
 
+_describing = threading.local()
+
+
+# Within this context processes are constructed without looking up the available model data,
+# to obtain a cheap description of the process (see processes.registry.LazyProcess)
+@contextmanager
+def describe_only():
+    _describing.active = True
+    try:
+        yield
+    finally:
+        _describing.active = False
+
 
 def year_ranges(start_end_defaults, start_name='start_year', end_name='end_year', start_year=1850, end_year=2100):
     default_start_year, default_end_year = start_end_defaults
@@ -124,6 +139,16 @@ def region(default_start_longitude=0, default_end_longitude=360, default_start_l
     ]
 
 
+def default_inputs():
+    return (LiteralInput('use_cache',
+                         'Use cached result',
+                         abstract=('Reuse the result of an earlier identical run if available.'
+                                   ' Set to false to always run the diagnostic.'),
+                         data_type='boolean',
+                         default=True,
+                         min_occurs=0), )
+
+
 def default_outputs():
     return (
         LiteralOutput('success',
@@ -179,11 +204,14 @@ def model_experiment_ensemble(model: str,
     # if not hasattr(model_experiment_ensemble, 'available_models'):
     #     parse_model_lists()
 
-    finder = DataFinder.get_instance()
-    available_models, available_experiments, available_ensembles = finder.get_model_experiment_ensemble(
-        required_variables=required_variables,
-        required_frequency=required_frequency,
-        exclude_historical=exclude_historical)
+    if getattr(_describing, 'active', False):
+        available_models, available_experiments, available_ensembles = [], [], []
+    else:
+        finder = DataFinder.get_instance()
+        available_models, available_experiments, available_ensembles = finder.get_model_experiment_ensemble(
+            required_variables=required_variables,
+            required_frequency=required_frequency,
+            exclude_historical=exclude_historical)
 
     available_models = sorted(available_models, key=str.lower)
     available_experiments = sorted(available_experiments)
@@ -0,0 +1,120 @@
+from array import array
+
+import logging
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Facets of the CMIP5 DRS down to the ensemble level, in the order of the directory tree.
+# Each combination of these facets is called a group, the variables are stored per group.
+GROUP_FACETS = ('institute', 'model', 'experiment', 'frequency', 'mip', 'realm', 'ensemble')
+
+FACETS = GROUP_FACETS + ('variable', )
+
+
+class FacetIndex():
+    """Flat, columnar index of the datasets in a DataFinder tree.
+
+    Every facet value is interned as an integer code (its position in `values[facet]`). The
+    groups (one per ensemble directory, in tree order) are stored as one array of codes per
+    group facet, the variables as two arrays: the group a row belongs to and its variable code.
+    Queries are answered with set operations on lazily built postings (code -> set of groups)
+    instead of walking the nested tree.
+    """
+
+    def __init__(self, values, columns, variable_group, variable_code):
+        self.values = values
+        self.columns = columns
+        self.variable_group = variable_group
+        self.variable_code = variable_code
+
+        self._codes = {facet: {value: code for code, value in enumerate(values[facet])} for facet in FACETS}
+        self._postings = dict()
+
+    @staticmethod
+    def from_tree(tree):
+        values = {facet: [] for facet in FACETS}
+        codes = {facet: dict() for facet in FACETS}
+        columns = {facet: array('i') for facet in GROUP_FACETS}
+        variable_group = array('i')
+        variable_code = array('i')
+
+        def intern(facet, value):
+            code = codes[facet].get(value)
+            if code is None:
+                code = codes[facet][value] = len(values[facet])
+                values[facet].append(value)
+            return code
+
+        def add_groups(node, path):
+            depth = len(path)
+            for child in node.get('contents', []):
+                child_path = path + (intern(GROUP_FACETS[depth], child['name']), )
+                if depth + 1 < len(GROUP_FACETS):
+                    add_groups(child, child_path)
+                    continue
+
+                group = len(columns['ensemble'])
+                for facet, code in zip(GROUP_FACETS, child_path):
+                    columns[facet].append(code)
+                for variable in child.get('contents', []):
+                    variable_group.append(group)
+                    variable_code.append(intern('variable', variable['name']))
+
+        add_groups(tree, ())
+
+        index = FacetIndex(values, columns, variable_group, variable_code)
+        LOGGER.debug("indexed %d variables in %d groups", len(index), index.group_count())
+        return index
+
+    def __len__(self):
+        return len(self.variable_code)
+
+    def group_count(self):
+        return len(self.columns['ensemble'])
+
+    def code(self, facet, value):
+        return self._codes[facet].get(value)
+
+    def postings(self, facet):
+        """Mapping of the codes of a facet to the set of groups with that value."""
+        postings = self._postings.get(facet)
+        if postings is None:
+            postings = dict()
+            if facet == 'variable':
+                pairs = zip(self.variable_code, self.variable_group)
+            else:
+                pairs = zip(self.columns[facet], range(self.group_count()))
+            for code, group in pairs:
+                postings.setdefault(code, set()).add(group)
+            self._postings[facet] = postings
+        return postings
+
+    def _groups_with(self, facet, value):
+        code = self.code(facet, value)
+        if code is None:
+            return set()
+        return self.postings(facet).get(code, set())
+
+    def find_groups(self, required_variables=[], required_frequency='mon', exclude_historical=False):
+        """Set of groups at the required frequency that contain all required variables."""
+        groups = set(self._groups_with('frequency', required_frequency))
+
+        for variable in set(required_variables):
+            if not groups:
+                break
+            groups &= self._groups_with('variable', variable)
+
+        if exclude_historical:
+            groups -= self._groups_with('experiment', 'historical')
+
+        return groups
+
+    def facet_values(self, facet, groups):
+        """Set of the values of a group facet in the given groups."""
+        column = self.columns[facet]
+        values = self.values[facet]
+        return {values[code] for code in {column[group] for group in groups}}
+
+    def group_path(self, group):
+        """Names of the directories from institute down to the ensemble of a group."""
+        return tuple(self.values[facet][self.columns[facet][group]] for facet in GROUP_FACETS)
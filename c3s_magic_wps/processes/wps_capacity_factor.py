@@ -5,7 +5,7 @@ from pywps import FORMATS, ComplexInput, ComplexOutput, Format, LiteralInput, Li
 from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
-from .utils import (default_outputs, model_experiment_ensemble, year_ranges,
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, year_ranges,
                     region, outputs_from_plot_names, check_constraints)
 
 from .. import runner, util
@@ -35,6 +35,7 @@ class CapacityFactor(Process):
                 allowed_values=['DJF', 'MAM', 'JJA', 'SON'],
                 default='DJF',
             ),
+            *default_inputs(),
         ]
         self.plotlist = []
         outputs = [
@@ -113,7 +114,11 @@ class CapacityFactor(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -137,9 +142,10 @@ class CapacityFactor(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'capacity_factor_result.zip'))
+            os.path.join(self.workdir, 'capacity_factor_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
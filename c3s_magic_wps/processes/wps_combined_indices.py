@@ -7,7 +7,8 @@ from pywps.response.status import WPS_STATUS
 from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
-from .utils import (default_outputs, model_experiment_ensemble, year_ranges, outputs_from_plot_names, check_constraints)
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, year_ranges, outputs_from_plot_names,
+                    check_constraints)
 
 from .. import runner, util
 
@@ -59,6 +60,7 @@ class CombinedIndices(Process):
                          abstract='Boolean indictating if standardization should be computed.',
                          data_type='boolean',
                          default=True),
+            *default_inputs(),
         ]
         outputs = [
             ComplexOutput('plot',
@@ -135,7 +137,11 @@ class CombinedIndices(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -160,9 +166,10 @@ class CombinedIndices(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'combined_indices_result.zip'))
+            os.path.join(self.workdir, 'combined_indices_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
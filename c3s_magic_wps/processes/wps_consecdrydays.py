@@ -5,7 +5,8 @@ from pywps import FORMATS, ComplexOutput, Format, LiteralInput, Process
 from pywps.app.Common import Metadata
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges, check_constraints)
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+                    check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
 
@@ -35,6 +36,7 @@ class ConsecDryDays(Process):
                          data_type='string',
                          allowed_values=['0.5', '1', '2'],
                          default='1'),
+            *default_inputs(),
         ]
         self.plotlist = [
             ('dryfreq', [Format('image/png')]),
@@ -116,7 +118,11 @@ class ConsecDryDays(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -140,9 +146,10 @@ class ConsecDryDays(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'consecdrydays_result.zip'))
+            os.path.join(self.workdir, 'consecdrydays_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -6,7 +6,7 @@ from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import default_outputs, model_experiment_ensemble, year_ranges, check_constraints
+from .utils import default_inputs, default_outputs, model_experiment_ensemble, year_ranges, check_constraints
 
 LOGGER = logging.getLogger("PYWPS")
 
@@ -22,6 +22,7 @@ class CVDP(Process):
                                        required_variables=self.variables,
                                        required_frequency=self.frequency),
             *year_ranges((1850, 2005)),
+            *default_inputs(),
         ]
         outputs = [
             ComplexOutput('tas_trend_ann_plot',
@@ -95,6 +96,7 @@ class CVDP(Process):
             start_year=request.inputs['start_year'][0].data,
             end_year=request.inputs['end_year'][0].data,
             output_format='png',
+            parallel_tasks_hint=len(self.variables),
         )
 
         # recipe output
@@ -103,7 +105,11 @@ class CVDP(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -127,9 +133,10 @@ class CVDP(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'cvdp_result.zip'))
+            os.path.join(self.workdir, 'cvdp_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -6,7 +6,8 @@ from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges, check_constraints
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+                    check_constraints)
 from .utils import historic_projection_year_ranges, region
 
 LOGGER = logging.getLogger("PYWPS")
@@ -26,7 +27,8 @@ class DiurnalTemperatureIndex(Process):
                                        required_frequency=self.frequency,
                                        exclude_historical=True),
             *historic_projection_year_ranges(1990, 2000, 2070, 2080),
-            *region(-10, 40, 27, 70)
+            *region(-10, 40, 27, 70),
+            *default_inputs(),
         ]
         self.plotlist = []
         outputs = [
@@ -106,7 +108,11 @@ class DiurnalTemperatureIndex(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -131,9 +137,10 @@ class DiurnalTemperatureIndex(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'diurnal_temperature_result.zip'))
+            os.path.join(self.workdir, 'diurnal_temperature_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
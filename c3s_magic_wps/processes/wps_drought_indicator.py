@@ -6,7 +6,8 @@ from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges, check_constraints
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+                    check_constraints)
 from .utils import reference_year_ranges
 
 LOGGER = logging.getLogger("PYWPS")
@@ -33,6 +34,7 @@ class DroughtIndicator(Process):
                          min_occurs=1,
                          max_occurs=1),
             *year_ranges((1990, 1999), start_year=1979, end_year=2018),
+            *default_inputs(),
         ]
         self.plotlist = []
         outputs = [
@@ -131,7 +133,11 @@ class DroughtIndicator(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -156,9 +162,10 @@ class DroughtIndicator(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'drought_indicator_result.zip'))
+            os.path.join(self.workdir, 'drought_indicator_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -9,7 +9,7 @@ from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
 from .. import runner, util
 
-from .utils import default_outputs, model_experiment_ensemble, year_ranges, check_constraints
+from .utils import default_inputs, default_outputs, model_experiment_ensemble, year_ranges, check_constraints
 
 LOGGER = logging.getLogger("PYWPS")
 
@@ -84,6 +84,7 @@ class EnsClus(Process):
                 default='0',
                 allowed_values=AllowedValue(allowed_type=ALLOWEDVALUETYPE.RANGE, minval=0, maxval=1000),
             ),
+            *default_inputs(),
         ]
         outputs = [
             ComplexOutput('plot',
@@ -183,7 +184,11 @@ class EnsClus(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         # log output
         response.outputs['log'].output_format = FORMATS.TEXT
@@ -207,9 +212,10 @@ class EnsClus(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'ensemble_clustering_result.zip'))
+            os.path.join(self.workdir, 'ensemble_clustering_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -221,28 +227,33 @@ class EnsClus(Process):
         response.outputs['plot'].file = runner.get_output(result['plot_dir'],
                                                           path_filter=os.path.join('EnsClus', 'main'),
                                                           name_filter="anomalies*",
-                                                          output_format="png")
+                                                          output_format="png",
+                                                          projects=util.MAGIC_PROJECT)
 
         response.outputs['ens_extreme'].output_format = FORMATS.NETCDF
         response.outputs['ens_extreme'].file = runner.get_output(result['work_dir'],
                                                                  path_filter=os.path.join('EnsClus', 'main'),
                                                                  name_filter="ens_extreme*",
-                                                                 output_format="nc")
+                                                                 output_format="nc",
+                                                                 projects=util.MAGIC_PROJECT)
 
         response.outputs['ens_climatologies'].output_format = FORMATS.NETCDF
         response.outputs['ens_climatologies'].file = runner.get_output(result['work_dir'],
                                                                        path_filter=os.path.join('EnsClus', 'main'),
-                                                                       name_filter="ens_anomalies*",
-                                                                       output_format="nc")
+                                                                       name_filter="ens_climatologies*",
+                                                                       output_format="nc",
+                                                                       projects=util.MAGIC_PROJECT)
 
         response.outputs['ens_anomalies'].output_format = FORMATS.NETCDF
         response.outputs['ens_anomalies'].file = runner.get_output(result['work_dir'],
                                                                    path_filter=os.path.join('EnsClus', 'main'),
                                                                    name_filter="ens_anomalies*",
-                                                                   output_format="nc")
+                                                                   output_format="nc",
+                                                                   projects=util.MAGIC_PROJECT)
 
         response.outputs['statistics'].output_format = FORMATS.TEXT
         response.outputs['statistics'].file = runner.get_output(result['work_dir'],
                                                                 path_filter=os.path.join('EnsClus', 'main'),
                                                                 name_filter="statistics*",
-                                                                output_format="txt")
+                                                                output_format="txt",
+                                                                projects=util.MAGIC_PROJECT)
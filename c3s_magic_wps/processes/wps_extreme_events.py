@@ -6,7 +6,8 @@ from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges, check_constraints
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+                    check_constraints)
 from .utils import reference_year_ranges
 
 LOGGER = logging.getLogger("PYWPS")
@@ -26,6 +27,7 @@ class ExtremeEvents(Process):
                          min_occurs=1,
                          max_occurs=1),
             *reference_year_ranges(1980, 1989),
+            *default_inputs(),
         ]
 
         self.plotlist = [
@@ -117,7 +119,11 @@ class ExtremeEvents(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -141,9 +147,10 @@ class ExtremeEvents(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'extreme_events_result.zip'))
+            os.path.join(self.workdir, 'extreme_events_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
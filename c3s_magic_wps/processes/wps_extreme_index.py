@@ -7,8 +7,9 @@ from pywps.response.status import WPS_STATUS
 from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
-from .utils import (default_outputs, model_experiment_ensemble, year_ranges, historic_projection_year_ranges, region,
-                    outputs_from_plot_names, outputs_from_data_names, check_constraints)
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, year_ranges,
+                    historic_projection_year_ranges, region, outputs_from_plot_names, outputs_from_data_names,
+                    check_constraints)
 
 from .. import runner, util
 
@@ -35,7 +36,8 @@ class ExtremeIndex(Process):
                          data_type='integer',
                          allowed_values=AllowedValue(allowed_type=ALLOWEDVALUETYPE.RANGE, minval=1, maxval=365),
                          default=5),
-            *region(-60, 40, 30, 70)
+            *region(-60, 40, 30, 70),
+            *default_inputs(),
         ]
         self.plotlist = [
             ('t10p', [Format('image/png')]),
@@ -126,7 +128,11 @@ class ExtremeIndex(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -151,9 +157,10 @@ class ExtremeIndex(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'extreme_index_result.zip'))
+            os.path.join(self.workdir, 'extreme_index_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
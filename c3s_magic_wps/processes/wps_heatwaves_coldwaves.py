@@ -7,7 +7,7 @@ from pywps.response.status import WPS_STATUS
 from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
-from .utils import (default_outputs, model_experiment_ensemble, year_ranges, outputs_from_plot_names,
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, year_ranges, outputs_from_plot_names,
                     historic_projection_year_ranges, check_constraints)
 
 from .. import runner, util
@@ -53,6 +53,7 @@ class HeatwavesColdwaves(Process):
                          data_type='string',
                          allowed_values=['summer', 'winter'],
                          default='winter'),
+            *default_inputs(),
         ]
         outputs = [
             ComplexOutput('plot',
@@ -142,7 +143,11 @@ class HeatwavesColdwaves(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -167,9 +172,10 @@ class HeatwavesColdwaves(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'heatwaves_coldwaves_result.zip'))
+            os.path.join(self.workdir, 'heatwaves_coldwaves_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
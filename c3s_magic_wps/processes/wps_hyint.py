@@ -8,7 +8,8 @@ from pywps.app.exceptions import ProcessError
 from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
-from .utils import default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges, check_constraints
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+                    check_constraints)
 
 from .. import runner, util
 
@@ -80,6 +81,7 @@ class HyInt(Process):
                 default=1999,
                 allowed_values=AllowedValue(allowed_type=ALLOWEDVALUETYPE.RANGE, minval=1850, maxval=2100)
             ),
+            *default_inputs(),
         ]
 
         outputs = [
@@ -190,7 +192,11 @@ class HyInt(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -214,9 +220,10 @@ class HyInt(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'hyint_result.zip'))
+            os.path.join(self.workdir, 'hyint_result.zip'),
+            response=response)
         response.update_status("done.", 100)
         return response
 
@@ -227,39 +234,47 @@ class HyInt(Process):
         response.outputs['plot1'].file = runner.get_output(result['plot_dir'],
                                                            path_filter=os.path.join('hyint', 'main'),
                                                            name_filter="*_??_map",
-                                                           output_format="png")
+                                                           output_format="png",
+                                                           projects=util.MAGIC_PROJECT)
         response.outputs['plot2'].output_format = Format('image/png')
         response.outputs['plot2'].file = runner.get_output(result['plot_dir'],
                                                            path_filter=os.path.join('hyint', 'main'),
                                                            name_filter="*comp_map",
-                                                           output_format="png")
+                                                           output_format="png",
+                                                           projects=util.MAGIC_PROJECT)
         response.outputs['plot3'].output_format = Format('image/png')
         response.outputs['plot3'].file = runner.get_output(result['plot_dir'],
                                                            path_filter=os.path.join('hyint', 'main'),
                                                            name_filter="multiindex*_map",
-                                                           output_format="png")
+                                                           output_format="png",
+                                                           projects=util.MAGIC_PROJECT)
         response.outputs['plot12'].output_format = Format('image/png')
         response.outputs['plot12'].file = runner.get_output(result['plot_dir'],
                                                             path_filter=os.path.join('hyint', 'main'),
                                                             name_filter="*multiregion_timeseries*",
-                                                            output_format="png")
+                                                            output_format="png",
+                                                            projects=util.MAGIC_PROJECT)
         response.outputs['plot13'].output_format = Format('image/png')
         response.outputs['plot13'].file = runner.get_output(result['plot_dir'],
                                                             path_filter=os.path.join('hyint', 'main'),
                                                             name_filter="*_multimodel*_timeseries*",
-                                                            output_format="png")
+                                                            output_format="png",
+                                                            projects=util.MAGIC_PROJECT)
         response.outputs['plot14'].output_format = Format('image/png')
         response.outputs['plot14'].file = runner.get_output(result['plot_dir'],
                                                             path_filter=os.path.join('hyint', 'main'),
                                                             name_filter="*multiregion_trend_summary*",
-                                                            output_format="png")
+                                                            output_format="png",
+                                                            projects=util.MAGIC_PROJECT)
         response.outputs['plot15'].output_format = Format('image/png')
         response.outputs['plot15'].file = runner.get_output(result['plot_dir'],
                                                             path_filter=os.path.join('hyint', 'main'),
                                                             name_filter="*_multimodel*_trend_summary*",
-                                                            output_format="png")
+                                                            output_format="png",
+                                                            projects=util.MAGIC_PROJECT)
         response.outputs['model'].output_format = FORMATS.NETCDF
         response.outputs['model'].file = runner.get_output(result['work_dir'],
                                                            path_filter=os.path.join('hyint', 'main'),
                                                            name_filter="hyint_{}*_ALL".format(models[0]),
-                                                           output_format="nc")
+                                                           output_format="nc",
+                                                           projects=util.MAGIC_PROJECT)
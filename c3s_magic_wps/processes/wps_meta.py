@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import json
+import threading
 
 from pywps import Process, LiteralInput, LiteralOutput, ComplexOutput, Format
 from pywps.app.Common import Metadata
@@ -11,6 +13,56 @@ from .. import processes
 LOGGER = logging.getLogger("PYWPS")
 
 
+class ResponseCache():
+    """Serialized drs trees per process identifier, valid for a single generation of the DataFinder data.
+
+    Every entry is a tuple of the JSON document and its ETag. All entries are dropped as soon as
+    the DataFinder loads new data, until then repeated requests are a dictionary lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._responses = dict()
+
+    def get(self, finder, process_identifier):
+        with self._lock:
+            if self._generation != finder.generation:
+                self._generation = finder.generation
+                self._responses = dict()
+            responses = self._responses
+
+        response = responses.get(process_identifier)
+        if response is None:
+            drs = json.dumps(self._build_tree(finder, process_identifier))
+            response = responses[process_identifier] = (drs, hashlib.sha1(drs.encode('utf-8')).hexdigest())
+        return response
+
+    @staticmethod
+    def _build_tree(finder, process_identifier):
+        if not process_identifier:
+            LOGGER.info("Process identifier not specified, returning entire tree")
+            return finder.data
+
+        LOGGER.info('Getting process inputs for: %s' % process_identifier)
+
+        process = next((process for process in processes.processes if process.identifier == process_identifier), None)
+
+        if not process:
+            raise Exception("Cannot find process with identifier %s" % process_identifier)
+
+        LOGGER.debug('Process object: %s' % process)
+
+        # default to any model with monthly values for some variable
+        required_variables = process.variables or []
+        required_frequency = process.frequency or 'mon'
+
+        return finder.get_pruned_tree(required_variables=required_variables, required_frequency=required_frequency)
+
+
+response_cache = ResponseCache()
+
+
 class Meta(Process):
     def __init__(self):
         inputs = [
@@ -20,13 +72,25 @@ class Meta(Process):
                          default='',
                          data_type='string',
                          min_occurs=0,
+                         max_occurs=1),
+            LiteralInput('etag',
+                         'ETag of a previously returned tree',
+                         abstract=('ETag returned with a previous response. If the tree did not change since, '
+                                   'the drs output is null instead of the full tree.'),
+                         default='',
+                         data_type='string',
+                         min_occurs=0,
                          max_occurs=1)
         ]
         outputs = [
             ComplexOutput('drs',
                           'CMIP DRS Tree for available data',
                           supported_formats=[Format('application/json')],
-                          as_reference=False)
+                          as_reference=False),
+            LiteralOutput('etag',
+                          'ETag of the tree',
+                          abstract='ETag of the returned tree, can be used to revalidate it with a next request.',
+                          data_type='string')
         ]
 
         super(Meta, self).__init__(
@@ -50,27 +114,15 @@ class Meta(Process):
         finder = DataFinder.get_instance()
 
         process_identifier = request.inputs['process'][0].data
+        etag = request.inputs['etag'][0].data if 'etag' in request.inputs else ''
 
-        if not process_identifier:
-            LOGGER.info("Process identifier not specified, returning entire tree")
-            response.outputs['drs'].data = json.dumps(finder.data)
-
-            return response
-
-        LOGGER.info('Getting process inputs for: %s' % process_identifier)
-
-        process = next((process for process in processes.processes if process.identifier == process_identifier), None)
-
-        if not process:
-            raise Exception("Cannot find process with identifier %s" % process_identifier)
+        drs, current_etag = response_cache.get(finder, process_identifier)
 
-        LOGGER.debug('Process object: %s' % process)
-
-        # default to any model with monthly values for some variable
-        required_variables = process.variables or []
-        required_frequency = process.frequency or 'mon'
+        if etag and etag == current_etag:
+            LOGGER.debug('Tree for `%s` not modified', process_identifier)
+            drs = json.dumps(None)
 
-        response.outputs['drs'].data = json.dumps(
-            finder.get_pruned_tree(required_variables=required_variables, required_frequency=required_frequency))
+        response.outputs['drs'].data = drs
+        response.outputs['etag'].data = current_etag
 
         return response
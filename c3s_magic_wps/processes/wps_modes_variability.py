@@ -5,7 +5,8 @@ from pywps import FORMATS, ComplexInput, ComplexOutput, Format, LiteralInput, Li
 from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
-from .utils import default_outputs, model_experiment_ensemble, year_ranges, outputs_from_plot_names, check_constraints
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, year_ranges, outputs_from_plot_names,
+                    check_constraints)
 
 from .. import runner, util
 
@@ -79,6 +80,7 @@ class ModesVariability(Process):
                     'DJF'  # 'MAM' <- does not work yet
                 ],
                 default='JJA'),
+            *default_inputs(),
         ]
         self.plotlist = [
             ('Table_psl', [Format('image/png')]),
@@ -176,7 +178,11 @@ class ModesVariability(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -201,9 +207,10 @@ class ModesVariability(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'modes_of_variability_result.zip'))
+            os.path.join(self.workdir, 'modes_of_variability_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -7,7 +7,7 @@ from pywps.response.status import WPS_STATUS
 from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_plot_names,
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names,
                     check_constraints, historic_projection_year_ranges)
 
 from .. import runner, util
@@ -67,6 +67,7 @@ class MultimodelProducts(Process):
                          data_type='string',
                          allowed_values=['single', 'maxmin'],
                          default='single'),
+            *default_inputs(),
         ]
         self.plotlist = [
             ('tas', [Format('image/png')]),
@@ -152,7 +153,11 @@ class MultimodelProducts(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -177,9 +182,10 @@ class MultimodelProducts(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'multimodel_products_result.zip'))
+            os.path.join(self.workdir, 'multimodel_products_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -7,8 +7,8 @@ from pywps.inout.literaltypes import make_allowedvalues
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_data_names, outputs_from_plot_names,
-                    year_ranges, check_constraints)
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_data_names,
+                    outputs_from_plot_names, year_ranges, check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
 
@@ -18,7 +18,7 @@ class Perfmetrics(Process):
         self.variables = ['ta', 'ua', 'va', 'zg', 'hus', 'tas', 'ts', 'pr', 'clt', 'rlut', 'rsut']
         self.frequency = 'mon'
 
-        inputs = []
+        inputs = [*default_inputs()]
         outputs = [
             ComplexOutput('rmsd',
                           'RMSD metric',
@@ -65,7 +65,8 @@ class Perfmetrics(Process):
         response.update_status("generate recipe ...", 10)
         recipe_file, config_file = runner.generate_recipe(workdir=self.workdir,
                                                           diag='perfmetrics_CMIP5',
-                                                          output_format='png')
+                                                          output_format='png',
+                                                          parallel_tasks_hint=len(self.variables))
 
         # recipe output
         response.outputs['recipe'].output_format = FORMATS.TEXT
@@ -73,7 +74,12 @@ class Perfmetrics(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file, skip_nonexistent=True)
+        result = runner.run(recipe_file,
+                            config_file,
+                            skip_nonexistent=True,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -98,9 +104,10 @@ class Perfmetrics(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'perfmetrics_result.zip'))
+            os.path.join(self.workdir, 'perfmetrics_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -9,8 +9,8 @@ from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_data_names, outputs_from_plot_names,
-                    year_ranges, check_constraints)
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_data_names,
+                    outputs_from_plot_names, year_ranges, check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
 
@@ -42,6 +42,7 @@ class PreprocessExample(Process):
                 data_type='float',
                 allowed_values=AllowedValue(allowed_type=ALLOWEDVALUETYPE.RANGE, minval=0.0, maxval=110000.0),
                 default=85000.0),
+            *default_inputs(),
         ]
         self.plotlist = [
             ('multi_model_mean_ta', [Format('image/png')]),
@@ -136,7 +137,11 @@ class PreprocessExample(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -161,9 +166,10 @@ class PreprocessExample(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'preproc_result.zip'))
+            os.path.join(self.workdir, 'preproc_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -8,7 +8,7 @@ from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
                     reference_year_ranges, check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
@@ -41,6 +41,7 @@ class QuantileBias(Process):
                          data_type='integer',
                          allowed_values=AllowedValue(allowed_type=ALLOWEDVALUETYPE.RANGE, minval=0, maxval=100),
                          default=75),
+            *default_inputs(),
         ]
 
         outputs = [
@@ -117,7 +118,11 @@ class QuantileBias(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -141,9 +146,10 @@ class QuantileBias(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'quantilebias_result.zip'))
+            os.path.join(self.workdir, 'quantilebias_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -8,7 +8,7 @@ from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_data_names,
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_data_names,
                     outputs_from_plot_names, year_ranges, region, check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
@@ -87,6 +87,7 @@ class RainFARM(Process):
                 allowed_values=['true', 'false'],
                 default='true',
             ),
+            *default_inputs(),
         ]
 
         self.datalist = [
@@ -178,7 +179,11 @@ class RainFARM(Process):
         response.update_status("running diagnostic (this could take a while)...", 20)
         # Disable HDF5 library version mismatched error for rainfarm metric
         os.environ["HDF5_DISABLE_VERSION_CHECK"] = "1"
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
         del os.environ["HDF5_DISABLE_VERSION_CHECK"]
 
         response.outputs['success'].data = result['success']
@@ -204,9 +209,10 @@ class RainFARM(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'rainfarm_result.zip'))
+            os.path.join(self.workdir, 'rainfarm_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
@@ -7,7 +7,7 @@ from pywps.response.status import WPS_STATUS
 from pywps.inout.literaltypes import AllowedValue
 from pywps.validator.allowed_value import ALLOWEDVALUETYPE
 
-from .utils import (default_outputs, year_ranges, model_experiment_ensemble,
+from .utils import (default_inputs, default_outputs, year_ranges, model_experiment_ensemble,
                     outputs_from_plot_names, region, check_constraints)
 
 from .. import runner, util
@@ -50,6 +50,7 @@ class Toymodel(Process):
                 default=2,
                 allowed_values=AllowedValue(allowed_type=ALLOWEDVALUETYPE.RANGE, minval=1, maxval=1000),
             ),
+            *default_inputs(),
         ]
         # self.plotlist = [
         #     'TM90', 'NumberEvents', 'DurationEvents', 'LongBlockEvents', 'BlockEvents', 'ACN', 'CN', 'BI', 'MGI',
@@ -137,7 +138,11 @@ class Toymodel(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -161,9 +166,10 @@ class Toymodel(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'toymodel_result.zip'))
+            os.path.join(self.workdir, 'toymodel_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
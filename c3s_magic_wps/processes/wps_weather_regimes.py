@@ -6,7 +6,7 @@ from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_plot_names,
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names,
                     year_ranges, reference_year_ranges, check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
@@ -43,6 +43,7 @@ class WeatherRegimes(Process):
             #              data_type='string',
             #              allowed_values=['4'],
             #              default='4'),
+            *default_inputs(),
         ]
         self.plotlist = [("Regime{}".format(i), [Format('image/png')]) for i in range(1, 5)]
         outputs = [
@@ -122,7 +123,11 @@ class WeatherRegimes(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -148,9 +153,10 @@ class WeatherRegimes(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'weather_regimes_result.zip'))
+            os.path.join(self.workdir, 'weather_regimes_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
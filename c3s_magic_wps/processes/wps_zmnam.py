@@ -6,7 +6,8 @@ from pywps.app.Common import Metadata
 from pywps.response.status import WPS_STATUS
 
 from .. import runner, util
-from .utils import (default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges, check_constraints)
+from .utils import (default_inputs, default_outputs, model_experiment_ensemble, outputs_from_plot_names, year_ranges,
+                    check_constraints)
 
 LOGGER = logging.getLogger("PYWPS")
 
@@ -23,6 +24,7 @@ class ZMNAM(Process):
                                        required_variables=self.variables,
                                        required_frequency=self.frequency),
             *year_ranges((1979, 2005)),
+            *default_inputs(),
         ]
         self.pressure_levels = [5000, 25000, 50000, 100000]
         self.plotlist = [("{}Pa_mo_reg".format(i), [Format('image/png')]) for i in self.pressure_levels]
@@ -108,7 +110,11 @@ class ZMNAM(Process):
 
         # run diag
         response.update_status("running diagnostic (this could take a while)...", 20)
-        result = runner.run(recipe_file, config_file)
+        result = runner.run(recipe_file,
+                            config_file,
+                            use_cache=request.inputs['use_cache'][0].data,
+                            identifier=self.identifier,
+                            response=response)
 
         response.outputs['success'].data = result['success']
 
@@ -132,9 +138,10 @@ class ZMNAM(Process):
         response.update_status("creating archive of diagnostic result ...", 90)
 
         response.outputs['archive'].output_format = Format('application/zip')
-        response.outputs['archive'].file = runner.compress_output(
+        runner.archive_output(
             os.path.join(self.workdir, 'output'),
-            os.path.join(self.workdir, 'zmnam_result.zip'))
+            os.path.join(self.workdir, 'zmnam_result.zip'),
+            response=response)
 
         response.update_status("done.", 100)
         return response
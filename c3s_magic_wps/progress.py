@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+import logging
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Status updates of a request while ESMValTool runs its recipe.
+#
+# ESMValTool writes the tasks it creates, starts and completes to main_log.txt in the run dir, also when the
+# recipe runs in a subprocess or in the worker pool, and from the processes running the tasks in parallel.
+# A thread follows the log and turns the completed and running tasks into the status percentage of the
+# request. Status updates are written at most once every few seconds, later ones replace earlier ones.
+
+LOG_FILE = 'main_log.txt'
+
+# Seconds between reads of the log, and least seconds between two status updates
+POLL_INTERVAL = 1
+UPDATE_INTERVAL = 5
+
+_CREATING = re.compile(r'Creating (preprocessor|diagnostic) task (\S+)')
+_RUNNING = re.compile(r'Running (\d+) tasks')
+_STARTING = re.compile(r'Starting task (\S+) in process')
+_COMPLETED = re.compile(r'Successfully completed task (\S+)(?: \(priority -?\d+\) in (\d+):(\d+):(\d+(?:\.\d+)?))?')
+
+
+class ProgressBridge():
+    """Reports the progress of an ESMValTool run to `response`, from `start` to `end` percent.
+
+    Lines of the ESMValTool log are passed to `feed`. Used as a context manager, the bridge follows the log
+    file of the run in a thread until the run is done.
+    """
+
+    def __init__(self, log_file, response, start=20, end=80, interval=UPDATE_INTERVAL):
+        self.log_file = log_file
+        self.response = response
+        self.start = start
+        self.end = end
+        self.interval = interval
+        self.kinds = dict()
+        self.total = None
+        self.running = []
+        self.completed = set()
+        # seconds the tasks of each kind ran
+        self.durations = defaultdict(float)
+        self.message = None
+        self._reported = None
+        self._last_update = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def feed(self, line):
+        """Update the progress from a line of the log, returns True if the line was an event of a task."""
+        match = _CREATING.search(line)
+        if match:
+            kind, task = match.groups()
+            self.kinds[task] = kind
+            self.message = "preparing {} task {}".format(kind, task)
+            return True
+        match = _RUNNING.search(line)
+        if match:
+            self.total = int(match.group(1))
+            self.message = "running {} tasks".format(self.total)
+            return True
+        match = _STARTING.search(line)
+        if match:
+            task = match.group(1)
+            if task not in self.running:
+                self.running.append(task)
+            self.message = self._task_message(task)
+            return True
+        match = _COMPLETED.search(line)
+        if match:
+            task, hours, minutes, seconds = match.groups()
+            if task in self.running:
+                self.running.remove(task)
+            self.completed.add(task)
+            if seconds is not None:
+                kind = self.kinds.get(task, 'preprocessor')
+                self.durations[kind] += int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            self.message = self._task_message(self.running[-1]) if self.running else self._done_message()
+            return True
+        return False
+
+    def _task_message(self, task):
+        if self.kinds.get(task) == 'diagnostic':
+            action = "running diagnostic script"
+        else:
+            action = "preprocessing"
+        return "{} {}, {}".format(action, task, self._done_message())
+
+    def _done_message(self):
+        if self.total:
+            return "{} of {} tasks done".format(len(self.completed), self.total)
+        return "{} tasks done".format(len(self.completed))
+
+    def percent(self):
+        """The status percentage of the run, running tasks count as half done."""
+        total = self.total or len(self.kinds)
+        if not total:
+            return self.start
+        done = min((len(self.completed) + 0.5 * len(self.running)) / total, 1)
+        return int(self.start + done * (self.end - self.start))
+
+    def report(self):
+        """Update the status of the request if the progress changed, at most once every `interval` seconds."""
+        if self.message is None:
+            return False
+        status = (self.message, self.percent())
+        now = time.time()
+        if status == self._reported or now - self._last_update < self.interval:
+            return False
+        self.response.update_status(*status)
+        self._reported = status
+        self._last_update = now
+        return True
+
+    def follow(self):
+        """Feed the lines written to the log file to the bridge until the bridge is exited."""
+        position = 0
+        buffered = ''
+        while True:
+            stopping = self._stop.is_set()
+            try:
+                with open(self.log_file, errors='replace') as fp:
+                    fp.seek(position)
+                    data = fp.read()
+                    position = fp.tell()
+            except FileNotFoundError:
+                data = ''
+            lines = (buffered + data).split('\n')
+            # the last line is not complete yet
+            buffered = lines.pop()
+            for line in lines:
+                self.feed(line)
+            try:
+                self.report()
+            except Exception:
+                LOGGER.exception("could not update the status of the run")
+            if stopping:
+                return
+            self._stop.wait(POLL_INTERVAL)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.follow, name='ProgressBridge', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def bridge(run_dir, response, start=20, end=80):
+    """Progress bridge following the log of the ESMValTool run in `run_dir`."""
+    return ProgressBridge(os.path.join(run_dir, LOG_FILE), response, start, end)
+
+
+def task_durations(log_file):
+    """Seconds the preprocessor and diagnostic tasks of a finished ESMValTool run took, from its log."""
+    bridge = ProgressBridge(log_file, response=None)
+    try:
+        with open(log_file, errors='replace') as fp:
+            for line in fp:
+                bridge.feed(line)
+    except FileNotFoundError:
+        pass
+    return dict(bridge.durations)
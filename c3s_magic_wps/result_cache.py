@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import logging
+
+from pywps import configuration
+
+from .cache import DirectoryCache, link_or_copy
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Version of the layout of the cache entries, part of every key
+CACHE_VERSION = 1
+
+
+def get_result_cache():
+    """Return the result cache configured in the [cache] section, or None if it is disabled."""
+    directory = configuration.get_config_value('cache', 'result_dir')
+    if not directory:
+        return None
+    max_size = configuration.get_config_value('cache', 'result_max_size') or '10gb'
+    return ResultCache(directory, max_size=configuration.get_size_mb(max_size) * 1024**2)
+
+
+def _find_datasets(node):
+    if isinstance(node, dict):
+        if 'dataset' in node:
+            yield node
+        for value in node.values():
+            yield from _find_datasets(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _find_datasets(value)
+
+
+def input_fingerprint(recipe):
+    """Fingerprint of the versions of the CMIP data read by a recipe.
+
+    Uses the current modification times of the directories of every model/experiment/ensemble in the
+    recipe known to the DataFinder, which change when files or versions are added or replaced.
+    Observations are static reference data and not part of the fingerprint.
+    """
+    import yaml
+    from .processes.utils import DataFinder
+
+    datasets = set()
+    for dataset in _find_datasets(yaml.safe_load(recipe)):
+        if dataset.get('project') == 'CMIP5':
+            datasets.add((str(dataset['dataset']), str(dataset.get('exp')), str(dataset.get('ensemble'))))
+
+    return DataFinder.get_instance().dataset_fingerprint(sorted(datasets))
+
+
+class ResultCache(DirectoryCache):
+    """Content-addressed cache of the output directories of ESMValTool runs.
+
+    An entry holds a copy of the output directory of the run and the result dict with
+    paths relative to it.
+    """
+
+    def key(self, recipe_file, config_file, output_dir, **options):
+        with open(recipe_file) as fp:
+            recipe = fp.read()
+        with open(config_file) as fp:
+            # the output dir differs for every run, the number of parallel tasks does not change the outputs
+            config = fp.read().replace(output_dir, '<output_dir>')
+            config = re.sub(r'^max_parallel_tasks:.*$', '', config, flags=re.MULTILINE)
+
+        digest = hashlib.sha256()
+        for part in (str(CACHE_VERSION), recipe, config, json.dumps(options, sort_keys=True),
+                     input_fingerprint(recipe)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def restore(self, key, output_dir):
+        """Copy the outputs of a cached run to `output_dir` and return its result, or None."""
+        entry = self.entry(key)
+        try:
+            with open(os.path.join(entry, 'result.json')) as fp:
+                cached = json.load(fp)
+            shutil.copytree(os.path.join(entry, 'output'), output_dir, copy_function=link_or_copy)
+        except (OSError, ValueError):
+            # not cached, or evicted while restoring
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return None
+
+        self.touch(key)
+        LOGGER.info("using cached result %s", key)
+        result = dict(cached)
+        for name, relpath in cached['paths'].items():
+            result[name] = os.path.join(output_dir, relpath)
+        del result['paths']
+        return result
+
+    def store(self, key, output_dir, result, path_keys=('logfile', 'debug_logfile', 'plot_dir', 'work_dir',
+                                                        'run_dir')):
+        cached = {name: value for name, value in result.items() if name not in path_keys}
+        cached['paths'] = {name: os.path.relpath(result[name], output_dir) for name in path_keys}
+
+        def fill(entry):
+            shutil.copytree(output_dir, os.path.join(entry, 'output'), copy_function=link_or_copy)
+            with open(os.path.join(entry, 'result.json'), 'w') as fp:
+                json.dump(cached, fp)
+
+        self.populate(key, fill)
@@ -1,12 +1,16 @@
 import os
-import glob
 import sys
-import zipfile
 
 from jinja2 import Environment, PackageLoader, select_autoescape
 
 from pywps import configuration
 
+from . import isolation, lazy_archive, preproc_cache, progress, timing, worker_pool
+from .archive import ArchiveWriter, collect_files
+from .output_manifest import find_outputs
+from .result_cache import get_result_cache
+from .scheduler import configured_slots, get_scheduler
+
 import logging
 LOGGER = logging.getLogger("PYWPS")
 
@@ -18,12 +22,73 @@ template_env = Environment(loader=PackageLoader('c3s_magic_wps', '/templates/esm
 VERSION = "1.0.0"
 
 
-def run(recipe_file, config_file, skip_nonexistent=False):
-    """Run esmvaltool"""
-    from esmvaltool._main import configure_logging, read_config_user_file, process_recipe
+@timing.stage('run')
+def run(recipe_file, config_file, skip_nonexistent=False, use_cache=True, identifier=None, response=None):
+    """Run esmvaltool, or reuse the outputs of an identical earlier run from the result cache
+
+    The runs of the process `identifier` are scheduled with the other runs of the service if a scheduler is
+    configured. The progress of the run is reported to `response` between 20 and 80 percent.
+    """
+    from esmvaltool._main import read_config_user_file
     recipe_name = os.path.splitext(os.path.basename(recipe_file))[0]
     cfg = read_config_user_file(config_file, recipe_name)
 
+    # the output dir of the run is a time stamped directory in the configured output dir
+    output_dir = os.path.dirname(cfg['output_dir'])
+    cache = get_result_cache() if use_cache else None
+    if cache:
+        key = cache.key(recipe_file, config_file, output_dir, skip_nonexistent=skip_nonexistent)
+        result = cache.restore(key, output_dir)
+        if result:
+            return result
+
+    LOGGER.debug("Using config file %s", config_file)
+
+    cfg['synda_download'] = False
+    cfg['skip-nonexistent'] = skip_nonexistent
+
+    preproc = preproc_cache.get_preproc_cache() if use_cache else None
+    job_scheduler = get_scheduler()
+    if job_scheduler:
+        with job_scheduler.slot(identifier or recipe_name):
+            success, exception = _execute(recipe_file, cfg, preproc, response)
+    else:
+        success, exception = _execute(recipe_file, cfg, preproc, response)
+
+    # find the log
+    logfile = os.path.join(cfg['run_dir'], 'main_log.txt')
+    debug_logfile = os.path.join(cfg['run_dir'], 'main_log_debug.txt')
+    timing.record_tasks(logfile)
+    result = {
+        'success': success,
+        'exception': exception,
+        'logfile': logfile,
+        'debug_logfile': debug_logfile,
+        'plot_dir': cfg['plot_dir'],
+        'work_dir': cfg['work_dir'],
+        'run_dir': cfg['run_dir']
+    }
+    if cache and success:
+        cache.store(key, output_dir, result)
+    return result
+
+
+def _execute(recipe_file, cfg, preproc=None, response=None):
+    if response is not None:
+        with progress.bridge(cfg['run_dir'], response):
+            return _execute(recipe_file, cfg, preproc)
+    execution_mode = isolation.execution_mode()
+    if execution_mode == 'subprocess':
+        return isolation.run_in_subprocess(recipe_file, cfg, preproc, **isolation.limits_from_config())
+    elif execution_mode == 'pool':
+        return worker_pool.run_in_pool(recipe_file, cfg, preproc)
+    return execute_recipe(recipe_file, cfg, preproc)
+
+
+def execute_recipe(recipe_file, cfg, preproc=None):
+    """Process a recipe with esmvaltool in this process, returns success and the exception message if it failed"""
+    from esmvaltool._main import configure_logging, process_recipe
+
     # Create run dir
     if os.path.exists(cfg['run_dir']):
         print("ERROR: run_dir {} already exists, aborting to " "prevent data loss".format(cfg['run_dir']))
@@ -34,13 +99,11 @@ def run(recipe_file, config_file, skip_nonexistent=False):
 
     # log header
     # LOGGER.info(__doc__)
-    LOGGER.debug("Using config file %s", config_file)
 
     # check NCL version
     # ncl_version_check()
 
-    cfg['synda_download'] = False
-    cfg['skip-nonexistent'] = skip_nonexistent
+    preproc_cache.install(preproc, cfg['preproc_dir'])
 
     exception = None
     try:
@@ -56,27 +119,38 @@ def run(recipe_file, config_file, skip_nonexistent=False):
         # raise Exception('esmvaltool failed: {0}'.format(err))
         success = False
         exception = str(err)
-    # find the log
-    logfile = os.path.join(cfg['run_dir'], 'main_log.txt')
-    debug_logfile = os.path.join(cfg['run_dir'], 'main_log_debug.txt')
-    return {
-        'success': success,
-        'exception': exception,
-        'logfile': logfile,
-        'debug_logfile': debug_logfile,
-        'plot_dir': cfg['plot_dir'],
-        'work_dir': cfg['work_dir'],
-        'run_dir': cfg['run_dir']
-    }
+    finally:
+        preproc_cache.uninstall(cfg['preproc_dir'])
+    return success, exception
+
+
+def max_parallel_tasks(hint=None):
+    """Number of ESMValTool tasks a single run may execute in parallel.
+
+    The tasks available on this host (`max_parallel_tasks` in the [esmvaltool] section, by default the number
+    of CPUs) are divided over the runs that may execute at the same time: the slots of the scheduler if one is
+    configured, otherwise the `parallelprocesses` WPS requests. A process can give a `hint` with the number of
+    tasks its recipe can usefully run in parallel.
+    """
+    host_tasks = configuration.get_config_value('esmvaltool', 'max_parallel_tasks')
+    host_tasks = int(host_tasks) if host_tasks else (os.cpu_count() or 1)
+
+    parallel_runs = configured_slots() or int(configuration.get_config_value('server', 'parallelprocesses') or 1)
+    tasks = host_tasks // max(parallel_runs, 1)
+    if hint:
+        tasks = min(tasks, hint)
+    return max(tasks, 1)
 
 
+@timing.stage('generate_recipe')
 def generate_recipe(diag,
                     constraints=None,
                     options=None,
                     start_year=2000,
                     end_year=2005,
                     output_format='pdf',
-                    workdir=None):
+                    workdir=None,
+                    parallel_tasks_hint=None):
     constraints = constraints or {}
     workdir = workdir or os.curdir
     workdir = os.path.abspath(workdir)
@@ -88,6 +162,7 @@ def generate_recipe(diag,
         obs_root=configuration.get_config_value("data", "obs_root"),
         output_dir=output_dir,
         output_format=output_format,
+        max_parallel_tasks=max_parallel_tasks(parallel_tasks_hint),
     )
     config_file = os.path.abspath(os.path.join(workdir, "config.yml"))
     with open(config_file, 'w') as fp:
@@ -110,28 +185,53 @@ def generate_recipe(diag,
     return recipe_file, config_file
 
 
-def get_output(output_dir, path_filter, name_filter=None, output_format='pdf'):
+@timing.stage('get_outputs')
+def get_output(output_dir, path_filter, name_filter=None, output_format='pdf', **attributes):
+    """Return the output of a diagnostic script matching the filters.
+
+    Outputs recorded in the provenance of the script can also be selected by the values of their `attributes`,
+    for example plot_type='map'.
+    """
     name_filter = name_filter or '*'
     # output/recipe_20180130_111116/plots/diagnostic1/script1/MultiModelMean_T3M_ta_2001-2002_mean.pdf
     output_filter = os.path.join(output_dir, path_filter, '{0}.{1}'.format(name_filter, output_format))
     LOGGER.debug("output_filter %s", output_filter)
-    matches = glob.glob(output_filter)
+    matches = find_outputs(output_dir, path_filter, name_filter, output_format, **attributes)
     if len(matches) == 0:
         LOGGER.info("output_dir=%s", output_dir)
-        raise Exception("no output found in output dir for filter: {}".format(output_filter))
+        raise Exception("no output found in output dir for filter: {} {}".format(output_filter, attributes or ''))
     elif len(matches) > 1:
         LOGGER.warn("more then one output found %s", matches)
     LOGGER.debug("output found=%s", matches[0])
     return matches[0]
 
 
-def compress_output(output_dir, archive_file, exclude_preproc=True):
-    with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as ziph:
-        for root, dirs, files in os.walk(output_dir):
-            if not exclude_preproc or 'preproc' not in root:
-                for file in files:
-                    path = os.path.join(root, file)
-                    arcname = os.path.relpath(path, output_dir)
-                    ziph.write(path, arcname)
+@timing.stage('compress_output')
+def compress_output(output_dir, archive_file, exclude_preproc=True, response=None):
+    files = collect_files(output_dir, exclude_preproc)
+
+    last_update = [0]
+
+    def progress(done, total, elapsed):
+        # at most one status update every few seconds
+        if response is None or elapsed - last_update[0] < 5 or done == total:
+            return
+        last_update[0] = elapsed
+        response.update_status(
+            "creating archive of diagnostic result ... {:.0f} of {:.0f} MB, {:.1f} MB/s".format(
+                done / 1024**2, total / 1024**2, done / 1024**2 / max(elapsed, 0.001)), 90)
+
+    return ArchiveWriter(archive_file, progress=progress).write(files)
+
+
+@timing.stage('archive')
+def archive_output(output_dir, archive_file, response, exclude_preproc=True):
+    """Set the archive output of a request to the complete output of the run.
 
-    return archive_file
+    With lazy archives the archive is only created when it is downloaded, see lazy_archive.
+    """
+    output = response.outputs['archive']
+    if lazy_archive.enabled():
+        output.url = lazy_archive.prepare(output_dir, os.path.basename(archive_file), response.uuid, exclude_preproc)
+    else:
+        output.file = compress_output(output_dir, archive_file, exclude_preproc, response=response)
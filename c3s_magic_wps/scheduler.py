@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import logging
+
+from pywps import configuration
+from pywps.app.exceptions import ProcessError
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Expected runtime of a diagnostic without any history (seconds)
+DEFAULT_RUNTIME = 600
+
+# Weight of the latest runtime in the moving average of a diagnostic
+RUNTIME_SMOOTHING = 0.3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    identifier TEXT NOT NULL,
+    expected REAL NOT NULL,
+    weight REAL NOT NULL,
+    enqueued REAL NOT NULL,
+    started REAL,
+    pid INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runtimes (
+    identifier TEXT PRIMARY KEY,
+    mean REAL NOT NULL,
+    count INTEGER NOT NULL
+);
+"""
+
+
+def configured_slots():
+    """Number of runs the scheduler configured in the [scheduler] section executes at once, or None."""
+    if not configuration.get_config_value('scheduler', 'database'):
+        return None
+    slots = configuration.get_config_value('scheduler', 'slots')
+    return int(slots) if slots else 2
+
+
+def get_scheduler():
+    """Return the scheduler configured in the [scheduler] section, or None if it is disabled."""
+    database = configuration.get_config_value('scheduler', 'database')
+    if not database:
+        return None
+
+    def value(option, default, convert=float):
+        setting = configuration.get_config_value('scheduler', option)
+        return convert(setting) if setting else default
+
+    weights = dict()
+    for item in (configuration.get_config_value('scheduler', 'weights') or '').split(','):
+        if item.strip():
+            identifier, weight = item.split(':')
+            weights[identifier.strip()] = float(weight)
+
+    return Scheduler(database,
+                     slots=configured_slots(),
+                     max_queue=value('max_queue', None, int),
+                     max_wait=value('max_wait', None),
+                     weights=weights)
+
+
+class Scheduler():
+    """Shortest expected job first scheduling of ESMValTool runs over a fixed number of slots.
+
+    The state is kept in a SQLite database, so all processes of the service share the queue. The expected
+    runtime of a run is the moving average of the earlier runtimes of its process. Waiting runs are started
+    in order of their expected runtime divided by the weight of their process, minus the time they already
+    waited, so long runs are delayed but not starved. A run is rejected when the queue is full or when the
+    expected wait before it starts is longer than `max_wait` seconds.
+    """
+
+    def __init__(self, database, slots=2, max_queue=None, max_wait=None, weights=None, poll_interval=0.5):
+        self.database = database
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.weights = weights or dict()
+        self.poll_interval = poll_interval
+
+        db = sqlite3.connect(self.database, timeout=60)
+        try:
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        db = sqlite3.connect(self.database, timeout=60, isolation_level=None)
+        try:
+            # a write lock for the whole transaction, so that only one process picks the next run
+            db.execute('BEGIN IMMEDIATE')
+            yield db
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        finally:
+            db.close()
+
+    def expected_runtime(self, identifier, db=None):
+        if db is None:
+            with self._transaction() as db:
+                return self.expected_runtime(identifier, db)
+
+        row = db.execute('SELECT mean FROM runtimes WHERE identifier = ?', (identifier, )).fetchone()
+        if row:
+            return row[0]
+        # no history yet, assume it is an average diagnostic
+        row = db.execute('SELECT AVG(mean) FROM runtimes').fetchone()
+        return row[0] if row[0] is not None else DEFAULT_RUNTIME
+
+    @contextmanager
+    def slot(self, identifier):
+        """Wait for a slot for a run of process `identifier`, raises ProcessError if the run is not admitted."""
+        job_id = self._enqueue(identifier)
+        try:
+            self._wait(job_id)
+            start = time.time()
+            yield
+        except BaseException:
+            self._remove(job_id)
+            raise
+        self._remove(job_id, identifier, time.time() - start)
+
+    def _enqueue(self, identifier):
+        weight = self.weights.get(identifier, 1.0)
+        now = time.time()
+        with self._transaction() as db:
+            self._remove_orphans(db)
+            expected = self.expected_runtime(identifier, db)
+
+            if self.max_queue is not None:
+                waiting = db.execute('SELECT COUNT(*) FROM jobs WHERE started IS NULL').fetchone()[0]
+                if waiting >= self.max_queue:
+                    raise ProcessError("The service is busy, please try again later")
+
+            if self.max_wait is not None:
+                wait = self._expected_wait(db, expected / weight, now)
+                if wait > self.max_wait:
+                    LOGGER.info("rejected %s, expected wait %d s", identifier, wait)
+                    raise ProcessError("The service is busy, please try again later")
+
+            cursor = db.execute('INSERT INTO jobs (identifier, expected, weight, enqueued, pid) VALUES (?, ?, ?, ?, ?)',
+                                (identifier, expected, weight, now, os.getpid()))
+            LOGGER.debug("queued %s, expected runtime %d s", identifier, expected)
+            return cursor.lastrowid
+
+    def _expected_wait(self, db, score, now):
+        # remaining work of the running jobs and of the waiting jobs that would start first, spread over the slots
+        jobs_ahead = 0
+        work = 0
+        for expected, weight, enqueued, started in db.execute('SELECT expected, weight, enqueued, started FROM jobs'):
+            if started is not None:
+                jobs_ahead += 1
+                work += max(expected - (now - started), 0)
+            elif self._score(expected, weight, enqueued, now) <= score:
+                jobs_ahead += 1
+                work += expected
+        if jobs_ahead < self.slots:
+            return 0
+        return work / self.slots
+
+    @staticmethod
+    def _score(expected, weight, enqueued, now):
+        return expected / weight - (now - enqueued)
+
+    def _wait(self, job_id):
+        while True:
+            with self._transaction() as db:
+                self._remove_orphans(db)
+                now = time.time()
+                running = db.execute('SELECT COUNT(*) FROM jobs WHERE started IS NOT NULL').fetchone()[0]
+                if running < self.slots:
+                    waiting = db.execute('SELECT id, expected, weight, enqueued FROM jobs WHERE started IS NULL')
+                    next_id = min(waiting, key=lambda job: (self._score(job[1], job[2], job[3], now), job[0]))[0]
+                    if next_id == job_id:
+                        db.execute('UPDATE jobs SET started = ? WHERE id = ?', (now, job_id))
+                        return
+            time.sleep(self.poll_interval)
+
+    def _remove(self, job_id, identifier=None, runtime=None):
+        with self._transaction() as db:
+            db.execute('DELETE FROM jobs WHERE id = ?', (job_id, ))
+            if runtime is None:
+                return
+            row = db.execute('SELECT mean, count FROM runtimes WHERE identifier = ?', (identifier, )).fetchone()
+            if row:
+                mean = (1 - RUNTIME_SMOOTHING) * row[0] + RUNTIME_SMOOTHING * runtime
+                db.execute('UPDATE runtimes SET mean = ?, count = ? WHERE identifier = ?',
+                           (mean, row[1] + 1, identifier))
+            else:
+                db.execute('INSERT INTO runtimes (identifier, mean, count) VALUES (?, ?, 1)', (identifier, runtime))
+
+    def _remove_orphans(self, db):
+        # jobs of processes that were killed
+        for job_id, pid in db.execute('SELECT id, pid FROM jobs').fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                LOGGER.debug("removing job %d of exited process %d", job_id, pid)
+                db.execute('DELETE FROM jobs WHERE id = ?', (job_id, ))
+            except PermissionError:
+                pass
@@ -0,0 +1,73 @@
+import os
+
+import logging
+
+from gunicorn.app.base import BaseApplication
+
+from . import job_status, worker_pool
+from .processes.utils import DataFinder
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Production server of the `c3s_magic_wps start --server=prefork` command, gunicorn is an optional dependency.
+#
+# The application is loaded and its processes are constructed in the master process before the workers are
+# forked, so the index of the model data is built once and shared copy-on-write by all workers. Its background
+# refresh runs in the master only, the workers reload the tree the master writes to the cache file. A HUP signal
+# to the master reloads the configuration and the application, starts new workers from it and shuts the old
+# workers down gracefully once they finished their requests. The ESMValTool worker pool is stopped on reload.
+
+
+def preload(service):
+    """Construct all lazily registered processes of a service, including the index of the model data."""
+    for identifier, process in service.processes.items():
+        if hasattr(process, 'materialize'):
+            try:
+                process.materialize()
+            except Exception:
+                # the process fails again on its first request, with the error in the response
+                LOGGER.exception("could not preload process %s", identifier)
+    return service
+
+
+def _post_worker_init(worker):
+    DataFinder.after_fork()
+    job_status.get_job_table()
+
+
+class PreforkServer(BaseApplication):
+    """Serves a WSGI application with a gunicorn master process and `workers` forked worker processes.
+
+    Every worker handles `threads` requests at the same time. `create_app` is called in the master to load the
+    application, except for the first time if `application` is given.
+    """
+
+    def __init__(self, create_app, bind, workers=None, threads=4, application=None, **options):
+        self.create_app = create_app
+        self.application = application
+        self.options = dict(options)
+        self.options.update(
+            bind=bind,
+            workers=workers or os.cpu_count() or 1,
+            threads=threads,
+            # requests run in threads, so long synchronous executions do not look like a stuck worker
+            worker_class='gthread',
+            preload_app=True,
+            post_worker_init=_post_worker_init,
+        )
+        super(PreforkServer, self).__init__()
+
+    def load_config(self):
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+
+    def load(self):
+        application, self.application = self.application, None
+        return application or self.create_app()
+
+    def reload(self):
+        # the worker pool is started again by the next run, with the new code and configuration
+        worker_pool.stop_server()
+        super(PreforkServer, self).reload()
+        # the new workers are forked from a freshly loaded application
+        self.callable = None
@@ -0,0 +1,294 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import logging
+import psutil
+
+from pywps import configuration
+
+from . import progress
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Time, I/O and memory used by the stages of every run of a process.
+#
+# The handler of a process runs in a job trace, the functions of the runner called by the handler record
+# their stages in the trace of the current thread. At the end of the job the trace is logged as JSON and
+# stored in the SQLite database configured with `database` in the [timing] section, if any.
+#
+# Bytes read and written are the I/O counters of the serving process, which include the subprocesses it
+# waited for (the isolated runs and the parallel tasks of ESMValTool) but not the worker pool, and the
+# stages of other jobs running in the same process at the same time. The peak RSS is sampled from the
+# process and its subprocesses.
+
+# Seconds between two samples of the memory used by a job
+SAMPLE_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    calls INTEGER NOT NULL,
+    bytes_read INTEGER,
+    bytes_written INTEGER,
+    peak_rss INTEGER,
+    success INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stages_identifier ON stages (identifier, stage);
+"""
+
+_local = threading.local()
+
+
+def _io_counters(process):
+    try:
+        counters = process.io_counters()
+    except (psutil.AccessDenied, AttributeError):
+        # not available on all platforms
+        return None
+    # the bytes passed to read and write calls on Linux, including data from the page cache
+    if hasattr(counters, 'read_chars'):
+        return counters.read_chars, counters.write_chars
+    return counters.read_bytes, counters.write_bytes
+
+
+def _rss(process):
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # exited since it was listed
+            pass
+    return rss
+
+
+class JobTrace():
+    """Stages of a job of process `identifier`, each with its duration, number of calls, I/O and peak RSS.
+
+    The identifier of a job traced before can be None, it is taken from the store then.
+    """
+
+    def __init__(self, job, identifier):
+        self.job = job
+        self.identifier = identifier
+        self.started = time.time()
+        self.stages = []
+        self.success = False
+        self._process = psutil.Process()
+        self._open = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._update_peak()
+
+    def _update_peak(self):
+        try:
+            rss = _rss(self._process)
+        except psutil.Error:
+            return
+        with self._lock:
+            for stage in self._open:
+                stage['peak_rss'] = max(stage['peak_rss'] or 0, rss)
+
+    def _find(self, name):
+        for stage in self.stages:
+            if stage['stage'] == name:
+                return stage
+        stage = dict(stage=name, started=time.time(), duration=0.0, calls=0, bytes_read=None, bytes_written=None,
+                     peak_rss=None)
+        self.stages.append(stage)
+        return stage
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a stage, the measurements of repeated stages are added up."""
+        stage = self._find(name)
+        with self._lock:
+            self._open.append(stage)
+        self._update_peak()
+        io_before = _io_counters(self._process)
+        start = time.time()
+        try:
+            yield stage
+        finally:
+            stage['duration'] += time.time() - start
+            stage['calls'] += 1
+            io_after = _io_counters(self._process)
+            if io_before and io_after:
+                stage['bytes_read'] = (stage['bytes_read'] or 0) + io_after[0] - io_before[0]
+                stage['bytes_written'] = (stage['bytes_written'] or 0) + io_after[1] - io_before[1]
+            self._update_peak()
+            with self._lock:
+                self._open.remove(stage)
+
+    def add(self, name, duration):
+        """Add a stage measured elsewhere, for example from a log."""
+        stage = self._find(name)
+        stage['duration'] += duration
+        stage['calls'] += 1
+
+    def start_sampling(self):
+        self._sampler = threading.Thread(target=self._sample, name='JobTraceSampler', daemon=True)
+        self._sampler.start()
+
+    def stop_sampling(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def __enter__(self):
+        self.start_sampling()
+        self._job_stage = self.stage('total')
+        self._job_stage.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._job_stage.__exit__(exc_type, exc_value, traceback)
+        self.stop_sampling()
+        self.success = exc_type is None
+
+    def as_dict(self):
+        return dict(job=self.job, identifier=self.identifier, started=self.started, success=self.success,
+                    stages=self.stages)
+
+
+def current():
+    """The trace of the job running in this thread, or None."""
+    return getattr(_local, 'trace', None)
+
+
+def stage(name):
+    """Decorator recording the calls of a function as stage `name` of the current job."""
+
+    def decorator(func):
+        @wraps(func)
+        def timed_stage(*args, **kwargs):
+            trace = current()
+            if trace is None:
+                return func(*args, **kwargs)
+            with trace.stage(name):
+                return func(*args, **kwargs)
+
+        return timed_stage
+
+    return decorator
+
+
+def record_tasks(log_file):
+    """Add the time spent in the preprocessor and diagnostic tasks of an ESMValTool run to the current job.
+
+    Tasks running in parallel are added up, so these stages can take longer than the run.
+    """
+    trace = current()
+    if trace is None:
+        return
+    for kind, duration in sorted(progress.task_durations(log_file).items()):
+        trace.add('run.{}_tasks'.format(kind), duration)
+
+
+def get_timing_store():
+    """Return the store configured in the [timing] section, or None if timings are only logged."""
+    database = configuration.get_config_value('timing', 'database')
+    return TimingStore(database) if database else None
+
+
+class TimingStore():
+    """The stages of the jobs of all processes of the service, in a SQLite database."""
+
+    def __init__(self, database):
+        self.database = database
+        db = sqlite3.connect(self.database, timeout=60)
+        try:
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    def store(self, trace):
+        """Store the stages of a trace, after the stages already stored for the same job."""
+        db = sqlite3.connect(self.database, timeout=60)
+        try:
+            with db:
+                identifier, first = db.execute(
+                    'SELECT MIN(identifier), COALESCE(MAX(position) + 1, 0) FROM stages WHERE job = ?',
+                    (trace.job, )).fetchone()
+                identifier = trace.identifier or identifier or 'unknown'
+                db.executemany(
+                    'INSERT INTO stages (job, identifier, stage, position, started, duration, calls, bytes_read, '
+                    'bytes_written, peak_rss, success) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(trace.job, identifier, stage['stage'], first + position, stage['started'], stage['duration'],
+                      stage['calls'], stage['bytes_read'], stage['bytes_written'], stage['peak_rss'],
+                      int(trace.success)) for position, stage in enumerate(trace.stages)])
+        finally:
+            db.close()
+
+    def summary(self, identifier=None):
+        """Mean duration, bytes read and written, and largest peak RSS of the stages of successful jobs.
+
+        Returns a list of dicts ordered by process and the order of the stages in a job.
+        """
+        query = ('SELECT identifier, stage, COUNT(*), AVG(duration), AVG(bytes_read), AVG(bytes_written), '
+                 'MAX(peak_rss) FROM stages WHERE success = 1 {} GROUP BY identifier, stage '
+                 'ORDER BY identifier, MIN(position)')
+        db = sqlite3.connect(self.database, timeout=60)
+        try:
+            if identifier:
+                rows = db.execute(query.format('AND identifier = ?'), (identifier, )).fetchall()
+            else:
+                rows = db.execute(query.format('')).fetchall()
+        finally:
+            db.close()
+        names = ('identifier', 'stage', 'jobs', 'duration', 'bytes_read', 'bytes_written', 'peak_rss')
+        return [dict(zip(names, row)) for row in rows]
+
+
+def timed(handler):
+    """Wrap the handler of a process to trace the stages of its jobs."""
+
+    @wraps(handler)
+    def handler_timed(request, response):
+        trace = JobTrace(str(response.uuid), response.process.identifier)
+        _local.trace = trace
+        try:
+            with trace:
+                return handler(request, response)
+        finally:
+            _local.trace = None
+            _finish(trace)
+
+    return handler_timed
+
+
+@contextmanager
+def deferred_stage(job, name):
+    """Trace stage `name` of a job after its handler finished, like an archive created when it is downloaded."""
+    trace = JobTrace(job, None)
+    trace.start_sampling()
+    try:
+        with trace.stage(name):
+            yield
+        trace.success = True
+    finally:
+        trace.stop_sampling()
+        _finish(trace)
+
+
+def _finish(trace):
+    LOGGER.info("timing %s", json.dumps(trace.as_dict()))
+    try:
+        store = get_timing_store()
+        if store:
+            store.store(trace)
+    except Exception:
+        LOGGER.exception("could not store the timing of job %s", trace.job)
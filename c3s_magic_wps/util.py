@@ -9,6 +9,8 @@ WPS_ROLE_MEDIA = WPS_ROLE_BASE_URL + '/media'
 MAGIC_ROLE_BASE_URL = 'http://c3s-magic.eu/spec/diagnostic/2.0'
 MAGIC_ROLE_DOC = MAGIC_ROLE_BASE_URL + '/documentation'
 MAGIC_ROLE_METADATA = MAGIC_ROLE_BASE_URL + '/metadata'
+# project of the outputs of the magic diagnostics in their provenance records
+MAGIC_PROJECT = 'c3s-magic'
 
 
 def static_directory():
@@ -0,0 +1,432 @@
+import argparse
+import atexit
+import fcntl
+import itertools
+import multiprocessing
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import logging
+
+import psutil
+from pywps import configuration
+
+from . import isolation
+
+LOGGER = logging.getLogger("PYWPS")
+
+# Pool of worker processes that have already imported ESMValTool and its dependencies, selected with
+# `execution = pool` in the [esmvaltool] section.
+#
+# The pool is owned by a server process listening on a unix socket, so it is shared by all processes of
+# the service, including the processes PyWPS forks for asynchronous requests. The first run starts the
+# server if it is not running yet, with the configuration of the service. The workers are forked from a
+# forkserver process that imports the heavy modules once, recycled workers are therefore warm as well, and
+# are not forked from the threads of the server. Only one job runs in a worker at a time, with the resource
+# limits of the subprocess execution mode.
+#
+# The server stops when the service that started it exits, and is stopped when the service is stopped or
+# reloaded, see bind_to_service.
+
+_STARTUP_TIMEOUT = 120
+
+# Seconds after the wall time limit of a job that its request waits for the result of the worker
+_RESULT_MARGIN = 60
+
+
+def default_address():
+    address = configuration.get_config_value('esmvaltool', 'pool_socket')
+    return address or os.path.join(tempfile.gettempdir(), 'c3s_magic_wps-pool-{}.sock'.format(os.getuid()))
+
+
+def _config_int(option, default):
+    value = configuration.get_config_value('esmvaltool', option)
+    return int(value) if value else default
+
+
+# Modules imported by the forkserver the workers are forked from, missing modules are skipped
+PRELOAD = ['c3s_magic_wps.runner', 'esmvaltool._main', 'iris']
+
+# Process id of the service the pool servers started by this process belong to
+_service_pid = None
+
+
+def _run_job(recipe_file, cfg, preproc=None):
+    from .runner import execute_recipe
+    return execute_recipe(recipe_file, cfg, preproc)
+
+
+def _authkey(address, create=False):
+    key_file = address + '.key'
+    if create:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(os.urandom(32))
+    with open(key_file, 'rb') as fp:
+        return fp.read()
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _worker_loop(jobs, results, job, max_jobs, config_file=None, limits=None):
+    if config_file:
+        configuration.load_configuration([config_file])
+    limits = limits or dict()
+    if limits.get('memory'):
+        resource.setrlimit(resource.RLIMIT_AS, (limits['memory'], limits['memory']))
+
+    for _ in range(max_jobs):
+        item = jobs.get()
+        if item is None:
+            return
+        job_id, args = item
+        if limits.get('cpu_time'):
+            # SIGXCPU once this job used its CPU time, the worker keeps the time used by its earlier jobs
+            hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+            resource.setrlimit(resource.RLIMIT_CPU, (int(_cpu_time()) + limits['cpu_time'], hard))
+        results.put(('start', job_id, os.getpid()))
+        try:
+            result = job(*args)
+        except Exception as err:
+            LOGGER.exception("job in the worker pool failed")
+            result = (False, str(err))
+        results.put(('done', job_id, result))
+
+
+class PoolServer():
+    """Runs jobs sent to a unix socket in a pool of worker processes, replaced after `max_jobs` jobs each.
+
+    The workers are not daemonic, so ESMValTool can start processes of its own for parallel tasks.
+    """
+
+    def __init__(self, address, workers=2, max_jobs=10, job=_run_job, config_file=None, limits=None,
+                 service_pid=None):
+        self.address = address
+        self.job = job
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.config_file = config_file
+        self.limits = limits or dict()
+        self.service_pid = service_pid
+
+        self._context = multiprocessing.get_context('forkserver')
+        self._context.set_forkserver_preload(PRELOAD)
+        self._jobs = self._context.Queue()
+        # written synchronously, so the start of a job is known even if the worker dies right away, but it may
+        # be collected only after the worker was reaped
+        self._results = self._context.SimpleQueue()
+        self._processes = []
+        # [done event, result, start time] of the jobs by id, the job of every worker by pid, and why the
+        # workers that were reaped before the start of their job was collected exited
+        self._pending = dict()
+        self._running = dict()
+        self._exited = dict()
+        # start times of the running jobs by worker, and workers killed for exceeding the wall time
+        self._started = dict()
+        self._timed_out = set()
+        self._lock = threading.Lock()
+        self._workers_lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._closed = False
+
+        self._supervise()
+        threading.Thread(target=self._collect_results, daemon=True).start()
+        threading.Thread(target=self._supervise_loop, daemon=True).start()
+
+        if os.path.exists(address):
+            os.unlink(address)
+        self.listener = Listener(address, family='AF_UNIX', authkey=_authkey(address, create=True))
+
+    def serve_forever(self):
+        LOGGER.info("esmvaltool worker pool listening on %s", self.address)
+        while not self._closed:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                # closed
+                break
+            except Exception:
+                if self._closed:
+                    break
+                LOGGER.exception("rejected connection to the worker pool")
+                continue
+            threading.Thread(target=self._handle, args=(connection, ), daemon=True).start()
+
+    def _handle(self, connection):
+        with connection:
+            try:
+                args = connection.recv()
+            except EOFError:
+                return
+            if args is None:
+                # stop_server
+                self.close()
+                return
+            connection.send(self.run(*args))
+
+    def run(self, *args):
+        job_id = next(self._job_ids)
+        done = threading.Event()
+        with self._lock:
+            self._pending[job_id] = [done, None, None]
+        self._jobs.put((job_id, args))
+
+        # the worker of a job is killed at its wall time, a result that still does not arrive is lost
+        wall_time = self.limits.get('wall_time')
+        while not done.wait(1 if wall_time else None):
+            with self._lock:
+                started = self._pending[job_id][2]
+            if started is not None and time.time() - started > wall_time + _RESULT_MARGIN:
+                self._finish(job_id, (False, "no result from the esmvaltool worker"))
+        with self._lock:
+            return self._pending.pop(job_id)[1]
+
+    def _finish(self, job_id, result):
+        with self._lock:
+            pending = self._pending.get(job_id)
+            if pending is not None and not pending[0].is_set():
+                pending[1] = result
+                pending[0].set()
+
+    def _collect_results(self):
+        while not self._closed:
+            try:
+                event, job_id, value = self._results.get()
+            except (EOFError, OSError):
+                break
+            if event == 'start':
+                with self._lock:
+                    reason = self._exited.pop(value, None)
+                    if reason is None:
+                        self._running[value] = job_id
+                        self._started[value] = time.time()
+                    if job_id in self._pending:
+                        self._pending[job_id][2] = time.time()
+                if reason is not None:
+                    self._finish(job_id, (False, reason))
+            else:
+                with self._lock:
+                    for pid in [pid for pid, running_job in self._running.items() if running_job == job_id]:
+                        del self._running[pid]
+                        self._started.pop(pid, None)
+                self._finish(job_id, value)
+
+    def _supervise_loop(self):
+        while not self._closed:
+            time.sleep(0.5)
+            if self.service_pid and not psutil.pid_exists(self.service_pid):
+                LOGGER.info("service %s exited, stopping the worker pool", self.service_pid)
+                self.close()
+                break
+            self._kill_overdue()
+            self._supervise()
+
+    def _kill_overdue(self):
+        wall_time = self.limits.get('wall_time')
+        if not wall_time:
+            return
+        with self._lock:
+            overdue = [pid for pid, started in self._started.items() if time.time() - started > wall_time]
+        for pid in overdue:
+            with self._lock:
+                self._started.pop(pid, None)
+            self._timed_out.add(pid)
+            _kill_tree(pid)
+
+    def _supervise(self):
+        with self._workers_lock:
+            if not self._closed:
+                self._replace_workers()
+
+    def _replace_workers(self):
+        # replace workers that exited, after their last job or because they were killed
+        for process in [process for process in self._processes if not process.is_alive()]:
+            process.join()
+            self._processes.remove(process)
+            if process.exitcode == 0:
+                continue
+            reason = self._exit_reason(process)
+            with self._lock:
+                job_id = self._running.pop(process.pid, None)
+                self._started.pop(process.pid, None)
+                if job_id is None:
+                    # the start of its job, if it got one, is still to be collected
+                    self._exited[process.pid] = reason
+            if job_id is not None:
+                self._finish(job_id, (False, reason))
+
+        while len(self._processes) < self.workers:
+            process = self._context.Process(target=_worker_loop,
+                                            args=(self._jobs, self._results, self.job, self.max_jobs,
+                                                  self.config_file, self.limits))
+            process.start()
+            self._processes.append(process)
+            with self._lock:
+                # a reused pid of a worker that exited without a job
+                self._exited.pop(process.pid, None)
+
+    def _exit_reason(self, process):
+        if process.pid in self._timed_out:
+            self._timed_out.discard(process.pid)
+            return "esmvaltool exceeded the wall time limit of {} seconds".format(self.limits['wall_time'])
+        if process.exitcode == -signal.SIGXCPU:
+            return "esmvaltool exceeded the CPU time limit of {} seconds".format(self.limits.get('cpu_time'))
+        return "esmvaltool worker exited with code {}".format(process.exitcode)
+
+    def close(self):
+        with self._workers_lock:
+            if self._closed:
+                return
+            self._closed = True
+            # closing the listener does not interrupt a waiting accept, a connection does
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as wake_up:
+                try:
+                    wake_up.connect(self.address)
+                except OSError:
+                    pass
+            self.listener.close()
+            for process in self._processes:
+                process.terminate()
+                process.join()
+
+
+def _kill_tree(pid):
+    try:
+        process = psutil.Process(pid)
+        processes = process.children(recursive=True) + [process]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+def submit(*args, address=None):
+    """Run a job in the worker pool with the given arguments and return its result, starting the pool if needed."""
+    address = address or default_address()
+    connection = _connect(address)
+    with connection:
+        connection.send(args)
+        return connection.recv()
+
+
+def run_in_pool(recipe_file, cfg, preproc=None):
+    """Run a recipe with runner.execute_recipe in the worker pool, returns (success, exception)."""
+    LOGGER.info("run esmvaltool in the worker pool ...")
+    return submit(recipe_file, cfg, preproc)
+
+
+def _connect(address):
+    try:
+        return Client(address, family='AF_UNIX', authkey=_authkey(address))
+    except (OSError, EOFError):
+        pass
+
+    # a single process starts the server, the others wait for it
+    with open(address + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return Client(address, family='AF_UNIX', authkey=_authkey(address))
+        except (OSError, EOFError):
+            return _start_server(address)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_config(config_file):
+    # the configuration of the service, which may hold the credentials of its database
+    fd = os.open(config_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fp:
+        configuration.CONFIG.write(fp)
+
+
+def _start_server(address):
+    LOGGER.info("starting esmvaltool worker pool on %s", address)
+    for path in (address, address + '.key'):
+        if os.path.exists(path):
+            os.unlink(path)
+
+    config_file = address + '.cfg'
+    _write_config(config_file)
+    args = [sys.executable, '-m', 'c3s_magic_wps.worker_pool', address,
+            str(_config_int('pool_workers', int(configuration.get_config_value('server', 'parallelprocesses') or 2))),
+            str(_config_int('pool_max_jobs', 10)), '--config', config_file]
+    if _service_pid:
+        args.extend(['--service-pid', str(_service_pid)])
+    # a session of its own, so it is not killed with the process group of the request that started it
+    subprocess.Popen(args, start_new_session=True, stdin=subprocess.DEVNULL)
+
+    deadline = time.time() + _STARTUP_TIMEOUT
+    while True:
+        try:
+            return Client(address, family='AF_UNIX', authkey=_authkey(address))
+        except (OSError, EOFError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def stop_server(address=None):
+    """Stop the pool server listening on `address`, if it is running."""
+    address = address or default_address()
+    try:
+        connection = Client(address, family='AF_UNIX', authkey=_authkey(address))
+    except (OSError, EOFError):
+        return False
+    with connection:
+        connection.send(None)
+    LOGGER.info("stopped esmvaltool worker pool on %s", address)
+    return True
+
+
+def bind_to_service():
+    """Tie the pool servers started from now on to the lifetime of this process, the main process of the service.
+
+    The pool servers stop when the service exits, also when it is killed, so they do not keep running the code
+    and configuration of an earlier service.
+    """
+    global _service_pid
+    _service_pid = os.getpid()
+    atexit.register(_stop_at_exit, _service_pid)
+
+
+def _stop_at_exit(pid):
+    # forked processes of the service inherit the exit handler
+    if os.getpid() == pid:
+        stop_server()
+
+
+def main(address, workers, max_jobs, config_file=None, service_pid=None):
+    if config_file:
+        configuration.load_configuration([config_file])
+    server = PoolServer(address, workers=workers, max_jobs=max_jobs, config_file=config_file,
+                        limits=isolation.limits_from_config(), service_pid=service_pid)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level="INFO")
+    parser = argparse.ArgumentParser(description="Pool of ESMValTool workers listening on a unix socket.")
+    parser.add_argument('address', help='unix socket of the pool')
+    parser.add_argument('workers', type=int, help='number of workers')
+    parser.add_argument('max_jobs', type=int, help='jobs after which a worker is replaced')
+    parser.add_argument('--config', help='PyWPS configuration file of the service')
+    parser.add_argument('--service-pid', type=int, help='stop when this process exits')
+    args = parser.parse_args()
+    main(args.address, args.workers, args.max_jobs, config_file=args.config, service_pid=args.service_pid)
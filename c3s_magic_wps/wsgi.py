@@ -1,7 +1,7 @@
 import os
-from pywps.app.Service import Service
 
 from .processes import processes
+from .processes.registry import LazyService
 
 
 def create_app(cfgfiles=None):
@@ -11,7 +11,7 @@ def create_app(cfgfiles=None):
     if 'PYWPS_CFG' in os.environ:
         config_files.append(os.environ['PYWPS_CFG'])
     print(config_files)
-    service = Service(processes=processes, cfgfiles=config_files)
+    service = LazyService(processes=processes, cfgfiles=config_files)
     return service
 
 
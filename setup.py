@@ -44,6 +44,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=reqs,
+    extras_require={'prefork': ['gunicorn>=19.9']},
     entry_points={'console_scripts': [
         'c3s_magic_wps=c3s_magic_wps.cli:cli',
         'canary=c3s_magic_wps.execute:canary',
@@ -1,3 +1,5 @@
+import os
+
 from pywps import get_ElementMakerForVersion
 from pywps.app.basic import get_xpath_ns
 from pywps.tests import WpsClient, WpsTestResponse
@@ -41,3 +43,29 @@ def get_output(doc):
             output[identifier_el.text] = data_el[0].text
 
     return output
+
+
+def make_drs_tree(root, organizations=('ORG',), models=('MODEL',), experiments=('historical',),
+                  frequencies=('mon',), ensembles=('r1i1p1',), variables=('pr', 'tas'), version='v20120101'):
+    """Create a synthetic CMIP5 DRS directory tree below `root` for testing the DataFinder."""
+    for organization in organizations:
+        for model in models:
+            for experiment in experiments:
+                for frequency in frequencies:
+                    for ensemble in ensembles:
+                        for variable in variables:
+                            path = os.path.join(root, organization, model, experiment, frequency, 'Amon', 'atmos',
+                                                ensemble, variable, version)
+                            os.makedirs(path, exist_ok=True)
+    return root
+
+
+def make_large_drs_tree(root, variables=tuple('var{}'.format(i) for i in range(25))):
+    """Create a synthetic CMIP5 DRS tree of roughly 100k directories below `root`, for benchmarks."""
+    return make_drs_tree(root,
+                         organizations=['ORG-{}'.format(i) for i in range(10)],
+                         models=['MODEL-{}'.format(i) for i in range(5)],
+                         experiments=('historical', 'rcp26', 'rcp45', 'rcp85'),
+                         frequencies=('mon', 'day'),
+                         ensembles=['r{}i1p1'.format(i) for i in range(1, 6)],
+                         variables=variables)
@@ -0,0 +1,163 @@
+import os
+import time
+import zipfile
+import zlib
+
+import pytest
+
+from pywps import configuration
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from c3s_magic_wps import lazy_archive, runner
+from c3s_magic_wps.archive import ArchiveWriter, collect_files
+
+
+def _read(path):
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def _assert_entries(archive_file, files):
+    # the entries of the files in their order, with their checksums and content
+    with zipfile.ZipFile(archive_file) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [arcname for path, arcname in files]
+        for info, (path, arcname) in zip(archive.infolist(), files):
+            data = _read(path)
+            assert info.file_size == len(data)
+            assert info.CRC == zlib.crc32(data)
+            assert archive.read(info) == data
+
+
+def _make_output(root, scale=1):
+    plots = os.path.join(root, 'recipe_20190101_120000', 'plots', 'diag', 'script')
+    work = os.path.join(root, 'recipe_20190101_120000', 'work', 'diag', 'script')
+    preproc = os.path.join(root, 'recipe_20190101_120000', 'preproc', 'diag', 'tas')
+    for path in (plots, work, preproc):
+        os.makedirs(path)
+
+    with open(os.path.join(plots, 'plot.png'), 'wb') as fp:
+        fp.write(os.urandom(100000 * scale))
+    with open(os.path.join(work, 'compressed.nc'), 'wb') as fp:
+        fp.write(os.urandom(2000000 * scale))
+    with open(os.path.join(work, 'uncompressed.nc'), 'wb') as fp:
+        fp.write(b'\0' * 2000000 * scale)
+    with open(os.path.join(root, 'recipe_20190101_120000', 'main_log.txt'), 'w') as fp:
+        fp.write('esmvaltool ... done.\n' * 1000 * scale)
+    with open(os.path.join(preproc, 'tas.nc'), 'wb') as fp:
+        fp.write(b'\0' * 1000)
+
+
+def test_compress_output(tmp_path):
+    output_dir = str(tmp_path / 'output')
+    _make_output(output_dir)
+
+    archive_file = runner.compress_output(output_dir, str(tmp_path / 'result.zip'))
+
+    with zipfile.ZipFile(archive_file) as archive:
+        assert archive.testzip() is None
+        types = {os.path.basename(info.filename): info.compress_type for info in archive.infolist()}
+        assert types == {
+            'plot.png': zipfile.ZIP_STORED,
+            'compressed.nc': zipfile.ZIP_STORED,
+            'uncompressed.nc': zipfile.ZIP_DEFLATED,
+            'main_log.txt': zipfile.ZIP_DEFLATED,
+        }
+        with open(os.path.join(output_dir, 'recipe_20190101_120000', 'plots', 'diag', 'script', 'plot.png'),
+                  'rb') as fp:
+            assert archive.read('recipe_20190101_120000/plots/diag/script/plot.png') == fp.read()
+
+
+def test_archive_writer_entries(tmp_path):
+    output_dir = str(tmp_path / 'output')
+    _make_output(output_dir)
+    # more files than the compressed entries in flight, of both kinds
+    for number in range(20):
+        with open(os.path.join(output_dir, 'file{:02d}.{}'.format(number, 'png' if number % 3 else 'txt')),
+                  'wb') as fp:
+            fp.write(os.urandom((number + 1) * 1000) if number % 3 else b'text' * (number + 1) * 1000)
+    files = collect_files(output_dir)
+
+    archive_file = ArchiveWriter(str(tmp_path / 'result.zip'), threads=4).write(files)
+
+    _assert_entries(archive_file, files)
+    with zipfile.ZipFile(archive_file) as archive:
+        for info in archive.infolist():
+            stored = info.filename.endswith('.png') or os.path.basename(info.filename) == 'compressed.nc'
+            assert info.compress_type == (zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+            if not stored:
+                assert info.compress_size < info.file_size
+
+
+def test_archive_progress(tmp_path):
+    output_dir = str(tmp_path / 'output')
+    _make_output(output_dir)
+    files = [(os.path.join(root, file), file) for root, dirs, files in os.walk(output_dir) for file in files]
+
+    reported = []
+    ArchiveWriter(str(tmp_path / 'result.zip'), threads=2,
+                  progress=lambda done, total, elapsed: reported.append((done, total))).write(files)
+
+    total = sum(os.path.getsize(path) for path, name in files)
+    assert len(reported) == len(files)
+    assert reported[-1] == (total, total)
+
+
+def test_lazy_archive(tmp_path, monkeypatch):
+    output_path = str(tmp_path / 'outputs')
+    values = {('server', 'outputpath'): output_path, ('server', 'outputurl'): 'http://localhost:5000/outputs/'}
+    monkeypatch.setattr(configuration, 'get_config_value', lambda section, option: values.get((section, option), ''))
+    # opt-in, the outputs have to be served by an application with the middleware
+    assert not lazy_archive.enabled()
+    values[('esmvaltool', 'archive')] = 'lazy'
+    assert lazy_archive.enabled()
+
+    output_dir = str(tmp_path / 'output')
+    _make_output(output_dir)
+    url = lazy_archive.prepare(output_dir, 'result.zip', 'b2d6ec5e')
+    assert url == 'http://localhost:5000/outputs/b2d6ec5e/result.zip'
+    archive_file = os.path.join(output_path, 'b2d6ec5e', 'result.zip')
+    assert not os.path.exists(archive_file)
+
+    def not_found(environ, start_response):
+        return Response('not found', status=404)(environ, start_response)
+
+    client = Client(lazy_archive.LazyArchiveMiddleware(not_found, output_path), Response)
+    assert client.get('/outputs/b2d6ec5e/other.zip').status_code == 404
+    assert client.get('/outputs/../output/result.zip').status_code == 404
+
+    response = client.get('/outputs/b2d6ec5e/result.zip')
+    assert response.status_code == 200
+    with open(archive_file, 'rb') as fp:
+        assert response.data == fp.read()
+    assert os.listdir(os.path.join(output_path, 'b2d6ec5e')) == ['result.zip']
+    with zipfile.ZipFile(archive_file) as archive:
+        assert archive.testzip() is None
+        assert len(archive.namelist()) == 4
+
+    # served from the file from now on
+    assert client.get('/outputs/b2d6ec5e/result.zip').data == response.data
+
+
+@pytest.mark.slow
+def test_compress_output_benchmark(tmp_path):
+    output_dir = str(tmp_path / 'output')
+    _make_output(output_dir, scale=50)
+
+    start = time.time()
+    with zipfile.ZipFile(str(tmp_path / 'single.zip'), 'w', zipfile.ZIP_DEFLATED) as ziph:
+        for root, dirs, files in os.walk(output_dir):
+            if 'preproc' not in root:
+                for file in files:
+                    path = os.path.join(root, file)
+                    ziph.write(path, os.path.relpath(path, output_dir))
+    single = time.time() - start
+
+    start = time.time()
+    runner.compress_output(output_dir, str(tmp_path / 'parallel.zip'))
+    parallel = time.time() - start
+
+    # the timings depend on the host, they are only reported
+    print("single threaded deflate: {:.2f} s, archive writer: {:.2f} s".format(single, parallel))
+    _assert_entries(str(tmp_path / 'parallel.zip'), collect_files(output_dir))
@@ -1,4 +1,19 @@
+import copy
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import tracemalloc
+
+import pytest
+
 from c3s_magic_wps.processes.utils import DataFinder
+from c3s_magic_wps.processes.utils import data_finder
+from c3s_magic_wps.processes.utils.data_finder import _crawl, _dir_entry, _get_children_of, _scan_entry
+
+from .common import make_drs_tree, make_large_drs_tree
 
 
 def test_data_finder():
@@ -19,3 +34,401 @@ def test_data_finder():
 
     # print ("tree!", self.data)
     print("pruned tree!", pruned)
+
+
+def test_incremental_rescan(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path / 'cmip5'), models=('MODEL-A', 'MODEL-B'))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.setenv('CMIP_META_CACHE_FILE', str(tmp_path / 'cache.json'))
+
+    finder = DataFinder()
+    assert finder.data == _dir_entry(archive, 'root')
+    assert len(finder.mtimes) == len(list(os.walk(archive)))
+
+    # add a new variable to an existing ensemble, only its ancestors that changed are listed again
+    os.makedirs(os.path.join(archive, 'ORG', 'MODEL-B', 'historical', 'mon', 'Amon', 'atmos', 'r1i1p1', 'psl', 'v1'))
+
+    relisted = []
+    previous, mtimes = finder.data, finder.mtimes
+    data = _scan_entry(archive, 'root', previous=previous, old_mtimes=mtimes, relisted=relisted)
+    assert data == _dir_entry(archive, 'root')
+    assert sorted(relisted) == sorted([
+        os.path.join('ORG', 'MODEL-B', 'historical', 'mon', 'Amon', 'atmos', 'r1i1p1'),
+        os.path.join('ORG', 'MODEL-B', 'historical', 'mon', 'Amon', 'atmos', 'r1i1p1', 'psl'),
+        os.path.join('ORG', 'MODEL-B', 'historical', 'mon', 'Amon', 'atmos', 'r1i1p1', 'psl', 'v1'),
+    ])
+
+    finder.refresh()
+    assert finder.data == _dir_entry(archive, 'root')
+
+    # a new finder picks up the rescanned tree from the cache file
+    monkeypatch.setenv('CMIP_META_CACHE_RESCAN', 'true')
+    assert DataFinder().data == finder.data
+
+
+def test_rescan_same_mtime(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path), models=('MODEL-A', ))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+    finder = DataFinder()
+
+    # added within the mtime resolution of the filesystem, the directory it is added to keeps its mtime
+    organization = os.path.join(archive, 'ORG')
+    stat = os.stat(organization)
+    make_drs_tree(archive, models=('MODEL-B', ))
+    os.utime(organization, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    finder.refresh()
+    assert sorted(finder.get_model_experiment_ensemble()[0]) == ['MODEL-A', 'MODEL-B']
+
+    # directories last modified well before the previous scan are not listed again
+    past = time.time() - 3600
+    for root, dirs, files in os.walk(archive):
+        os.utime(root, (past, past))
+    finder.refresh()
+    settled = data_finder._settled_mtimes(finder.mtimes, finder._snapshot.scanned)
+    assert settled == finder.mtimes
+
+
+def test_parallel_crawl(tmp_path):
+    archive = make_drs_tree(str(tmp_path), organizations=('ORG-A', 'ORG-B'), models=('MODEL-A', 'MODEL-B'),
+                            experiments=('historical', 'rcp85'))
+
+    mtimes = dict()
+    for shard_depth in range(0, 11):
+        assert _crawl(archive, 'root', threads=4, shard_depth=shard_depth, mtimes=mtimes) == _dir_entry(archive, 'root')
+        assert len(mtimes) == len(list(os.walk(archive)))
+
+
+@pytest.mark.slow
+def test_parallel_crawl_benchmark(tmp_path):
+    archive = make_large_drs_tree(str(tmp_path))
+
+    start = time.perf_counter()
+    expected = _dir_entry(archive, 'root')
+    recursive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mtimes = dict()
+    assert _crawl(archive, 'root', threads=16, shard_depth=2, mtimes=mtimes) == expected
+    parallel_time = time.perf_counter() - start
+
+    print("crawled {} directories: recursive {:.2f}s, parallel {:.2f}s, speedup {:.2f}x".format(
+        len(mtimes), recursive_time, parallel_time, recursive_time / parallel_time))
+
+
+def test_query_cache(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path), models=('MODEL-A', 'MODEL-B'))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+
+    finder = DataFinder()
+    calls = []
+    find = finder._find_model_experiment_ensemble
+    monkeypatch.setattr(finder, '_find_model_experiment_ensemble',
+                        lambda index, **kwargs: calls.append(kwargs) or find(index, **kwargs))
+
+    models, _, _ = finder.get_model_experiment_ensemble(required_variables=['pr', 'tas'])
+    models.append('modified by caller')
+    models, _, _ = finder.get_model_experiment_ensemble(required_variables=['tas', 'pr', 'tas'])
+    assert sorted(models) == ['MODEL-A', 'MODEL-B']
+    assert len(calls) == 1
+
+    finder.get_model_experiment_ensemble(required_variables=['pr', 'tas'], exclude_historical=True)
+    assert len(calls) == 2
+
+    # new data invalidates the cache
+    make_drs_tree(archive, models=('MODEL-C', ))
+    finder.refresh()
+    models, _, _ = finder.get_model_experiment_ensemble(required_variables=['pr', 'tas'])
+    assert sorted(models) == ['MODEL-A', 'MODEL-B', 'MODEL-C']
+    assert len(calls) == 3
+
+
+@pytest.mark.slow
+def test_query_cache_process_construction(tmp_path, monkeypatch):
+    from c3s_magic_wps.processes import processes
+
+    archive = make_large_drs_tree(str(tmp_path),
+                                  variables=['pr', 'tas', 'tasmax', 'tasmin', 'psl', 'zg', 'ta', 'ua', 'va', 'ts'])
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+
+    def construct_processes(finder):
+        monkeypatch.setattr(DataFinder, 'get_instance', staticmethod(lambda: finder))
+        start = time.perf_counter()
+        for process in processes:
+            process.process_class()
+        return time.perf_counter() - start
+
+    uncached = DataFinder()
+    monkeypatch.setattr(uncached, 'get_model_experiment_ensemble',
+                        lambda **kwargs: uncached._find_model_experiment_ensemble(uncached.index, **kwargs))
+    uncached_time = construct_processes(uncached)
+
+    cached = DataFinder()
+    cached_time = construct_processes(cached)
+
+    print("constructed {} processes asking {} distinct queries: uncached {:.3f}s, cached {:.3f}s".format(
+        len(processes), len(cached._snapshot.query_cache), uncached_time, cached_time))
+    assert len(cached._snapshot.query_cache) < len(processes)
+
+
+def _has_children(a_dict):
+    return len(a_dict.get('contents', [])) != 0
+
+
+def legacy_pruned_tree(data, required_variables=[], required_frequency='mon'):
+    """The original deepcopy and remove implementation of DataFinder.get_pruned_tree, as reference."""
+    result = copy.deepcopy(data)
+
+    for organization in _get_children_of(result):
+        for model in _get_children_of(organization):
+            for experiment in _get_children_of(model):
+                for frequency in _get_children_of(experiment):
+                    if frequency['name'] == required_frequency:
+                        for mip in _get_children_of(frequency):
+                            for realm in _get_children_of(mip):
+                                for ensemble in _get_children_of(realm):
+                                    available_variables = [variable['name'] for variable in _get_children_of(ensemble)]
+                                    if not all(required_variable in available_variables
+                                               for required_variable in required_variables):
+                                        realm['contents'].remove(ensemble)
+                                    else:
+                                        del ensemble['contents']
+                                if not _has_children(realm):
+                                    mip['contents'].remove(realm)
+                            if not _has_children(mip):
+                                frequency['contents'].remove(mip)
+                        if not _has_children(frequency):
+                            experiment['contents'].remove(frequency)
+                    else:
+                        experiment['contents'].remove(frequency)
+                if not _has_children(experiment):
+                    model['contents'].remove(experiment)
+            if not _has_children(model):
+                organization['contents'].remove(model)
+        if not _has_children(organization):
+            result['contents'].remove(organization)
+    return result
+
+
+def test_pruned_tree(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path), organizations=('ORG-A', 'ORG-B'), models=('MODEL-A', 'MODEL-B'),
+                            experiments=('historical', 'rcp85'))
+    make_drs_tree(archive, models=('MODEL-C', ), frequencies=('mon', 'day'), variables=('pr', 'tasmax'))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+
+    finder = DataFinder()
+    data = copy.deepcopy(finder.data)
+
+    for required_variables in (['pr'], ['pr', 'tas'], ['tasmax'], ['unknown']):
+        for required_frequency in ('mon', 'day'):
+            assert finder.get_pruned_tree(required_variables, required_frequency) == legacy_pruned_tree(
+                finder.data, required_variables, required_frequency)
+
+    # the tree of the finder is left untouched
+    assert finder.data == data
+
+
+@pytest.mark.slow
+def test_pruned_tree_benchmark(tmp_path, monkeypatch):
+    archive = make_large_drs_tree(str(tmp_path))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+    finder = DataFinder()
+
+    def measure(function):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function(finder.data, ['var0', 'var1'], 'mon')
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, duration, peak
+
+    legacy, legacy_time, legacy_peak = measure(legacy_pruned_tree)
+    pruned, pruned_time, pruned_peak = measure(
+        lambda data, variables, frequency: finder.get_pruned_tree(variables, frequency))
+
+    print("pruned tree of {} directories: deepcopy {:.3f}s / {:.1f}MB, builder {:.3f}s / {:.1f}MB".format(
+        len(finder.mtimes), legacy_time, legacy_peak / 2**20, pruned_time, pruned_peak / 2**20))
+    assert pruned == legacy
+
+
+def test_background_refresh(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path), models=('MODEL-A', ))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+
+    finder = DataFinder()
+    data, index, generation = finder.data, finder.index, finder.generation
+    finder.start_refresher()
+
+    make_drs_tree(archive, models=('MODEL-B', ))
+    finder.request_refresh()
+
+    deadline = time.time() + 10
+    while finder.generation == generation and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert finder.generation == generation + 1
+    assert finder.data == _dir_entry(archive, 'root')
+    assert sorted(finder.get_model_experiment_ensemble()[0]) == ['MODEL-A', 'MODEL-B']
+    # the previous snapshot is left intact for readers that still use it
+    assert index.facet_values('model', index.find_groups()) == {'MODEL-A'}
+    assert len(data['contents'][0]['contents']) == 1
+
+
+def test_cache_file(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path / 'cmip5'))
+    cache_file = str(tmp_path / 'cache' / 'cmip5.json')
+    os.makedirs(os.path.dirname(cache_file))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.setenv('CMIP_META_CACHE_FILE', cache_file)
+
+    data = DataFinder().data
+    with open(cache_file) as read_file:
+        cached = json.load(read_file)
+    assert cached['version'] == data_finder.CACHE_VERSION
+    assert cached['archive_base'] == archive
+    # only the cache and its lock file, no temporary files left behind
+    assert sorted(os.listdir(os.path.dirname(cache_file))) == ['cmip5.json', 'cmip5.json.lock']
+
+    crawls = []
+    crawl = data_finder._crawl
+    monkeypatch.setattr(data_finder, '_crawl', lambda *args, **kwargs: crawls.append(args) or crawl(*args, **kwargs))
+
+    assert DataFinder().data == data
+    assert len(crawls) == 0
+
+    # caches of another archive, another version or truncated caches are rebuilt
+    for content in (dict(cached, archive_base='/other/cmip5'), dict(cached, version=1), cached['data'], None):
+        with open(cache_file, 'w') as write_file:
+            write_file.write(json.dumps(content)[:-1] if content is None else json.dumps(content))
+        assert DataFinder().data == data
+    assert len(crawls) == 4
+
+
+def _start_finder(crawl_log):
+    crawl = data_finder._crawl
+
+    def logged_crawl(*args, **kwargs):
+        with open(crawl_log, 'a') as log:
+            log.write('crawl\n')
+        time.sleep(0.2)
+        return crawl(*args, **kwargs)
+
+    data_finder._crawl = logged_crawl
+    DataFinder()
+
+
+def test_cache_file_single_crawl(tmp_path, monkeypatch):
+    monkeypatch.setenv('CMIP_DATA_ROOT', make_drs_tree(str(tmp_path / 'cmip5')))
+    monkeypatch.setenv('CMIP_META_CACHE_FILE', str(tmp_path / 'cmip5.json'))
+    crawl_log = str(tmp_path / 'crawls.log')
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_start_finder, args=(crawl_log, )) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    with open(crawl_log) as log:
+        assert len(log.readlines()) == 1
+
+
+def test_binary_cache_file(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path / 'cmip5'), models=('MODEL-A', 'MODEL-B'), experiments=('historical', 'rcp85'))
+    make_drs_tree(archive, models=('MODEL-C', ), frequencies=('day', ), variables=('tasmax', ))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.setenv('CMIP_META_CACHE_FILE', str(tmp_path / 'cmip5.idx'))
+    monkeypatch.setenv('CMIP_META_CACHE_FORMAT', 'binary')
+
+    scanned = DataFinder()
+    loaded = DataFinder()
+    assert loaded.index.variable_code.obj is not None  # columns are views on the mapped file
+
+    for required_variables, exclude_historical in ((['pr', 'tas'], False), (['pr'], True), ([], False)):
+        assert loaded.get_model_experiment_ensemble(required_variables, 'mon', exclude_historical) == \
+            scanned.get_model_experiment_ensemble(required_variables, 'mon', exclude_historical)
+    assert loaded.get_pruned_tree(['tasmax'], 'day') == scanned.get_pruned_tree(['tasmax'], 'day')
+    assert loaded.data == scanned.data
+    assert loaded.mtimes == scanned.mtimes
+
+    # a json cache is not mistaken for a binary cache
+    monkeypatch.setenv('CMIP_META_CACHE_FORMAT', 'json')
+    assert DataFinder().data == scanned.data
+    monkeypatch.setenv('CMIP_META_CACHE_FORMAT', 'binary')
+    assert DataFinder().data == scanned.data
+
+
+@pytest.mark.slow
+def test_binary_cache_file_benchmark(tmp_path, monkeypatch):
+    archive = make_large_drs_tree(str(tmp_path / 'cmip5'))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+
+    load_times = dict()
+    for cache_format in ('json', 'binary'):
+        monkeypatch.setenv('CMIP_META_CACHE_FILE', str(tmp_path / ('cache.' + cache_format)))
+        monkeypatch.setenv('CMIP_META_CACHE_FORMAT', cache_format)
+        DataFinder()
+
+        start = time.perf_counter()
+        finder = DataFinder()
+        finder.get_model_experiment_ensemble(['var0', 'var1'])
+        load_times[cache_format] = time.perf_counter() - start
+
+    print("loaded cache of {} directories and queried: json {:.3f}s ({:.1f}MB), binary {:.3f}s ({:.1f}MB)".format(
+        len(finder.mtimes), load_times['json'], os.path.getsize(str(tmp_path / 'cache.json')) / 2**20,
+        load_times['binary'], os.path.getsize(str(tmp_path / 'cache.binary')) / 2**20))
+
+
+def test_get_instance_in_thread(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path), models=('MODEL-A', ))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+    monkeypatch.setenv('CMIP_META_REFRESH_SIGNAL', 'SIGUSR2')
+    monkeypatch.setattr(DataFinder, '_DataFinder__instance', None)
+    handler = signal.getsignal(signal.SIGUSR2)
+
+    # the lazily registered processes create the instance in the thread of their first request
+    instances = []
+    thread = threading.Thread(target=lambda: instances.append(DataFinder.get_instance()))
+    thread.start()
+    thread.join()
+
+    assert len(instances) == 1
+    assert instances[0]._refresher is not None
+    assert signal.getsignal(signal.SIGUSR2) == handler
+    assert DataFinder.get_instance() is instances[0]
+
+
+def test_after_fork_follows_cache(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path / 'cmip5'), models=('MODEL-A', ))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.setenv('CMIP_META_CACHE_FILE', str(tmp_path / 'cmip5.json'))
+    monkeypatch.setenv('CMIP_META_REFRESH_INTERVAL', '3600')
+    monkeypatch.delenv('CMIP_META_REFRESH_SIGNAL', raising=False)
+    monkeypatch.setattr(data_finder, 'FOLLOW_INTERVAL', 0.05)
+    monkeypatch.setattr(DataFinder, '_DataFinder__instance', None)
+
+    # the instance of the master, as inherited by a forked worker
+    master = DataFinder.get_instance()
+    worker = DataFinder()
+    worker._refresher, worker._refresher_args = master._refresher, master._refresher_args
+    monkeypatch.setattr(DataFinder, '_DataFinder__instance', worker)
+    monkeypatch.setattr(worker, '_rescan', lambda: pytest.fail('the worker scanned the archive'))
+    generation = worker.generation
+    DataFinder.after_fork()
+    assert worker._refresher.name == 'DataFinderFollower'
+
+    make_drs_tree(archive, models=('MODEL-B', ))
+    master.refresh()
+
+    deadline = time.time() + 10
+    while worker.generation == generation and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(worker.get_model_experiment_ensemble()[0]) == ['MODEL-A', 'MODEL-B']
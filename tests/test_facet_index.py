@@ -0,0 +1,41 @@
+from c3s_magic_wps.processes.utils.data_finder import _dir_entry
+from c3s_magic_wps.processes.utils.facet_index import FacetIndex
+
+from .common import make_drs_tree
+
+
+def make_index(tmp_path):
+    archive = str(tmp_path)
+    make_drs_tree(archive, models=('MODEL-A', 'MODEL-B'), experiments=('historical', 'rcp85'))
+    make_drs_tree(archive, models=('MODEL-C', ), experiments=('rcp45', ), variables=('pr', ))
+    make_drs_tree(archive, models=('MODEL-D', ), frequencies=('day', ), ensembles=('r2i1p1', ),
+                  variables=('tas', 'tasmax'))
+    return FacetIndex.from_tree(_dir_entry(archive, 'root'))
+
+
+def test_from_tree(tmp_path):
+    index = make_index(tmp_path)
+
+    assert index.group_count() == 6
+    assert len(index) == 11
+    assert sorted(index.values['variable']) == ['pr', 'tas', 'tasmax']
+    assert {index.group_path(group)[1] for group in range(index.group_count())} == {
+        'MODEL-A', 'MODEL-B', 'MODEL-C', 'MODEL-D'}
+
+
+def test_find_groups(tmp_path):
+    index = make_index(tmp_path)
+
+    groups = index.find_groups(required_variables=['pr', 'tas'], required_frequency='mon')
+    assert index.facet_values('model', groups) == {'MODEL-A', 'MODEL-B'}
+    assert index.facet_values('experiment', groups) == {'historical', 'rcp85'}
+
+    groups = index.find_groups(required_variables=['pr'], required_frequency='mon', exclude_historical=True)
+    assert index.facet_values('model', groups) == {'MODEL-A', 'MODEL-B', 'MODEL-C'}
+    assert index.facet_values('experiment', groups) == {'rcp45', 'rcp85'}
+
+    groups = index.find_groups(required_frequency='day')
+    assert index.facet_values('ensemble', groups) == {'r2i1p1'}
+
+    assert index.find_groups(required_variables=['pr', 'unknown']) == set()
+    assert index.find_groups(required_frequency='6hr') == set()
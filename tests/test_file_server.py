@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from c3s_magic_wps.file_server import FileServer
+
+DATA = bytes(range(256)) * 40
+
+
+def _not_found(environ, start_response):
+    return Response('not found', status=404)(environ, start_response)
+
+
+@pytest.fixture
+def client(tmp_path):
+    outputs = tmp_path / 'outputs' / 'b2d6ec5e'
+    outputs.mkdir(parents=True)
+    (outputs / 'tas.nc').write_bytes(DATA)
+    return Client(FileServer(_not_found, {'/outputs': str(tmp_path / 'outputs')}), Response)
+
+
+def test_get(client):
+    response = client.get('/outputs/b2d6ec5e/tas.nc')
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Content-Type'] == 'application/x-netcdf'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    assert client.head('/outputs/b2d6ec5e/tas.nc').headers['Content-Length'] == str(len(DATA))
+    assert client.get('/outputs/b2d6ec5e/missing.nc').status_code == 404
+    assert client.get('/outputs/../outputs/b2d6ec5e/tas.nc').status_code == 404
+
+
+def test_conditional_get(client):
+    response = client.get('/outputs/b2d6ec5e/tas.nc')
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+
+    assert client.get('/outputs/b2d6ec5e/tas.nc', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/outputs/b2d6ec5e/tas.nc', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get('/outputs/b2d6ec5e/tas.nc', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_range(client):
+    response = client.get('/outputs/b2d6ec5e/tas.nc', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == DATA[100:200]
+    assert response.headers['Content-Range'] == 'bytes 100-199/{}'.format(len(DATA))
+
+    assert client.get('/outputs/b2d6ec5e/tas.nc', headers={'Range': 'bytes=-10'}).data == DATA[-10:]
+    assert client.get('/outputs/b2d6ec5e/tas.nc', headers={'Range': 'bytes=100000-'}).status_code == 416
+
+    # the file changed since the first part was downloaded
+    response = client.get('/outputs/b2d6ec5e/tas.nc', headers={'Range': 'bytes=100-', 'If-Range': '"other"'})
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_file_wrapper(client):
+    offsets = []
+
+    def file_wrapper(filelike, block_size):
+        # where a server with sendfile would start sending
+        offsets.append(os.lseek(filelike.fileno(), 0, os.SEEK_CUR))
+        return iter(lambda: filelike.read(block_size), b'')
+
+    response = client.get('/outputs/b2d6ec5e/tas.nc', headers={'Range': 'bytes=0-999'},
+                          environ_overrides={'wsgi.file_wrapper': file_wrapper})
+    assert response.data == DATA[:1000]
+    assert offsets == [0]
+
+    response = client.get('/outputs/b2d6ec5e/tas.nc', headers={'Range': 'bytes=1000-1999'},
+                          environ_overrides={'wsgi.file_wrapper': file_wrapper})
+    assert response.data == DATA[1000:2000]
@@ -0,0 +1,29 @@
+import os
+import sys
+import time
+
+from c3s_magic_wps import isolation
+
+
+def _cfg(tmp_path):
+    run_dir = str(tmp_path / 'output' / 'recipe_20190101_120000' / 'run')
+    return {'run_dir': run_dir, 'preproc_dir': run_dir, 'log_level': 'info'}
+
+
+def test_run_in_subprocess_failure(tmp_path):
+    success, exception = isolation.run_in_subprocess(str(tmp_path / 'missing_recipe.yml'), _cfg(tmp_path))
+    assert not success
+    assert exception
+
+
+def test_run_in_subprocess_wall_time(tmp_path, monkeypatch):
+    hanging = tmp_path / 'hanging'
+    hanging.write_text('#!/bin/sh\nsleep 60\n')
+    os.chmod(str(hanging), 0o755)
+    monkeypatch.setattr(sys, 'executable', str(hanging))
+
+    start = time.time()
+    success, exception = isolation.run_in_subprocess('recipe.yml', _cfg(tmp_path), wall_time=0.5)
+    assert not success
+    assert 'wall time' in exception
+    assert time.time() - start < 10
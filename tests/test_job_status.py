@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+
+import pytest
+
+from pywps import configuration
+from pywps.response.status import WPS_STATUS
+from pywps.tests import assert_response_success
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from c3s_magic_wps import job_status
+from c3s_magic_wps.processes.registry import LazyProcess, LazyService
+from c3s_magic_wps.processes.wps_sleep import Sleep
+
+from .common import client_for
+
+
+class FakeProcess():
+    identifier = 'toymodel'
+
+
+class FakeResponse():
+    """The part of pywps.response.execute.ExecuteResponse used to publish the status"""
+
+    def __init__(self):
+        self.uuid = 'b2d6ec5e'
+        self.process = FakeProcess()
+        self._update_status(WPS_STATUS.STARTED, 'PyWPS Process started', 0)
+
+    def _update_status(self, status, message, status_percentage, clean=True):
+        self.status = status
+        self.message = message
+        self.status_percentage = status_percentage
+
+    def update_status(self, message, status_percentage=None):
+        self._update_status(self.status, message, status_percentage, False)
+
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    values = {('status', 'socket_dir'): str(tmp_path / 'status')}
+    original = configuration.get_config_value
+    monkeypatch.setattr(configuration, 'get_config_value',
+                        lambda section, option: values.get((section, option), original(section, option)))
+    monkeypatch.setattr(job_status, '_table', None)
+    return job_status.get_job_table()
+
+
+def _wait_for(table, job_id, version):
+    job = table.get(job_id, version - 1, timeout=5)
+    assert job is not None and job['version'] == version
+    return job
+
+
+def test_track(table):
+    response = FakeResponse()
+    job_status.track(response)
+    assert _wait_for(table, 'b2d6ec5e', 1)['status'] == 'started'
+
+    response.update_status("running diagnostic (this could take a while)...", 20)
+    job = _wait_for(table, 'b2d6ec5e', 2)
+    assert job['process'] == 'toymodel'
+    assert job['percent'] == 20
+    assert job['message'] == "running diagnostic (this could take a while)..."
+
+    response._update_status(WPS_STATUS.SUCCEEDED, 'PyWPS Process Toymodel finished', 100)
+    assert _wait_for(table, 'b2d6ec5e', 3)['status'] == 'succeeded'
+
+
+def test_long_poll(table):
+    response = FakeResponse()
+    job_status.track(response)
+    _wait_for(table, 'b2d6ec5e', 1)
+    client = Client(job_status.JobStatusMiddleware(lambda environ, start_response: []), Response)
+
+    assert client.get('/jobs/unknown').status_code == 404
+    assert json.loads(client.get('/jobs/b2d6ec5e').data)['version'] == 1
+
+    def update():
+        time.sleep(0.5)
+        response.update_status("collecting output ...", 80)
+
+    threading.Thread(target=update).start()
+    start = time.time()
+    job = json.loads(client.get('/jobs/b2d6ec5e?since=1&wait=10').data)
+    assert job['version'] == 2 and job['percent'] == 80
+    assert time.time() - start < 5
+
+
+def test_max_waiters(table):
+    response = FakeResponse()
+    job_status.track(response)
+    _wait_for(table, 'b2d6ec5e', 1)
+    client = Client(job_status.JobStatusMiddleware(lambda environ, start_response: [], max_waiters=1), Response)
+
+    waiting = threading.Thread(target=lambda: client.get('/jobs/b2d6ec5e?since=1&wait=10'))
+    waiting.start()
+    time.sleep(0.2)
+    refused = client.get('/jobs/b2d6ec5e?since=1&wait=10')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == str(job_status.RETRY_AFTER)
+    assert client.get('/jobs/b2d6ec5e/events').status_code == 503
+    # requests that do not wait are always answered
+    assert client.get('/jobs/b2d6ec5e').status_code == 200
+
+    response.update_status("collecting output ...", 80)
+    waiting.join(5)
+    assert not waiting.is_alive()
+    assert json.loads(client.get('/jobs/b2d6ec5e?since=1&wait=10').data)['version'] == 2
+
+
+def test_socket_dir(monkeypatch):
+    values = {('server', 'outputpath'): '/srv/first/outputs'}
+    monkeypatch.setattr(configuration, 'get_config_value', lambda section, option: values.get((section, option), ''))
+    first = job_status.socket_dir()
+    values[('server', 'outputpath')] = '/srv/second/outputs'
+    # instances of the service run by the same user do not see each other's jobs
+    assert job_status.socket_dir() != first
+    values[('status', 'socket_dir')] = '/run/c3s_magic_wps/status'
+    assert job_status.socket_dir() == '/run/c3s_magic_wps/status'
+
+
+def test_events(table):
+    response = FakeResponse()
+    job_status.track(response)
+    response.update_status("collecting output ...", 80)
+    response._update_status(WPS_STATUS.SUCCEEDED, 'PyWPS Process Toymodel finished', 100)
+    _wait_for(table, 'b2d6ec5e', 3)
+
+    client = Client(job_status.JobStatusMiddleware(lambda environ, start_response: []), Response)
+    events = client.get('/jobs/b2d6ec5e/events', headers={'Last-Event-ID': '1'})
+    assert events.headers['Content-Type'] == 'text/event-stream'
+    # the stream ends with the final status
+    assert events.data.decode('utf-8').split('\n\n')[0].startswith('id: 3\ndata: ')
+
+
+def test_execute(table):
+    client = client_for(LazyService(processes=[LazyProcess(Sleep)]))
+    resp = client.get(service='WPS', request='Execute', version='1.0.0', identifier='sleep', datainputs='delay=0.01')
+    assert_response_success(resp)
+
+    deadline = time.time() + 5
+    while not any(job['status'] == 'succeeded' for job in table._jobs.values()) and time.time() < deadline:
+        time.sleep(0.1)
+    jobs = list(table._jobs.values())
+    assert len(jobs) == 1
+    assert jobs[0]['process'] == 'sleep'
+    assert jobs[0]['status'] == 'succeeded'
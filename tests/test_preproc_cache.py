@@ -0,0 +1,168 @@
+import os
+import threading
+
+from c3s_magic_wps import preproc_cache
+from c3s_magic_wps.preproc_cache import PreprocCache
+
+
+class FakeProduct():
+    def __init__(self, preproc_dir, dataset, input_file, diagnostic='diag'):
+        self.filename = os.path.join(preproc_dir, diagnostic, 'tas', 'CMIP5_{}_Amon_tas.nc'.format(dataset))
+        self.files = [input_file]
+        self.attributes = {
+            'project': 'CMIP5', 'dataset': dataset, 'exp': 'historical', 'ensemble': 'r1i1p1', 'short_name': 'tas',
+            'mip': 'Amon', 'start_year': 2000, 'end_year': 2005, 'diagnostic': diagnostic, 'filename': self.filename,
+        }
+        self.settings = {
+            'load': {'callback': _callback},
+            'fix_file': {'project': 'CMIP5', 'dataset': dataset,
+                         'output_dir': os.path.join(preproc_dir, diagnostic, 'tas', 'fixed_files')},
+            'extract_time': {'start_year': 2000, 'end_year': 2005},
+            'regrid': {'target_grid': '2.5x2.5', 'scheme': 'linear_extrapolate'},
+            'save': {'compress': False, 'filename': self.filename},
+            'cleanup': {'remove': [os.path.join(preproc_dir, diagnostic, 'tas', 'fixed_files')]},
+        }
+
+
+def _callback(cube, field, filename):
+    pass
+
+
+class FakeTask():
+    runs = 0
+
+    def __init__(self, products):
+        self.products = set(products)
+        self.write_ncl_interface = False
+
+    def _run(self, input_files):
+        FakeTask.runs += 1
+        for product in self.products:
+            os.makedirs(os.path.dirname(product.filename), exist_ok=True)
+            with open(product.filename, 'w') as fp:
+                fp.write('preprocessed ' + os.path.basename(product.filename))
+        return ['metadata.yml']
+
+
+def _write_metadata(products, write_ncl_interface):
+    return ['restored metadata.yml']
+
+
+def _make_task(tmp_path, run, datasets=('MODEL-A', 'MODEL-B'), diagnostic='diag'):
+    inputs = tmp_path / 'inputs'
+    inputs.mkdir(exist_ok=True)
+    products = []
+    for dataset in datasets:
+        input_file = inputs / '{}.nc'.format(dataset)
+        if not input_file.exists():
+            input_file.write_text('raw')
+        products.append(FakeProduct(str(tmp_path / run / 'preproc'), dataset, str(input_file), diagnostic))
+    return FakeTask(products)
+
+
+def test_preproc_cache(tmp_path):
+    cache = PreprocCache(str(tmp_path / 'cache'))
+    FakeTask.runs = 0
+
+    task = _make_task(tmp_path, 'first')
+    preproc_cache.install(cache, str(tmp_path / 'first' / 'preproc'), FakeTask, _write_metadata)
+    assert task._run([]) == ['metadata.yml']
+
+    # identical task of another run is restored from the cache
+    task = _make_task(tmp_path, 'second')
+    preproc_cache.install(cache, str(tmp_path / 'second' / 'preproc'), FakeTask, _write_metadata)
+    assert task._run([]) == ['restored metadata.yml']
+    assert FakeTask.runs == 1
+    for product in task.products:
+        with open(product.filename) as fp:
+            assert fp.read() == 'preprocessed ' + os.path.basename(product.filename)
+
+    # other years
+    task = _make_task(tmp_path, 'third')
+    for product in task.products:
+        product.settings['extract_time']['end_year'] = 2010
+    preproc_cache.install(cache, str(tmp_path / 'third' / 'preproc'), FakeTask, _write_metadata)
+    task._run([])
+    assert FakeTask.runs == 2
+
+    # bypassed
+    task = _make_task(tmp_path, 'fourth')
+    preproc_cache.install(None, str(tmp_path / 'fourth' / 'preproc'), FakeTask, _write_metadata)
+    task._run([])
+    assert FakeTask.runs == 3
+
+
+def test_preproc_cache_other_diagnostic(tmp_path):
+    cache = PreprocCache(str(tmp_path / 'cache'))
+    FakeTask.runs = 0
+
+    task = _make_task(tmp_path, 'first')
+    preproc_cache.install(cache, str(tmp_path / 'first' / 'preproc'), FakeTask, _write_metadata)
+    task._run([])
+
+    # one of the datasets for a diagnostic of another recipe
+    task = _make_task(tmp_path, 'second', datasets=('MODEL-A', ), diagnostic='other_diag')
+    preproc_cache.install(cache, str(tmp_path / 'second' / 'preproc'), FakeTask, _write_metadata)
+    assert task._run([]) == ['restored metadata.yml']
+    assert FakeTask.runs == 1
+    product, = task.products
+    with open(product.filename) as fp:
+        assert fp.read() == 'preprocessed CMIP5_MODEL-A_Amon_tas.nc'
+
+    # a dataset that is not cached yet, the task runs and stores it
+    task = _make_task(tmp_path, 'third', datasets=('MODEL-A', 'MODEL-C'))
+    preproc_cache.install(cache, str(tmp_path / 'third' / 'preproc'), FakeTask, _write_metadata)
+    assert task._run([]) == ['metadata.yml']
+    assert FakeTask.runs == 2
+    assert len(os.listdir(cache.directory)) == 3
+
+
+def test_preproc_cache_key(tmp_path):
+    cache = PreprocCache(str(tmp_path / 'cache'))
+    task = _make_task(tmp_path, 'run')
+    preproc_dir = str(tmp_path / 'run' / 'preproc')
+    keys = cache.task_keys(task.products, preproc_dir)
+    assert len(set(keys)) == 2
+
+    # modified input data of one of the datasets
+    product = sorted(task.products, key=lambda product: product.filename)[0]
+    os.utime(product.files[0], ns=(0, 0))
+    modified = cache.task_keys(task.products, preproc_dir)
+    assert modified[0] != keys[0]
+    assert modified[1] == keys[1]
+
+    product.settings['multi_model_statistics'] = {'span': 'overlap', 'statistics': ['mean']}
+    assert cache.key(product, preproc_dir) is None
+    assert cache.task_keys(task.products, preproc_dir) is None
+
+
+def test_preproc_cache_concurrent_runs(tmp_path):
+    cache = PreprocCache(str(tmp_path / 'cache'))
+    FakeTask.runs = 0
+
+    # a run with the cache and a run bypassing it installed in threads of the same process
+    cached = _make_task(tmp_path, 'cached')
+    bypassed = _make_task(tmp_path, 'bypassed')
+    threads = [
+        threading.Thread(target=preproc_cache.install,
+                         args=(cache, str(tmp_path / 'cached' / 'preproc'), FakeTask, _write_metadata)),
+        threading.Thread(target=preproc_cache.install,
+                         args=(None, str(tmp_path / 'bypassed' / 'preproc'), FakeTask, _write_metadata)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cached._run([])
+    bypassed._run([])
+    assert FakeTask.runs == 2
+    # only the run using the cache stored its products, from its own preproc dir
+    assert len(os.listdir(cache.directory)) == 2
+    assert _make_task(tmp_path, 'cached')._run([]) == ['restored metadata.yml']
+    assert _make_task(tmp_path, 'bypassed')._run([]) == ['metadata.yml']
+    assert FakeTask.runs == 3
+
+    preproc_cache.uninstall(str(tmp_path / 'cached' / 'preproc'))
+    _make_task(tmp_path, 'cached')._run([])
+    assert FakeTask.runs == 4
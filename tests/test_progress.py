@@ -0,0 +1,71 @@
+import time
+
+from c3s_magic_wps import progress
+from c3s_magic_wps.progress import ProgressBridge
+
+LOG = """\
+2019-06-20 10:00:00,000 UTC [100] INFO    Creating preprocessor task diag/tas
+2019-06-20 10:00:00,100 UTC [100] INFO    Creating diagnostic task diag/script
+2019-06-20 10:00:01,000 UTC [100] INFO    Running 2 tasks using 2 processes
+2019-06-20 10:00:01,100 UTC [101] INFO    Starting task diag/tas in process [101]
+2019-06-20 10:00:05,000 UTC [101] INFO    Successfully completed task diag/tas (priority 0) in 0:00:03.9
+2019-06-20 10:00:05,200 UTC [101] INFO    Starting task diag/script in process [101]
+"""
+
+
+class FakeResponse():
+    def __init__(self):
+        self.updates = []
+
+    def update_status(self, message, status_percentage=None):
+        self.updates.append((message, status_percentage))
+
+
+def test_feed():
+    bridge = ProgressBridge('main_log.txt', FakeResponse())
+    lines = LOG.splitlines()
+    assert bridge.feed(lines[0])
+    assert not bridge.feed('2019-06-20 10:00:00,050 UTC [100] INFO    Writing program log files to:')
+    assert bridge.percent() == 20
+
+    for line in lines[1:4]:
+        bridge.feed(line)
+    assert bridge.message == "preprocessing diag/tas, 0 of 2 tasks done"
+    assert bridge.percent() == 35
+
+    for line in lines[4:]:
+        bridge.feed(line)
+    assert bridge.message == "running diagnostic script diag/script, 1 of 2 tasks done"
+    assert bridge.percent() == 65
+
+
+def test_report_throttled():
+    response = FakeResponse()
+    bridge = ProgressBridge('main_log.txt', response, interval=60)
+    assert not bridge.report()
+
+    lines = LOG.splitlines()
+    bridge.feed(lines[0])
+    assert bridge.report()
+    for line in lines[1:]:
+        bridge.feed(line)
+    assert not bridge.report()
+    assert response.updates == [("preparing preprocessor task diag/tas", 20)]
+
+
+def test_follow(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress, 'POLL_INTERVAL', 0.05)
+    response = FakeResponse()
+    log_file = tmp_path / 'main_log.txt'
+    with progress.bridge(str(tmp_path), response) as bridge:
+        bridge.interval = 0
+        time.sleep(0.2)
+        with log_file.open('w') as fp:
+            fp.write(LOG)
+            # a line that is not complete yet
+            fp.write('2019-06-20 10:00:09,000 UTC [101] INFO    Successfully completed task diag/scr')
+        time.sleep(0.2)
+        assert response.updates[-1] == ("running diagnostic script diag/script, 1 of 2 tasks done", 65)
+        with log_file.open('a') as fp:
+            fp.write('ipt (priority 1) in 0:00:04\n')
+    assert response.updates[-1] == ("2 of 2 tasks done", 80)
@@ -0,0 +1,107 @@
+import os
+import time
+
+from c3s_magic_wps.processes.utils import DataFinder
+from c3s_magic_wps.result_cache import ResultCache
+
+from .common import make_drs_tree
+
+RECIPE = """
+datasets:
+  - {dataset: MODEL-A, project: CMIP5, exp: historical, ensemble: r1i1p1}
+  - {dataset: ERA-Interim, project: OBS, tier: 3}
+"""
+
+
+def _make_run(workdir, recipe=RECIPE):
+    output_dir = os.path.join(workdir, 'output')
+    run_output = os.path.join(output_dir, 'recipe_20190101_120000')
+    for subdir in ('run', 'plots', 'work'):
+        os.makedirs(os.path.join(run_output, subdir))
+    with open(os.path.join(run_output, 'plots', 'plot.png'), 'wb') as fp:
+        fp.write(b'\0' * 1000)
+
+    recipe_file = os.path.join(workdir, 'recipe.yml')
+    with open(recipe_file, 'w') as fp:
+        fp.write(recipe)
+    config_file = os.path.join(workdir, 'config.yml')
+    with open(config_file, 'w') as fp:
+        fp.write('output_dir: {}\n'.format(output_dir))
+
+    result = {
+        'success': True,
+        'exception': None,
+        'logfile': os.path.join(run_output, 'run', 'main_log.txt'),
+        'debug_logfile': os.path.join(run_output, 'run', 'main_log_debug.txt'),
+        'plot_dir': os.path.join(run_output, 'plots'),
+        'work_dir': os.path.join(run_output, 'work'),
+        'run_dir': os.path.join(run_output, 'run'),
+    }
+    return recipe_file, config_file, output_dir, result
+
+
+def _use_finder(tmp_path, monkeypatch):
+    archive = make_drs_tree(str(tmp_path / 'cmip5'), models=('MODEL-A', 'MODEL-B'))
+    monkeypatch.setenv('CMIP_DATA_ROOT', archive)
+    monkeypatch.delenv('CMIP_META_CACHE_FILE', raising=False)
+    finder = DataFinder()
+    monkeypatch.setattr(DataFinder, 'get_instance', staticmethod(lambda: finder))
+    return archive, finder
+
+
+def test_store_restore(tmp_path, monkeypatch):
+    _use_finder(tmp_path, monkeypatch)
+    cache = ResultCache(str(tmp_path / 'cache'))
+
+    recipe_file, config_file, output_dir, result = _make_run(str(tmp_path / 'first'))
+    key = cache.key(recipe_file, config_file, output_dir, skip_nonexistent=False)
+    cache.store(key, output_dir, result)
+
+    # same recipe in another working directory
+    recipe_file, config_file, output_dir, _ = _make_run(str(tmp_path / 'second'))
+    os.rename(output_dir, output_dir + '.unused')
+    assert cache.key(recipe_file, config_file, output_dir, skip_nonexistent=False) == key
+    assert cache.key(recipe_file, config_file, output_dir, skip_nonexistent=True) != key
+
+    restored = cache.restore(key, output_dir)
+    assert restored['success']
+    assert restored['plot_dir'] == os.path.join(output_dir, 'recipe_20190101_120000', 'plots')
+    assert os.path.isfile(os.path.join(restored['plot_dir'], 'plot.png'))
+
+    assert cache.restore('0' * 64, str(tmp_path / 'missing')) is None
+
+
+def test_key_changes_with_data(tmp_path, monkeypatch):
+    archive, finder = _use_finder(tmp_path, monkeypatch)
+    cache = ResultCache(str(tmp_path / 'cache'))
+    recipe_file, config_file, output_dir, _ = _make_run(str(tmp_path / 'run'))
+    key = cache.key(recipe_file, config_file, output_dir)
+
+    # data of a model the recipe does not use
+    make_drs_tree(archive, models=('MODEL-B', ), variables=('psl', ))
+    finder.refresh()
+    assert cache.key(recipe_file, config_file, output_dir) == key
+
+    make_drs_tree(archive, models=('MODEL-A', ), variables=('tas', ), version='v20130101')
+    finder.refresh()
+    new_key = cache.key(recipe_file, config_file, output_dir)
+    assert new_key != key
+
+    # without a refresh of the scanned archive
+    make_drs_tree(archive, models=('MODEL-A', ), variables=('tas', ), version='v20140101')
+    assert cache.key(recipe_file, config_file, output_dir) != new_key
+
+
+def test_evict_least_recently_used(tmp_path, monkeypatch):
+    _use_finder(tmp_path, monkeypatch)
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=3000)
+
+    for name in ('a', 'b', 'c'):
+        _, _, output_dir, result = _make_run(str(tmp_path / name))
+        cache.store(name * 64, output_dir, result)
+        # mtimes of the entries need to differ
+        time.sleep(0.01)
+        if name == 'b':
+            assert cache.restore('a' * 64, str(tmp_path / 'restored'))
+
+    assert sorted(os.listdir(str(tmp_path / 'cache'))) == ['a' * 64, 'c' * 64]
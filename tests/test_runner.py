@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from pywps import configuration
+
+from c3s_magic_wps import runner
+
+
+@pytest.fixture
+def config(monkeypatch):
+    values = {('server', 'parallelprocesses'): '2'}
+    original = configuration.get_config_value
+    monkeypatch.setattr(configuration, 'get_config_value',
+                        lambda section, option: values.get((section, option), original(section, option)))
+    return values
+
+
+def test_max_parallel_tasks(config, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 16)
+    assert runner.max_parallel_tasks() == 8
+    assert runner.max_parallel_tasks(hint=4) == 4
+
+    config['esmvaltool', 'max_parallel_tasks'] = '6'
+    assert runner.max_parallel_tasks() == 3
+
+    # never oversubscribed, but every run gets a task
+    config['server', 'parallelprocesses'] = '10'
+    assert runner.max_parallel_tasks() == 1
+
+
+def test_max_parallel_tasks_scheduler(config, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 16)
+    # many accepted requests, of which the scheduler runs a few at once
+    config['server', 'parallelprocesses'] = '20'
+    config['scheduler', 'database'] = 'scheduler.sqlite'
+    assert runner.max_parallel_tasks() == 8
+    config['scheduler', 'slots'] = '4'
+    assert runner.max_parallel_tasks() == 4
+
+
+def test_generate_recipe_parallel_tasks(config, tmp_path):
+    config['esmvaltool', 'max_parallel_tasks'] = '8'
+    recipe_file, config_file = runner.generate_recipe('cvdp', workdir=str(tmp_path), parallel_tasks_hint=3)
+    with open(config_file) as fp:
+        assert 'max_parallel_tasks: 3\n' in fp.read()
+
+
+def test_get_output(tmp_path):
+    script_dir = tmp_path / 'plots' / 'hyint' / 'main'
+    script_dir.mkdir(parents=True)
+    for name in ('hyint_EC-EARTH_1976_2005_map.png', 'hyint_EC-EARTH_comp_map.png', 'hyint_EC-EARTH_comp_map.pdf',
+                 '.hidden_map.png'):
+        (script_dir / name).write_text(name)
+    plot_dir = str(tmp_path / 'plots')
+
+    assert runner.get_output(plot_dir, os.path.join('hyint', 'main'), '*comp_map',
+                             'png') == str(script_dir / 'hyint_EC-EARTH_comp_map.png')
+    # several matches, the first in sorted order
+    assert runner.get_output(plot_dir, os.path.join('hyint', 'main'), '*map',
+                             'png') == str(script_dir / 'hyint_EC-EARTH_1976_2005_map.png')
+    assert runner.get_output(plot_dir, os.path.join('hyint', '*'), '*comp_map',
+                             'pdf') == str(script_dir / 'hyint_EC-EARTH_comp_map.pdf')
+    # without provenance records the outputs are matched by name only
+    assert runner.get_output(plot_dir, os.path.join('hyint', 'main'), '*comp_map', 'png',
+                             projects='c3s-magic') == str(script_dir / 'hyint_EC-EARTH_comp_map.png')
+    with pytest.raises(Exception):
+        runner.get_output(plot_dir, os.path.join('hyint', 'main'), '*trend', 'png')
+
+    # written after the directory was indexed
+    (script_dir / 'hyint_EC-EARTH_trend.png').write_text('trend')
+    assert runner.get_output(plot_dir, os.path.join('hyint', 'main'), '*trend',
+                             'png') == str(script_dir / 'hyint_EC-EARTH_trend.png')
+
+
+def test_get_output_provenance(tmp_path):
+    plot_dir = tmp_path / 'recipe_20190101_120000' / 'plots'
+    script_dir = plot_dir / 'ensclus' / 'main'
+    script_dir.mkdir(parents=True)
+    for name in ('ens_anomalies_tas.png', 'ens_anomalies_tas_cluster.png', 'ens_climatologies_tas.png'):
+        (script_dir / name).write_text(name)
+
+    # written by a run that was moved into this directory by the result cache
+    recorded_output_dir = '/cache/recipe_20180101_000000'
+    script_run_dir = tmp_path / 'recipe_20190101_120000' / 'run' / 'ensclus' / 'main'
+    script_run_dir.mkdir(parents=True)
+    (script_run_dir / 'settings.yml').write_text('run_dir: {}/run/ensclus/main\n'.format(recorded_output_dir))
+    (script_run_dir / 'diagnostic_provenance.yml').write_text("""
+{0}/plots/ensclus/main/ens_anomalies_tas.png:
+  caption: Ensemble anomalies
+  plot_type: [geo, map]
+{0}/plots/ensclus/main/ens_anomalies_tas_cluster.png:
+  caption: Clustered ensemble anomalies
+  plot_type: [geo]
+  projects: [c3s-magic]
+""".format(recorded_output_dir))
+
+    path_filter = os.path.join('ensclus', 'main')
+    assert runner.get_output(str(plot_dir), path_filter, 'ens_anomalies*', 'png',
+                             plot_type='map') == str(script_dir / 'ens_anomalies_tas.png')
+    cluster_plot = runner.get_output(str(plot_dir), path_filter, output_format='png',
+                                     caption='Clustered ensemble anomalies')
+    assert cluster_plot == str(script_dir / 'ens_anomalies_tas_cluster.png')
+    assert runner.get_output(str(plot_dir), path_filter, 'ens_anomalies*', 'png',
+                             projects='c3s-magic') == cluster_plot
+    with pytest.raises(Exception):
+        runner.get_output(str(plot_dir), path_filter, output_format='png', plot_type='times')
+    # not in the records of the script
+    assert runner.get_output(str(plot_dir), path_filter, 'ens_climatologies*',
+                             'png') == str(script_dir / 'ens_climatologies_tas.png')
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from pywps.app.exceptions import ProcessError
+
+from c3s_magic_wps.scheduler import DEFAULT_RUNTIME, Scheduler
+
+
+def _record_runtime(scheduler, identifier, runtime):
+    scheduler._remove(scheduler._enqueue(identifier), identifier, runtime)
+
+
+def test_expected_runtime(tmp_path):
+    scheduler = Scheduler(str(tmp_path / 'scheduler.sqlite'))
+    assert scheduler.expected_runtime('toymodel') == DEFAULT_RUNTIME
+
+    _record_runtime(scheduler, 'toymodel', 30)
+    assert scheduler.expected_runtime('toymodel') == 30
+    _record_runtime(scheduler, 'toymodel', 40)
+    assert 30 < scheduler.expected_runtime('toymodel') < 40
+
+    # unknown diagnostics are expected to take as long as the average known one
+    _record_runtime(scheduler, 'perfmetrics', 1200)
+    assert 600 < scheduler.expected_runtime('cvdp') < 700
+
+
+def test_shortest_job_first(tmp_path):
+    scheduler = Scheduler(str(tmp_path / 'scheduler.sqlite'), slots=1, poll_interval=0.01)
+    _record_runtime(scheduler, 'perfmetrics', 1200)
+    _record_runtime(scheduler, 'toymodel', 30)
+
+    order = []
+    running = threading.Event()
+    release = threading.Event()
+
+    def first():
+        with scheduler.slot('perfmetrics'):
+            running.set()
+            release.wait()
+
+    def queued(identifier):
+        with scheduler.slot(identifier):
+            order.append(identifier)
+
+    threads = [threading.Thread(target=first)]
+    threads[0].start()
+    running.wait()
+    for identifier in ('perfmetrics', 'toymodel'):
+        threads.append(threading.Thread(target=queued, args=(identifier, )))
+        threads[-1].start()
+        time.sleep(0.1)
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert order == ['toymodel', 'perfmetrics']
+
+
+def test_admission_control(tmp_path):
+    scheduler = Scheduler(str(tmp_path / 'scheduler.sqlite'), slots=1, max_wait=60)
+    _record_runtime(scheduler, 'perfmetrics', 1200)
+
+    with scheduler.slot('perfmetrics'):
+        with pytest.raises(ProcessError):
+            with scheduler.slot('perfmetrics'):
+                pass
+
+    # a free slot again
+    with scheduler.slot('perfmetrics'):
+        pass
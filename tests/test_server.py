@@ -0,0 +1,97 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+import pytest
+
+from c3s_magic_wps.processes.registry import LazyProcess, LazyService
+from c3s_magic_wps.processes.wps_ensclus import EnsClus
+
+pytest.importorskip('gunicorn')
+
+from c3s_magic_wps.server import preload  # noqa: E402
+
+REQUESTS = (
+    'service=WPS&request=GetCapabilities&version=1.0.0',
+    'service=WPS&request=DescribeProcess&version=1.0.0&identifier=ensclus',
+)
+
+
+def test_preload():
+    process = LazyProcess(EnsClus)
+    preload(LazyService(processes=[process]))
+    assert process.is_materialized()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start(tmp_path, *options):
+    port = _free_port()
+    workdir = tmp_path / str(port)
+    workdir.mkdir()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    server = subprocess.Popen([sys.executable, '-m', 'c3s_magic_wps.cli', '--port', str(port), *options],
+                              cwd=str(workdir), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:{}/wps?'.format(port)
+    deadline = time.time() + 120
+    while True:
+        try:
+            urlopen(url + REQUESTS[0]).read()
+            return server, url
+        except OSError:
+            if time.time() > deadline or server.poll() is not None:
+                server.kill()
+                raise
+            time.sleep(0.5)
+
+
+def _requests_per_second(url, clients=8, duration=10):
+    counts = [0] * clients
+    errors = []
+    deadline = time.time() + duration
+
+    def client(number):
+        while time.time() < deadline:
+            try:
+                urlopen(url + REQUESTS[counts[number] % len(REQUESTS)]).read()
+                counts[number] += 1
+            except OSError as err:
+                errors.append(err)
+
+    threads = [threading.Thread(target=client, args=(number, )) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return sum(counts) / duration
+
+
+@pytest.mark.slow
+def test_server_benchmark(tmp_path):
+    results = dict()
+    servers = {
+        'simple': (),
+        'prefork': ('--server', 'prefork', '--workers', str(os.cpu_count()), '--threads', '4'),
+    }
+    for name, options in servers.items():
+        server, url = _start(tmp_path, *options)
+        try:
+            # the first DescribeProcess constructs the process
+            urlopen(url + REQUESTS[1]).read()
+            results[name] = _requests_per_second(url)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print("GetCapabilities/DescribeProcess requests per second on {} CPUs: run_simple {:.1f}, prefork {:.1f}".format(
+        os.cpu_count(), results['simple'], results['prefork']))
+    assert results['prefork'] > 0
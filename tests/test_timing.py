@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from pywps import configuration
+
+from c3s_magic_wps import runner, timing
+from c3s_magic_wps.timing import TimingStore
+
+LOG = """\
+2019-06-20 10:00:00,000 UTC [100] INFO    Creating preprocessor task diag/tas
+2019-06-20 10:00:00,100 UTC [100] INFO    Creating diagnostic task diag/script
+2019-06-20 10:00:01,100 UTC [101] INFO    Starting task diag/tas in process [101]
+2019-06-20 10:00:05,000 UTC [101] INFO    Successfully completed task diag/tas (priority 0) in 0:00:03.900000
+2019-06-20 10:00:05,200 UTC [101] INFO    Starting task diag/script in process [101]
+2019-06-20 10:01:07,200 UTC [101] INFO    Successfully completed task diag/script (priority 1) in 0:01:02
+"""
+
+
+class FakeProcess():
+    identifier = 'toymodel'
+
+
+class FakeResponse():
+    uuid = 'b2d6ec5e'
+    process = FakeProcess()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = str(tmp_path / 'timing.sqlite')
+    original = configuration.get_config_value
+    monkeypatch.setattr(configuration, 'get_config_value', lambda section, option: database
+                        if (section, option) == ('timing', 'database') else original(section, option))
+    return database
+
+
+def test_timed(tmp_path, database):
+    log_file = str(tmp_path / 'main_log.txt')
+    with open(log_file, 'w') as fp:
+        fp.write(LOG)
+
+    def handler(request, response):
+        recipe_file, config_file = runner.generate_recipe(diag='toymodel', workdir=str(tmp_path))
+        timing.record_tasks(log_file)
+        with open(os.path.join(str(tmp_path), 'output.nc'), 'wb') as fp:
+            fp.write(b'\0' * 100000)
+        for _ in range(2):
+            runner.get_output(str(tmp_path), path_filter='', name_filter='output', output_format='nc')
+        return response
+
+    timing.timed(handler)(None, FakeResponse())
+    assert timing.current() is None
+
+    rows = TimingStore(database).summary()
+    assert [row['stage'] for row in rows] == [
+        'total', 'generate_recipe', 'run.diagnostic_tasks', 'run.preprocessor_tasks', 'get_outputs']
+    stages = {row['stage']: row for row in rows}
+    assert stages['run.preprocessor_tasks']['duration'] == pytest.approx(3.9)
+    assert stages['run.diagnostic_tasks']['duration'] == pytest.approx(62)
+    assert stages['total']['bytes_written'] >= 100000
+    assert stages['total']['peak_rss'] > 0
+    assert stages['generate_recipe']['duration'] <= stages['total']['duration']
+
+
+def test_failed_job(database):
+    def handler(request, response):
+        raise Exception('esmvaltool failed!')
+
+    with pytest.raises(Exception):
+        timing.timed(handler)(None, FakeResponse())
+    # only successful jobs are summarized
+    assert TimingStore(database).summary() == []
+    assert timing.current() is None
+
+
+def test_untraced(tmp_path):
+    recipe_file, _ = runner.generate_recipe(diag='toymodel', workdir=str(tmp_path))
+    assert os.path.isfile(recipe_file)
+
+
+def test_archive_stages(tmp_path, database):
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    (output_dir / 'output.nc').write_bytes(b'\0' * 100000)
+
+    def handler(request, response):
+        runner.compress_output(str(output_dir), str(tmp_path / 'result.zip'))
+
+    timing.timed(handler)(None, FakeResponse())
+    # a lazy archive is created when it is downloaded, after the job finished
+    with timing.deferred_stage(FakeResponse.uuid, 'archive.materialize'):
+        pass
+
+    rows = TimingStore(database).summary()
+    assert [(row['identifier'], row['stage']) for row in rows] == [
+        ('toymodel', 'total'), ('toymodel', 'compress_output'), ('toymodel', 'archive.materialize')]
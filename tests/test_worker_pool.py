@@ -0,0 +1,130 @@
+import os
+import resource
+import subprocess
+import threading
+import time
+
+from pywps import configuration
+
+from c3s_magic_wps import worker_pool
+from c3s_magic_wps.worker_pool import PoolServer
+
+
+def _pid_job(value):
+    return value, os.getpid()
+
+
+def _crashing_job():
+    os._exit(3)
+
+
+def _sleeping_job(seconds):
+    time.sleep(seconds)
+    return True, None
+
+
+def _worker_settings():
+    return (configuration.get_config_value('esmvaltool', 'memory_limit'), resource.getrlimit(resource.RLIMIT_AS)[0],
+            resource.getrlimit(resource.RLIMIT_CPU)[0])
+
+
+def test_worker_pool_recycles_workers(tmp_path):
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, max_jobs=2, job=_pid_job)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = [worker_pool.submit(number, address=address) for number in range(3)]
+    finally:
+        server.close()
+
+    assert [value for value, pid in results] == [0, 1, 2]
+    pids = [pid for value, pid in results]
+    assert pids[0] == pids[1] != pids[2]
+    assert os.getpid() not in pids
+
+
+def test_worker_pool_crashed_worker(tmp_path):
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, max_jobs=2, job=_crashing_job)
+    try:
+        success, exception = server.run()
+        assert not success
+        assert 'exited with code 3' in exception
+    finally:
+        server.close()
+
+
+def test_worker_pool_worker_exited_before_start(tmp_path, monkeypatch):
+    collect_results = PoolServer._collect_results
+
+    def delayed_collect_results(self):
+        # the crashed worker is reaped before the start of its job is collected
+        time.sleep(2)
+        collect_results(self)
+
+    monkeypatch.setattr(PoolServer, '_collect_results', delayed_collect_results)
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, job=_crashing_job)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(server.run()), daemon=True)
+    try:
+        thread.start()
+        thread.join(20)
+    finally:
+        server.close()
+
+    assert not thread.is_alive()
+    success, exception = results[0]
+    assert not success
+    assert 'exited with code 3' in exception
+
+
+def test_worker_pool_config_and_limits(tmp_path):
+    config_file = tmp_path / 'pool.cfg'
+    config_file.write_text('[esmvaltool]\nmemory_limit = 4gb\n')
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, job=_worker_settings, config_file=str(config_file),
+                        limits={'memory': 4 * 1024**3, 'cpu_time': 3600})
+    try:
+        memory_limit, address_space, cpu_time = server.run()
+    finally:
+        server.close()
+
+    # the workers use the configuration of the service, not the defaults
+    assert memory_limit == '4gb'
+    assert address_space == 4 * 1024**3
+    assert 3600 <= cpu_time < 3700
+
+
+def test_worker_pool_wall_time(tmp_path):
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, job=_sleeping_job, limits={'wall_time': 1})
+    try:
+        assert server.run(0) == (True, None)
+        success, exception = server.run(60)
+        assert not success
+        assert 'wall time limit' in exception
+    finally:
+        server.close()
+
+
+def test_worker_pool_stop(tmp_path):
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, job=_pid_job)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    assert worker_pool.stop_server(address)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert not worker_pool.stop_server(address)
+
+
+def test_worker_pool_service_exited(tmp_path):
+    service = subprocess.Popen(['true'])
+    service.wait()
+    address = str(tmp_path / 'pool.sock')
+    server = PoolServer(address, workers=1, job=_pid_job, service_pid=service.pid)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
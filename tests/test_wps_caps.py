@@ -3,6 +3,8 @@ from pywps.tests import assert_response_success
 
 from .common import client_for
 from c3s_magic_wps.processes import processes
+from c3s_magic_wps.processes.registry import LazyProcess, LazyService
+from c3s_magic_wps.processes.wps_ensclus import EnsClus
 
 
 def test_wps_caps():
@@ -43,3 +45,18 @@ def test_wps_caps():
     print(sorted(names.split()))
     print(expected_caps)
     assert sorted(names.split()) == expected_caps
+
+
+def test_wps_caps_lazy():
+    process = LazyProcess(EnsClus)
+    client = client_for(LazyService(processes=[process]))
+
+    resp = client.get(service='wps', request='getcapabilities', version='1.0.0')
+    assert resp.xpath_text('/wps:Capabilities/wps:ProcessOfferings/wps:Process/ows:Identifier') == 'ensclus'
+    assert not process.is_materialized()
+
+    resp = client.get(service='wps', request='describeprocess', identifier='ensclus', version='1.0.0')
+    assert process.is_materialized()
+    allowed_models = resp.xpath_text('/wps:ProcessDescriptions/ProcessDescription/DataInputs/Input'
+                                     '[ows:Identifier="model"]/LiteralData/ows:AllowedValues/ows:Value')
+    assert allowed_models.split() == [value.value for value in EnsClus().inputs[0].allowed_values]
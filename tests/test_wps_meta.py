@@ -0,0 +1,31 @@
+import json
+
+from pywps import Service
+from pywps.tests import assert_response_success
+
+from .common import client_for, get_output
+from c3s_magic_wps.processes.wps_meta import Meta
+
+
+def test_wps_meta():
+    client = client_for(Service(processes=[Meta()]))
+    resp = client.get(service='WPS', request='Execute', version='1.0.0', identifier='meta')
+    assert_response_success(resp)
+    output = get_output(resp.xml)
+    assert json.loads(output['drs'])['name'] == 'root'
+
+    # revalidate with the returned etag
+    resp = client.get(service='WPS', request='Execute', version='1.0.0', identifier='meta',
+                      datainputs='etag={}'.format(output['etag']))
+    assert_response_success(resp)
+    revalidated = get_output(resp.xml)
+    assert revalidated['etag'] == output['etag']
+    assert json.loads(revalidated['drs']) is None
+
+
+def test_wps_meta_process():
+    client = client_for(Service(processes=[Meta()]))
+    resp = client.get(service='WPS', request='Execute', version='1.0.0', identifier='meta',
+                      datainputs='process=ensclus')
+    assert_response_success(resp)
+    assert json.loads(get_output(resp.xml)['drs'])['name'] == 'root'